@@ -11,11 +11,13 @@ Bundesland TEXT,
 Abgabe TEXT
 );
 
+-- Clustered on the natural key: rows of one station are stored contiguously
+-- in date order, so "station X between A and B" is a single range scan.
+-- Dates are stored as ISO 'YYYY-MM-DD' text.
 CREATE TABLE IF NOT EXISTS Measurement
 (
-m_ID INTEGER PRIMARY KEY,
-Station_ID INTEGER,
-MESS_DATUM DATE,
+Station_ID INTEGER NOT NULL,
+MESS_DATUM DATE NOT NULL,
 QN_3 INTEGER,
 FX REAL,
 FM REAL,
@@ -32,5 +34,101 @@ UPM REAL,
 TXK REAL,
 TNK REAL,
 TGK REAL,
+PRIMARY KEY (Station_ID, MESS_DATUM),
 FOREIGN KEY (Station_ID) REFERENCES Station(Station_ID)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS IngestionManifest
+(
+archive_name TEXT PRIMARY KEY,
+size INTEGER,
+content_hash TEXT,
+rows INTEGER,
+imported_at TEXT
+);
+
+-- Last day imported per station from the historical and the recent archives
+-- (see Database.update_station_state). A refresh from the recent archives only
+-- imports days after both, so historical data always takes precedence.
+CREATE TABLE IF NOT EXISTS StationIngestState
+(
+Station_ID INTEGER PRIMARY KEY,
+historical_end TEXT,
+recent_end TEXT,
+updated_at TEXT
+);
+
+-- Geocoding results keyed by normalized address; NULL coordinates cache a failed lookup
+CREATE TABLE IF NOT EXISTS GeocodeCache
+(
+address_key TEXT PRIMARY KEY,
+latitude REAL,
+longitude REAL,
+cached_at REAL
 );
+
+-- Per station and month/year aggregates of Measurement, maintained by the import
+-- (see Database.refresh_rollups). period is 'YYYY-MM' resp. 'YYYY'. Means are sum / count.
+CREATE TABLE IF NOT EXISTS MonthlyRollup
+(
+Station_ID INTEGER NOT NULL,
+period TEXT NOT NULL,
+days INTEGER,
+TMK_sum REAL,
+TMK_count INTEGER,
+TMK_min REAL,
+TMK_max REAL,
+TXK_sum REAL,
+TXK_count INTEGER,
+TXK_min REAL,
+TXK_max REAL,
+TNK_sum REAL,
+TNK_count INTEGER,
+TNK_min REAL,
+TNK_max REAL,
+RSK_sum REAL,
+RSK_count INTEGER,
+RSK_min REAL,
+RSK_max REAL,
+SDK_sum REAL,
+SDK_count INTEGER,
+SDK_min REAL,
+SDK_max REAL,
+FX_sum REAL,
+FX_count INTEGER,
+FX_min REAL,
+FX_max REAL,
+PRIMARY KEY (Station_ID, period)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS YearlyRollup
+(
+Station_ID INTEGER NOT NULL,
+period TEXT NOT NULL,
+days INTEGER,
+TMK_sum REAL,
+TMK_count INTEGER,
+TMK_min REAL,
+TMK_max REAL,
+TXK_sum REAL,
+TXK_count INTEGER,
+TXK_min REAL,
+TXK_max REAL,
+TNK_sum REAL,
+TNK_count INTEGER,
+TNK_min REAL,
+TNK_max REAL,
+RSK_sum REAL,
+RSK_count INTEGER,
+RSK_min REAL,
+RSK_max REAL,
+SDK_sum REAL,
+SDK_count INTEGER,
+SDK_min REAL,
+SDK_max REAL,
+FX_sum REAL,
+FX_count INTEGER,
+FX_min REAL,
+FX_max REAL,
+PRIMARY KEY (Station_ID, period)
+) WITHOUT ROWID;
@@ -1,11 +1,79 @@
-from geopy.geocoders import Nominatim
-from geopy.distance import geodesic
-from data_ingestion.database import Database
+import logging
+from datetime import date, timedelta
+from data_ingestion.database import Database, ROLLUP_COLUMNS, to_iso_date
+from backend.spatial import StationIndex
+from backend.geocache import GeocodeCache
+from data_ingestion.metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+
+class _LazyNominatim:
+    """Creates the Nominatim client, and imports geopy, on the first geocode call."""
+    def __init__(self, user_agent):
+        self.user_agent = user_agent
+        self._client = None
+
+    def geocode(self, address):
+        if self._client is None:
+            from geopy.geocoders import Nominatim
+            self._client = Nominatim(user_agent=self.user_agent)
+        return self._client.geocode(address)
+
 
 class Analysis:
-    def __init__(self, db: Database):
+    def __init__(self, db: Database, geolocator=None, geocode_cache_size=4096):
+        """
+        :param db: The connected project database.
+        :param geolocator: Geocoder with a geopy-style geocode(address) method.
+                           Defaults to Nominatim, limited to one request per second and
+                           only created when an address has to be geocoded.
+        :param geocode_cache_size: Number of addresses kept in the in-process geocode cache.
+        """
         self.db = db
-        self.geolocator = Nominatim(user_agent="wetterprojekt")
+        if geolocator is None:
+            self.geolocator = _LazyNominatim(user_agent="wetterprojekt")
+            min_interval = 1.0  # Nominatim usage policy
+        else:
+            self.geolocator = geolocator
+            min_interval = 0.0
+        self.geocoder = GeocodeCache(self.geolocator, db, max_entries=geocode_cache_size,
+                                     min_interval=min_interval)
+        self._station_index = None
+        self._station_index_version = None
+        # Station metadata written through this connection (e.g. renamed stations) rebuilds the index
+        db.add_station_listener(self.invalidate_station_index)
+
+    def station_index(self) -> StationIndex:
+        """
+        Returns the spatial index over all stations. It is built once and
+        rebuilt only when the Station table has changed since.
+        """
+        version = self.db.get_stations_version()
+        if self._station_index is None or version != self._station_index_version:
+            with METRICS.timer("station_index_build_seconds"):
+                self._station_index = StationIndex(self.db.get_all_stations())
+            self._station_index_version = version
+        return self._station_index
+
+    def invalidate_station_index(self, station_ids=None):
+        """Forces the station index to be rebuilt on next use. Also registered as station listener."""
+        self._station_index = None
+
+    def _geocode(self, address):
+        """Geocodes an address through the cache, returning (latitude, longitude) or None."""
+        coords = self.geocoder.geocode(address)
+        if coords is None:
+            logger.warning("Could not geocode address '%s'.", address)
+        return coords
+
+    def geocode_many(self, addresses):
+        """
+        Geocodes many addresses at once; only cache misses reach the geocoder.
+
+        :return: A dict mapping each address to (latitude, longitude) or None.
+        """
+        return self.geocoder.geocode_many(addresses)
 
     def find_nearest_stations(self, address: str, num_stations: int = 5):
         """
@@ -15,28 +83,101 @@ class Analysis:
         :param num_stations: The number of nearest stations to return.
         :return: A list of tuples containing (station_id, name, distance_km).
         """
-        try:
-            location = self.geolocator.geocode(address)
-            if not location:
-                print(f"Error: Could not geocode address '{address}'.")
+        with METRICS.timer("query_seconds", query="nearest"):
+            target_coords = self._geocode(address)
+            if target_coords is None:
                 return []
-        except Exception as e:
-            print(f"An error occurred during geocoding: {e}")
+            return self.station_index().nearest(*target_coords, k=num_stations)
+
+    def find_stations_within(self, address: str, radius_km: float):
+        """
+        Find all weather stations within a radius around a given address.
+
+        :param address: The address to geocode.
+        :param radius_km: The search radius in kilometers.
+        :return: A list of tuples containing (station_id, name, distance_km), nearest first.
+        """
+        target_coords = self._geocode(address)
+        if target_coords is None:
             return []
+        return self.station_index().within(*target_coords, radius_km)
+
+    def get_period_statistics(self, station_ids, start, end, columns=('TMK',)):
+        """
+        Computes mean, sum, min, max and count of measurement columns per
+        station over a date range.
 
-        target_coords = (location.latitude, location.longitude)
-        all_stations = self.db.get_all_stations()
+        The range is split into whole years, whole months and remaining
+        days. Each part is answered by the coarsest source that covers it:
+        YearlyRollup, MonthlyRollup or the raw Measurement rows. If the
+        database does not maintain its rollups (Database.maintain_rollups),
+        they may be empty or stale and the whole range is aggregated from
+        the Measurement rows.
 
-        stations_with_distance = []
-        for station in all_stations:
-            station_id, lat, lon, name = station
-            if lat is None or lon is None:
-                continue
-            station_coords = (lat, lon)
-            distance = geodesic(target_coords, station_coords).kilometers
-            stations_with_distance.append((station_id, name, distance))
+        :param station_ids: The stations to evaluate.
+        :param start: First day as date, 'YYYYMMDD' or 'YYYY-MM-DD'.
+        :param end: Last day (inclusive), same formats as start.
+        :param columns: Columns to evaluate, see ROLLUP_COLUMNS.
+        :return: A dict mapping station ID to {column: {'mean', 'sum', 'min', 'max', 'count'}}
+                 plus the number of days with data under 'days'.
+        """
+        unknown = [col for col in columns if col not in ROLLUP_COLUMNS]
+        if unknown:
+            raise ValueError(f"Columns without rollups: {unknown}")
+        with METRICS.timer("query_seconds", query="period_statistics"):
+            return self._period_statistics(list(station_ids), start, end, columns)
 
-        # Sort stations by distance
-        stations_with_distance.sort(key=lambda x: x[2])
+    def _period_statistics(self, station_ids, start, end, columns):
+        start = date.fromisoformat(to_iso_date(start))
+        end = date.fromisoformat(to_iso_date(end))
+        if self.db.maintain_rollups:
+            day_ranges, months, years = self._split_period(start, end)
+            parts = [self.db.get_rollup_aggregates(station_ids, 'year', years, columns),
+                     self.db.get_rollup_aggregates(station_ids, 'month', months, columns)]
+        else:
+            day_ranges, parts = [(start, end)], []
+        parts += [self.db.get_measurement_aggregates(station_ids, first, last, columns)
+                  for first, last in day_ranges]
 
-        return stations_with_distance[:num_stations]
\ No newline at end of file
+        statistics = {}
+        for station_id in station_ids:
+            rows = [part[station_id] for part in parts if station_id in part]
+            if not rows:
+                continue
+            result = {'days': sum(row[0] for row in rows)}
+            for i, col in enumerate(columns):
+                sums, counts, mins, maxs = (
+                    [row[1 + 4 * i + j] for row in rows if row[1 + 4 * i + j] is not None] for j in range(4)
+                )
+                total, count = sum(sums), sum(counts)
+                result[col] = {
+                    'mean': total / count if count else None,
+                    'sum': total if count else None,
+                    'min': min(mins) if mins else None,
+                    'max': max(maxs) if maxs else None,
+                    'count': count,
+                }
+            statistics[station_id] = result
+        return statistics
+
+    @staticmethod
+    def _split_period(start, end):
+        """
+        Splits [start, end] into day ranges, whole months ('YYYY-MM') and
+        whole years ('YYYY').
+        """
+        day_ranges, months, years = [], [], []
+        current = start
+        while current <= end:
+            next_month = (current.replace(day=28) + timedelta(days=4)).replace(day=1)
+            if current.month == 1 and current.day == 1 and date(current.year, 12, 31) <= end:
+                years.append(f"{current.year:04d}")
+                current = date(current.year + 1, 1, 1)
+            elif current.day == 1 and next_month - timedelta(days=1) <= end:
+                months.append(f"{current:%Y-%m}")
+                current = next_month
+            else:
+                last = min(end, next_month - timedelta(days=1))
+                day_ranges.append((current, last))
+                current = last + timedelta(days=1)
+        return day_ranges, months, years
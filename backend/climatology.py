@@ -0,0 +1,157 @@
+import numpy as np
+import pandas as pd
+from data_ingestion.database import Database
+from data_ingestion.metrics import METRICS
+
+# Columns aggregated per month or year as totals (precipitation, sunshine); all others are averaged
+SUM_COLUMNS = ('RSK', 'SDK')
+
+# DWD quality levels (QN) used by default: everything beyond the formal checks of levels 1 and 2
+QUALITY_LEVELS = (3, 5, 7, 8, 9, 10)
+
+# Indices counted by Climatology.threshold_days: name -> (column, operator, value)
+CLIMATE_INDICES = {
+    'frost_days': ('TNK', '<', 0.0),
+    'ice_days': ('TXK', '<', 0.0),
+    'summer_days': ('TXK', '>=', 25.0),
+    'hot_days': ('TXK', '>=', 30.0),
+    'tropical_nights': ('TNK', '>=', 20.0),
+    'heavy_rain_days': ('RSK', '>=', 10.0),
+}
+
+
+class Climatology:
+    """
+    Climatologies, anomalies and threshold indices for many stations at once.
+
+    Every method runs one grouped SQL aggregate over all requested stations
+    (Database.get_grouped_aggregates), so only one row per station and
+    period leaves SQLite, and shapes the result with vectorized pandas
+    operations. A monthly or yearly value is NaN unless at least
+    `min_coverage` of its days have a value; a climatology is NaN unless
+    that share of its years has a value.
+    """
+    def __init__(self, db: Database, min_coverage=0.8, quality_levels=QUALITY_LEVELS):
+        """
+        :param db: The connected project database.
+        :param min_coverage: Share of days (and years) with data required for a value.
+        :param quality_levels: Only measurements whose QN_3/QN_4 flag is one of these levels are used.
+                               Defaults to QUALITY_LEVELS, which drops data that passed only formal
+                               checks; None uses every measurement regardless of its flag.
+        """
+        self.db = db
+        self.min_coverage = min_coverage
+        self.quality_levels = quality_levels
+
+    def period_values(self, station_ids=None, first_year=1961, last_year=1990, columns=('TMK',), freq='month'):
+        """
+        Monthly or yearly values per station: totals for SUM_COLUMNS, means otherwise.
+
+        :param station_ids: The stations to evaluate, None for all stations.
+        :param freq: 'month' (periods 'YYYY-MM') or 'year' (periods 'YYYY').
+        :return: A DataFrame indexed by (Station_ID, period) with one column per measurement column.
+        """
+        if freq not in ('month', 'year'):
+            raise ValueError(f"Unknown frequency '{freq}'. Expected 'month' or 'year'.")
+        with METRICS.timer("query_seconds", query="period_values"):
+            frame = self._aggregate(station_ids, first_year, last_year, freq, columns)
+            return self._values(frame, columns, self._expected_days(frame, freq, first_year, last_year),
+                                totals=True)
+
+    def climatology(self, station_ids=None, first_year=1961, last_year=1990, columns=('TMK',), freq='month'):
+        """
+        Long-term means over a reference period.
+
+        :param freq: 'day' for the mean of every calendar day (index level 'day' as 'MM-DD'),
+                     'month' for the mean monthly value of every calendar month (level 'month' 1-12),
+                     'year' for the mean yearly value.
+        :return: A DataFrame indexed by Station_ID plus 'day' or 'month', one column per measurement column.
+        """
+        with METRICS.timer("query_seconds", query="climatology"):
+            if freq == 'day':
+                frame = self._aggregate(station_ids, first_year, last_year, 'day_of_year', columns)
+                values = self._values(frame, columns, self._expected_days(frame, 'day_of_year', first_year, last_year),
+                                      totals=False)
+                return values.rename_axis(['Station_ID', 'day'])
+
+            values = self.period_values(station_ids, first_year, last_year, columns, freq)
+            keys = [values.index.get_level_values('Station_ID')]
+            if freq == 'month':
+                keys.append(pd.Index(values.index.get_level_values('period').str[5:7].astype(int), name='month'))
+            years_per_key = (last_year - first_year + 1)
+            grouped = values.groupby(keys)
+            return grouped.mean().where(grouped.count() >= self.min_coverage * years_per_key)
+
+    def anomalies(self, station_ids=None, first_year=1991, last_year=2020, reference=(1961, 1990),
+                  columns=('TMK',), freq='month'):
+        """
+        Deviations of monthly or yearly values from the climatology of a reference period.
+
+        :param reference: (first_year, last_year) of the reference period.
+        :param freq: 'month' compares every month with its calendar month, 'year' every year with the mean year.
+        :return: A DataFrame indexed by (Station_ID, period), one column per measurement column.
+        """
+        values = self.period_values(station_ids, first_year, last_year, columns, freq)
+        normals = self.climatology(station_ids, reference[0], reference[1], columns, freq)
+        stations = values.index.get_level_values('Station_ID')
+        if freq == 'month':
+            months = values.index.get_level_values('period').str[5:7].astype(int)
+            keys = pd.MultiIndex.from_arrays([stations, months])
+        else:
+            keys = stations
+        return values - normals.reindex(keys).to_numpy()
+
+    def threshold_days(self, station_ids=None, first_year=1961, last_year=1990, indices=None, freq='year'):
+        """
+        Counts days meeting threshold conditions, e.g. frost days (TNK < 0 °C).
+
+        :param indices: Dict name -> (column, operator, value), defaults to CLIMATE_INDICES.
+        :param freq: 'month' or 'year'.
+        :return: A DataFrame indexed by (Station_ID, period) with one count per index, NaN where the
+                 column of the index does not reach the coverage.
+        """
+        if freq not in ('month', 'year'):
+            raise ValueError(f"Unknown frequency '{freq}'. Expected 'month' or 'year'.")
+        indices = CLIMATE_INDICES if indices is None else indices
+        columns = tuple(dict.fromkeys(column for column, _, _ in indices.values()))
+        with METRICS.timer("query_seconds", query="threshold_days"):
+            frame = self._aggregate(station_ids, first_year, last_year, freq, columns, indices)
+            expected = self._expected_days(frame, freq, first_year, last_year)
+            counts = {}
+            for name, (column, _, _) in indices.items():
+                covered = frame[f"{column}_count"] >= self.min_coverage * expected
+                counts[name] = frame[name].fillna(0).where(covered)
+            return pd.DataFrame(counts, index=frame.index)
+
+    def _aggregate(self, station_ids, first_year, last_year, group_by, columns, indices=None):
+        """Runs the grouped aggregate and returns it as DataFrame indexed by (Station_ID, period)."""
+        if station_ids is None:
+            station_ids = [row[0] for row in self.db.get_all_stations()]
+        indices = indices or {}
+        rows = self.db.get_grouped_aggregates(station_ids, f"{first_year:04d}-01-01", f"{last_year:04d}-12-31",
+                                              group_by, columns, list(indices.values()), self.quality_levels)
+        names = ['Station_ID', 'period'] + [f"{col}_{agg}" for col in columns for agg in ('sum', 'count', 'min', 'max')]
+        frame = pd.DataFrame.from_records(rows, columns=names + list(indices))
+        return frame.set_index(['Station_ID', 'period'])
+
+    @staticmethod
+    def _expected_days(frame, group_by, first_year, last_year):
+        """Number of calendar days of every period of the frame within the years."""
+        periods = frame.index.get_level_values('period')
+        if group_by == 'month':
+            return pd.PeriodIndex(periods, freq='M').days_in_month.to_numpy()
+        if group_by == 'year':
+            return np.where(pd.PeriodIndex(periods, freq='Y').is_leap_year, 366, 365)
+        years = np.arange(first_year, last_year + 1)
+        leap_years = np.count_nonzero((years % 4 == 0) & ((years % 100 != 0) | (years % 400 == 0)))
+        return np.where(periods == '02-29', leap_years, len(years))
+
+    def _values(self, frame, columns, expected, totals):
+        """Turns sums and counts into values, NaN where the coverage is not reached."""
+        values = {}
+        for col in columns:
+            count = frame[f"{col}_count"]
+            total = frame[f"{col}_sum"].astype(np.float64)
+            value = total if totals and col in SUM_COLUMNS else total / count.where(count > 0)
+            values[col] = value.where(count >= self.min_coverage * expected)
+        return pd.DataFrame(values, index=frame.index)
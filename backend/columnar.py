@@ -0,0 +1,98 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+from data_ingestion.database import MEASUREMENT_COLUMNS, to_iso_date
+
+try:
+    import pyarrow as pa
+except ImportError:  # optional, only needed for .arrow exports
+    pa = None
+
+
+class ColumnarStore:
+    """
+    Read access to the per-station exports written by
+    data_ingestion.exporter.ColumnarExporter.
+
+    Files are memory mapped: only the requested columns are touched, slices
+    are views into the mapping and repeated reads are served from the OS
+    page cache. The returned arrays are read-only.
+    """
+    def __init__(self, export_dir):
+        self.export_dir = export_dir
+
+    def stations(self):
+        """Returns the IDs of all exported stations."""
+        ids = set()
+        for name in os.listdir(self.export_dir) if os.path.isdir(self.export_dir) else []:
+            stem = name[:-len('.arrow')] if name.endswith('.arrow') else name
+            if stem.isdigit():
+                ids.add(int(stem))
+        return sorted(ids)
+
+    def load(self, station_id, columns=('TMK',), start=None, end=None):
+        """
+        Maps the given columns of one station.
+
+        :param columns: Measurement columns to load (see MEASUREMENT_COLUMNS).
+        :param start: First day (date, 'YYYYMMDD' or 'YYYY-MM-DD'), None for the first exported day.
+        :param end: Last day (inclusive), None for the last exported day.
+        :return: A tuple (dates, values) with a datetime64[D] array and a dict column -> float32 array,
+                 or None if the station was not exported.
+        """
+        unknown = [col for col in columns if col not in MEASUREMENT_COLUMNS]
+        if unknown:
+            raise ValueError(f"Unknown measurement columns: {unknown}")
+
+        arrow_path = os.path.join(self.export_dir, f"{station_id}.arrow")
+        npy_path = os.path.join(self.export_dir, str(station_id))
+        if os.path.exists(arrow_path):
+            first_day, length, arrays = self._map_arrow(arrow_path, columns)
+        elif os.path.isdir(npy_path):
+            first_day, length, arrays = self._map_npy(npy_path, columns)
+        else:
+            return None
+
+        lo = 0 if start is None else self._offset(start, first_day)
+        hi = length if end is None else self._offset(end, first_day) + 1
+        lo, hi = min(max(lo, 0), length), min(max(hi, 0), length)
+        dates = np.arange(first_day + lo, first_day + max(hi, lo))
+        return dates, {col: values[lo:hi] for col, values in arrays.items()}
+
+    def load_frame(self, station_id, columns=('TMK',), start=None, end=None):
+        """
+        Like load, but returns a DataFrame indexed by date whose columns share
+        memory with the mapped files, or None if the station was not exported.
+        """
+        loaded = self.load(station_id, columns, start, end)
+        if loaded is None:
+            return None
+        dates, values = loaded
+        return pd.DataFrame(values, index=pd.DatetimeIndex(dates, name='MESS_DATUM'), copy=False)
+
+    @staticmethod
+    def _offset(day, first_day):
+        return int((np.datetime64(to_iso_date(day), 'D') - first_day) // np.timedelta64(1, 'D'))
+
+    @staticmethod
+    def _map_npy(path, columns):
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        arrays = {col: np.load(os.path.join(path, f"{col}.npy"), mmap_mode='r') for col in columns}
+        return np.datetime64(meta['start'], 'D'), meta['days'], arrays
+
+    @staticmethod
+    def _map_arrow(path, columns):
+        if pa is None:
+            raise ImportError(f"Reading {path} requires pyarrow.")
+        source = pa.memory_map(path, 'r')
+        table = pa.ipc.open_file(source).read_all()
+        metadata = table.schema.metadata
+        arrays = {}
+        for col in columns:
+            chunks = table.column(col).chunks
+            # the exporter writes one chunk without nulls, which converts without a copy
+            arrays[col] = chunks[0].to_numpy(zero_copy_only=True) if len(chunks) == 1 \
+                else table.column(col).to_numpy()
+        return np.datetime64(metadata[b'start'].decode(), 'D'), table.num_rows, arrays
@@ -0,0 +1,146 @@
+import re
+import time
+import logging
+from collections import OrderedDict
+from data_ingestion.metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+# Returned by the in-process tier for keys it does not hold
+_MISS = object()
+
+
+def normalize_address(address):
+    """Normalizes an address for use as cache key: case, whitespace and comma spacing are ignored."""
+    address = re.sub(r'\s*,\s*', ', ', address.strip().casefold())
+    return re.sub(r'\s+', ' ', address).strip(' ,')
+
+
+class GeocodeCache:
+    """
+    Two-tier cache in front of a geopy geocoder.
+
+    The first tier is an in-process LRU bounded to `max_entries`, the second
+    the GeocodeCache table in the project database. Both are keyed by the
+    normalized address, while the geocoder is asked with the address as the
+    caller wrote it (the first one seen for a key). Results expire after
+    `ttl_seconds`; addresses the geocoder could not resolve are cached as
+    well, for `negative_ttl_seconds`. Geocoder errors are not cached.
+    """
+    def __init__(self, geolocator, db=None, max_entries=4096,
+                 ttl_seconds=90 * 24 * 3600, negative_ttl_seconds=24 * 3600, min_interval=0.0):
+        """
+        :param geolocator: Any object with a geopy-style geocode(address) method.
+        :param db: Database holding the persistent tier; None keeps results in memory only.
+        :param min_interval: Minimum number of seconds between two geocoder requests.
+        """
+        self.geolocator = geolocator
+        self.db = db
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self.min_interval = min_interval
+        self._lru = OrderedDict()
+        self._last_request = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    def geocode(self, address):
+        """
+        Geocodes a single address.
+
+        :return: A tuple (latitude, longitude), or None if the address cannot be resolved.
+        """
+        return self.geocode_many([address])[address]
+
+    def geocode_many(self, addresses):
+        """
+        Geocodes many addresses, querying the geocoder only for cache misses.
+        Addresses that normalize to the same key are looked up once.
+
+        :return: A dict mapping each address to (latitude, longitude) or None.
+        """
+        now = time.time()
+        keys = {address: normalize_address(address) for address in addresses}
+        # The first address of every key is the one sent to the geocoder
+        originals = {}
+        for address, key in keys.items():
+            originals.setdefault(key, address)
+        found = {}
+        missing = []
+        for key in originals:
+            entry = self._lru_get(key, now)
+            if entry is not _MISS:
+                found[key] = entry
+            else:
+                missing.append(key)
+
+        if missing and self.db is not None:
+            for key, (lat, lon, cached_at) in self.db.get_cached_geocodes(missing).items():
+                coords = (lat, lon) if lat is not None else None
+                if not self._expired(coords, cached_at, now):
+                    found[key] = coords
+                    self._lru_put(key, coords, cached_at)
+
+        self.hits += len(found)
+        METRICS.inc("geocode_cache_hits_total", len(found))
+        fresh = []
+        for key in missing:
+            if key in found:
+                continue
+            self.misses += 1
+            METRICS.inc("geocode_cache_misses_total")
+            try:
+                coords = self._query(originals[key])
+            except Exception:
+                logger.exception("An error occurred during geocoding of '%s'", originals[key])
+                METRICS.inc("geocode_errors_total")
+                found[key] = None
+                continue
+            found[key] = coords
+            cached_at = time.time()
+            self._lru_put(key, coords, cached_at)
+            fresh.append((key, coords[0] if coords else None, coords[1] if coords else None, cached_at))
+
+        if fresh and self.db is not None:
+            self.db.store_geocodes(fresh)
+        return {address: found[key] for address, key in keys.items()}
+
+    def clear(self):
+        """Empties the in-process tier."""
+        self._lru.clear()
+
+    def _query(self, address):
+        wait = self._last_request + self.min_interval - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        try:
+            with METRICS.timer("geocode_seconds"):
+                location = self.geolocator.geocode(address)
+        finally:
+            self._last_request = time.monotonic()
+        if not location:
+            return None
+        return location.latitude, location.longitude
+
+    def _expired(self, coords, cached_at, now):
+        ttl = self.ttl_seconds if coords is not None else self.negative_ttl_seconds
+        return cached_at + ttl < now
+
+    def _lru_get(self, key, now):
+        """Returns the cached coordinates (None for a cached miss) or _MISS."""
+        entry = self._lru.get(key)
+        if entry is None:
+            return _MISS
+        coords, cached_at = entry
+        if self._expired(coords, cached_at, now):
+            del self._lru[key]
+            return _MISS
+        self._lru.move_to_end(key)
+        return coords
+
+    def _lru_put(self, key, coords, cached_at):
+        self._lru[key] = (coords, cached_at)
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
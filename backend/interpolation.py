@@ -0,0 +1,167 @@
+from collections import namedtuple
+import numpy as np
+from data_ingestion.database import to_iso_date
+from backend.analysis import Analysis
+from backend.series import StationSeriesStore
+from data_ingestion.metrics import METRICS
+
+# Temperature lapse rate in K per meter used for the optional height correction
+LAPSE_RATE = -0.0065
+
+# Columns the height correction applies to
+TEMPERATURE_COLUMNS = ('TMK', 'TXK', 'TNK', 'TGK')
+
+# Result of an interpolation run:
+#   dates: datetime64[D] array of the n_days covered days
+#   values: dict column -> float array (n_points, n_days), NaN where no station had data
+#   station_ids, distances_km: (n_points, k) arrays of the stations used per point
+InterpolationResult = namedtuple('InterpolationResult', 'dates values station_ids distances_km')
+
+
+class Interpolator:
+    """
+    Inverse-distance-weighted interpolation of daily station data for
+    arbitrary locations.
+
+    For every target point the k nearest stations are weighted with
+    1 / distance ** power. Days on which a station has no value are left
+    out of that day's weighting, so the remaining stations share the
+    weight. All points, stations and days are handled as NumPy arrays; the
+    measurements of all involved stations are fetched with one query.
+    """
+    def __init__(self, analysis: Analysis, k=5, power=2.0, max_cells=8_000_000,
+                 store: StationSeriesStore = None):
+        """
+        :param analysis: Analysis providing the database and the station index.
+        :param k: Number of stations per target point.
+        :param power: Power parameter of the inverse distance weighting.
+        :param max_cells: Upper bound of points * k * days processed at once; bounds memory use.
+        :param store: Optional StationSeriesStore the station series are read from
+                      instead of querying the database on every call.
+        """
+        self.analysis = analysis
+        self.k = k
+        self.power = power
+        self.max_cells = max_cells
+        self.store = store
+
+    def interpolate_addresses(self, addresses, start, end, columns=('TMK',), **kwargs):
+        """
+        Geocodes the addresses and interpolates them (see interpolate).
+        Addresses that cannot be geocoded yield NaN rows.
+        """
+        coords = self.analysis.geocode_many(addresses)
+        points = [coords[address] or (np.nan, np.nan) for address in addresses]
+        return self.interpolate(points, start, end, columns, **kwargs)
+
+    def interpolate(self, points, start, end, columns=('TMK',), target_heights=None):
+        """
+        Interpolates daily values for many locations.
+
+        :param points: Sequence of (latitude, longitude) pairs.
+        :param start: First day as date, 'YYYYMMDD' or 'YYYY-MM-DD'.
+        :param end: Last day (inclusive), same formats as start.
+        :param columns: Measurement columns to interpolate, e.g. ('TMK', 'RSK').
+        :param target_heights: Optional heights in meters of the points. If given,
+                               temperatures are corrected from station to target height.
+        :return: An InterpolationResult.
+        """
+        with METRICS.timer("query_seconds", query="interpolate"):
+            return self._interpolate(points, start, end, columns, target_heights)
+
+    def _interpolate(self, points, start, end, columns, target_heights):
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        dates = np.arange(np.datetime64(to_iso_date(start)), np.datetime64(to_iso_date(end)) + 1)
+        index = self.analysis.station_index()
+        k = min(self.k, len(index))
+        if k == 0 or not len(points):
+            empty = np.full((len(points), len(dates)), np.nan)
+            return InterpolationResult(dates, {col: empty.copy() for col in columns},
+                                       np.empty((len(points), 0), dtype=np.int64), np.empty((len(points), 0)))
+
+        valid = ~np.isnan(points).any(axis=1)
+        neighbours = np.zeros((len(points), k), dtype=np.int64)
+        distances = np.full((len(points), k), np.nan)
+        if not valid.any():
+            # e.g. only addresses that could not be geocoded: no station is involved
+            empty = np.full((len(points), len(dates)), np.nan)
+            return InterpolationResult(dates, {col: empty.copy() for col in columns},
+                                       np.full((len(points), k), -1, dtype=np.int64), distances)
+        neighbours[valid], distances[valid] = index.nearest_many(points[valid, 0], points[valid, 1], k)
+
+        # Fetch the series of every involved station at once and lay them out densely
+        used, local = np.unique(neighbours[valid], return_inverse=True)
+        station_ids = index.ids[used]
+        series = self._load_series(station_ids, dates, columns)
+        neighbour_slots = np.zeros_like(neighbours)
+        neighbour_slots[valid] = local.reshape(-1, k)
+
+        weights = self._weights(distances)
+        weights[~valid] = 0.0
+
+        offsets = None
+        if target_heights is not None:
+            offsets = self._height_offsets(station_ids, neighbour_slots, target_heights)
+
+        values = {}
+        chunk = max(1, self.max_cells // (k * max(len(dates), 1)))
+        for col_index, col in enumerate(columns):
+            result = np.empty((len(points), len(dates)))
+            correct = offsets is not None and col in TEMPERATURE_COLUMNS
+            for start_row in range(0, len(points), chunk):
+                rows = slice(start_row, start_row + chunk)
+                vals = series[col_index][neighbour_slots[rows]]  # (chunk, k, days)
+                if correct:
+                    vals = vals + offsets[rows, :, None]
+                present = ~np.isnan(vals)
+                w = weights[rows, :, None] * present
+                total = w.sum(axis=1)
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    result[rows] = (np.where(present, vals, 0.0) * w).sum(axis=1) / total
+            result[~valid] = np.nan
+            values[col] = result
+
+        ids = index.ids[neighbours]
+        return InterpolationResult(dates, values, np.where(valid[:, None], ids, -1), distances)
+
+    def _load_series(self, station_ids, dates, columns):
+        """Returns a list with one (n_stations, n_days) float array per column, NaN for gaps."""
+        series = [np.full((len(station_ids), len(dates)), np.nan) for _ in columns]
+        if not len(station_ids):
+            return series
+        if self.store is not None:
+            for slot, station_id in enumerate(station_ids.tolist()):
+                loaded = self.store.load(station_id, columns, dates[0], dates[-1])
+                if loaded is None or not len(loaded[0]):
+                    continue
+                lo = int((loaded[0][0] - dates[0]) // np.timedelta64(1, 'D'))
+                for col_index, col in enumerate(columns):
+                    series[col_index][slot, lo:lo + len(loaded[0])] = loaded[1][col]
+            return series
+        rows = self.analysis.db.get_measurements(station_ids.tolist(), str(dates[0]), str(dates[-1]), columns)
+        if not rows:
+            return series
+        fields = list(zip(*rows))
+        station_slot = np.searchsorted(station_ids, np.asarray(fields[0], dtype=np.int64))
+        day = (np.asarray(fields[1], dtype='datetime64[D]') - dates[0]).astype(np.int64)
+        for col_index in range(len(columns)):
+            column = np.asarray(fields[2 + col_index], dtype=np.float64)  # None becomes NaN
+            series[col_index][station_slot, day] = column
+        return series
+
+    def _weights(self, distances):
+        """Inverse distance weights; a station at the target point gets all the weight."""
+        with np.errstate(divide='ignore'):
+            weights = 1.0 / np.power(distances, self.power)
+        exact = distances == 0
+        rows = exact.any(axis=1)
+        weights[rows] = exact[rows].astype(np.float64)
+        return np.nan_to_num(weights, nan=0.0)
+
+    def _height_offsets(self, station_ids, neighbour_slots, target_heights):
+        """Temperature offsets (n_points, k) moving each station value to the target height."""
+        heights = self.analysis.db.get_station_heights(station_ids.tolist())
+        station_heights = np.array([heights.get(int(s)) for s in station_ids], dtype=np.float64)
+        target_heights = np.asarray(target_heights, dtype=np.float64).reshape(-1, 1)
+        offsets = LAPSE_RATE * (target_heights - station_heights[neighbour_slots])
+        return np.nan_to_num(offsets, nan=0.0)  # no correction where a height is unknown
@@ -0,0 +1,180 @@
+import threading
+from collections import OrderedDict, namedtuple
+import numpy as np
+from data_ingestion.database import Database, MEASUREMENT_COLUMNS, to_iso_date
+from data_ingestion.metrics import METRICS
+
+# A station held by StationSeriesStore:
+#   first_day: datetime64[D] of index 0
+#   days: length of the dense day index
+#   rows: number of Measurement rows of the station when it was loaded
+#   values: dict column -> read-only array of length days, NaN for gaps
+StationSeries = namedtuple('StationSeries', 'first_day days rows values')
+
+
+class StationSeriesStore:
+    """
+    In-process cache of station time series as NumPy arrays.
+
+    Each station is held as one contiguous array per measurement column on
+    a dense day index from von_datum to bis_datum (widened to the measured
+    days), with NaN for missing days and values. Columns are loaded on
+    first use, so a station only holds the columns that were asked for.
+    Reads return slices that share memory with the cache; the arrays are
+    read-only.
+
+    Stations are evicted least recently used first once the arrays exceed
+    `max_bytes`. The store registers itself as import listener of the
+    database and drops every station the importer writes to, and as station
+    listener, so a changed station period rebuilds the day index. Imports by
+    other processes are not announced: before further columns are added to
+    a cached station, its period and row count are compared with the
+    database, and the station is loaded again if they changed.
+    """
+    def __init__(self, db: Database, max_bytes=256 * 1024 * 1024, dtype=np.float32):
+        """
+        :param db: The connected project database.
+        :param max_bytes: Memory budget of the cached arrays.
+        :param dtype: Float type of the arrays. float32, as used by the columnar
+                      exports, halves the memory of float64 at ~7 significant digits.
+        """
+        self.db = db
+        self.max_bytes = max_bytes
+        self.dtype = np.dtype(dtype)
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Bumped by invalidate; a load racing with an import is returned but not cached
+        self._generation = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        db.add_import_listener(self._on_import)
+        db.add_station_listener(self.invalidate)
+
+    def close(self):
+        """Stops listening to imports and drops all cached stations."""
+        self.db.remove_import_listener(self._on_import)
+        self.db.remove_station_listener(self.invalidate)
+        self.invalidate()
+
+    def get(self, station_id, columns=('TMK',)):
+        """
+        Returns the full series of a station as StationSeries with (at least)
+        the given columns, or None if nothing is known about the station.
+        """
+        unknown = [col for col in columns if col not in MEASUREMENT_COLUMNS]
+        if unknown:
+            raise ValueError(f"Unknown measurement columns: {unknown}")
+        station_id = int(station_id)
+        with self._lock:
+            entry = self._entries.get(station_id)
+            if entry is not None and all(col in entry.values for col in columns):
+                self._entries.move_to_end(station_id)
+                self.hits += 1
+                METRICS.inc("series_cache_total", result="hit")
+                return entry
+            self.misses += 1
+            generation = self._generation
+        METRICS.inc("series_cache_total", result="miss")
+
+        with METRICS.timer("series_load_seconds"):
+            first, last = self.db.get_station_period(station_id)
+            if first is None:
+                return None
+            first_day = np.datetime64(first, 'D')
+            days = self._offset(last, first_day) + 1
+            rows = self.db.get_station_row_count(station_id)
+            if entry is not None and (entry.first_day, entry.days, entry.rows) != (first_day, days, rows):
+                # Written by another process since it was cached; reload all of its columns
+                columns = tuple(dict.fromkeys(tuple(entry.values) + tuple(columns)))
+                entry = None
+            if entry is None:
+                entry = StationSeries(first_day, days, rows, {})
+            missing = [col for col in columns if col not in entry.values]
+            values = dict(entry.values, **self._load_columns(station_id, entry, missing))
+            entry = entry._replace(values=values)
+
+        with self._lock:
+            if generation != self._generation:
+                return entry
+            old = self._entries.pop(station_id, None)
+            if old is not None:
+                self.nbytes -= self._size(old)
+            self._entries[station_id] = entry
+            self.nbytes += self._size(entry)
+            self._evict(keep=station_id)
+        return entry
+
+    def load(self, station_id, columns=('TMK',), start=None, end=None):
+        """
+        Returns a window of one station, with the same interface as
+        backend.columnar.ColumnarStore.load.
+
+        :param start: First day (date, 'YYYYMMDD' or 'YYYY-MM-DD'), None for the first day of the station.
+        :param end: Last day (inclusive), None for the last day of the station.
+        :return: A tuple (dates, values) with a datetime64[D] array and a dict column -> array
+                 view, clipped to the station's day index, or None if the station is unknown.
+        """
+        entry = self.get(station_id, columns)
+        if entry is None:
+            return None
+        lo = 0 if start is None else self._offset(start, entry.first_day)
+        hi = entry.days if end is None else self._offset(end, entry.first_day) + 1
+        lo, hi = min(max(lo, 0), entry.days), min(max(hi, 0), entry.days)
+        dates = np.arange(entry.first_day + lo, entry.first_day + max(hi, lo))
+        return dates, {col: entry.values[col][lo:hi] for col in columns}
+
+    def invalidate(self, station_ids=None):
+        """Drops the given stations, or all stations if None."""
+        with self._lock:
+            self._generation += 1
+            keys = list(self._entries) if station_ids is None else [int(s) for s in station_ids]
+            for station_id in keys:
+                entry = self._entries.pop(station_id, None)
+                if entry is not None:
+                    self.nbytes -= self._size(entry)
+
+    def stats(self):
+        """Returns hits, misses, evictions, the number of cached stations and their bytes."""
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'stations': len(self._entries), 'bytes': self.nbytes}
+
+    def _on_import(self, touched):
+        self.invalidate(touched.keys())
+
+    def _load_columns(self, station_id, entry, columns):
+        """Reads the columns of a station from the database into dense read-only arrays."""
+        arrays = {col: np.full(entry.days, np.nan, dtype=self.dtype) for col in columns}
+        if columns:
+            rows = self.db.get_measurements(station_id, columns=columns)
+            if rows:
+                fields = list(zip(*rows))
+                offsets = (np.asarray(fields[1], dtype='datetime64[D]') - entry.first_day).astype(np.int64)
+                # Days written after the period was read fall outside the index; the next load picks them up
+                inside = (offsets >= 0) & (offsets < entry.days)
+                for i, col in enumerate(columns):
+                    values = np.asarray(fields[2 + i], dtype=np.float64)  # None becomes NaN
+                    arrays[col][offsets[inside]] = values[inside]
+        for values in arrays.values():
+            values.flags.writeable = False
+        return arrays
+
+    def _evict(self, keep):
+        while self.nbytes > self.max_bytes and len(self._entries) > 1:
+            station_id, entry = next(iter(self._entries.items()))
+            if station_id == keep:
+                break
+            del self._entries[station_id]
+            self.nbytes -= self._size(entry)
+            self.evictions += 1
+            METRICS.inc("series_evictions_total")
+
+    @staticmethod
+    def _size(entry):
+        return sum(values.nbytes for values in entry.values.values())
+
+    @staticmethod
+    def _offset(day, first_day):
+        return int((np.datetime64(to_iso_date(day), 'D') - first_day) // np.timedelta64(1, 'D'))
@@ -0,0 +1,161 @@
+import math
+import numpy as np
+# geopy's geodesic wraps geographiclib; importing it directly avoids loading all geopy geocoders
+from geographiclib.geodesic import Geodesic
+
+# Mean earth radius in km, the same value geopy uses for great-circle distances
+EARTH_RADIUS_KM = 6371.0088
+
+# Haversine may deviate from the geodesic distance by up to ~0.5%. Candidates
+# within this factor of the k-th haversine distance are refined exactly.
+_REFINE_MARGIN = 1.01
+
+
+def haversine_km(lat, lon, lats, lons):
+    """
+    Great-circle distances in km from one point to arrays of points.
+    All coordinates are in radians.
+    """
+    dlat = lats - lat
+    dlon = lons - lon
+    a = np.sin(dlat / 2) ** 2 + math.cos(lat) * np.cos(lats) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class StationIndex:
+    """
+    In-memory spatial index over the Station table.
+
+    Coordinates are held in NumPy arrays and bucketed into a regular
+    latitude/longitude grid. Queries only look at the grid cells that can
+    contain a match, prefilter those stations with a vectorized haversine
+    distance and refine the final candidates with the exact geodesic
+    distance.
+    """
+    def __init__(self, stations, cell_size_deg=1.0):
+        """
+        :param stations: Rows of (station_id, lat, lon, name) as returned by Database.get_all_stations.
+        :param cell_size_deg: Edge length of a grid cell in degrees.
+        """
+        stations = [s for s in stations if s[1] is not None and s[2] is not None]
+        self.cell_size_deg = cell_size_deg
+        self.ids = np.array([s[0] for s in stations], dtype=np.int64)
+        self.names = [s[3] for s in stations]
+        self.lat_deg = np.array([s[1] for s in stations], dtype=np.float64)
+        self.lon_deg = np.array([s[2] for s in stations], dtype=np.float64)
+        self.lat = np.radians(self.lat_deg)
+        self.lon = np.radians(self.lon_deg)
+        self._build_grid()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _build_grid(self):
+        """Sorts stations by grid cell and remembers the slice of every cell."""
+        rows = np.floor(self.lat_deg / self.cell_size_deg).astype(np.int64)
+        cols = np.floor(self.lon_deg / self.cell_size_deg).astype(np.int64)
+        self._order = np.lexsort((cols, rows))
+        rows, cols = rows[self._order], cols[self._order]
+        starts = np.flatnonzero(np.r_[True, (rows[1:] != rows[:-1]) | (cols[1:] != cols[:-1])])
+        ends = np.r_[starts[1:], len(rows)]
+        self._cells = {
+            (int(rows[start]), int(cols[start])): (int(start), int(end)) for start, end in zip(starts, ends)
+        } if len(rows) else {}
+
+    def _candidates(self, lat_deg, lon_deg, radius_km):
+        """Indices of all stations in grid cells intersecting the bounding box of the radius."""
+        dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+        lat_min, lat_max = lat_deg - dlat, lat_deg + dlat
+        cos_lat = math.cos(math.radians(min(max(abs(lat_min), abs(lat_max)), 90.0)))
+        if lat_max >= 90 or lat_min <= -90 or cos_lat < 1e-6 or dlat / cos_lat >= 180:
+            return np.arange(len(self.ids))  # the box wraps around, no pruning possible
+        dlon = dlat / cos_lat
+
+        size = self.cell_size_deg
+        row_range = range(math.floor(lat_min / size), math.floor(lat_max / size) + 1)
+        col_range = range(math.floor((lon_deg - dlon) / size), math.floor((lon_deg + dlon) / size) + 1)
+        if len(row_range) * len(col_range) > len(self._cells):
+            cells = [cell for cell in self._cells if cell[0] in row_range and cell[1] in col_range]
+        else:
+            cells = [(r, c) for r in row_range for c in col_range if (r, c) in self._cells]
+        if not cells:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate([self._order[slice(*self._cells[cell])] for cell in cells])
+
+    def _refine(self, lat_deg, lon_deg, indices):
+        """Exact geodesic distances for the given station indices, sorted ascending."""
+        results = [
+            (int(self.ids[i]), self.names[i],
+             Geodesic.WGS84.Inverse(lat_deg, lon_deg, self.lat_deg[i], self.lon_deg[i], Geodesic.DISTANCE)['s12'] / 1000)
+            for i in indices
+        ]
+        results.sort(key=lambda x: x[2])
+        return results
+
+    def nearest(self, lat_deg, lon_deg, k=5):
+        """
+        Returns the k nearest stations to a coordinate.
+
+        :return: A list of tuples (station_id, name, distance_km), nearest first.
+        """
+        if not len(self.ids) or k <= 0:
+            return []
+        k = min(k, len(self.ids))
+        lat, lon = math.radians(lat_deg), math.radians(lon_deg)
+
+        # Grow the search radius until it holds at least k stations
+        radius = self.cell_size_deg * 111.0
+        while True:
+            candidates = self._candidates(lat_deg, lon_deg, radius)
+            distances = haversine_km(lat, lon, self.lat[candidates], self.lon[candidates])
+            inside = distances <= radius
+            if np.count_nonzero(inside) >= k or len(candidates) == len(self.ids):
+                break
+            radius *= 2
+
+        kth = np.partition(distances, k - 1)[k - 1]
+        refine = candidates[distances <= kth * _REFINE_MARGIN]
+        return self._refine(lat_deg, lon_deg, refine)[:k]
+
+    def nearest_many(self, lats_deg, lons_deg, k=5, chunk_size=2048):
+        """
+        Vectorized k-nearest search for many points using haversine distances.
+
+        Meant for bulk work such as interpolation where the last fraction of
+        a percent of distance accuracy does not matter.
+
+        :return: A tuple (indices, distances_km) of arrays with shape (n_points, k), nearest first.
+                 Indices refer to the arrays of this index (e.g. self.ids[indices]).
+        """
+        lats = np.radians(np.asarray(lats_deg, dtype=np.float64)).reshape(-1, 1)
+        lons = np.radians(np.asarray(lons_deg, dtype=np.float64)).reshape(-1, 1)
+        k = min(k, len(self.ids))
+        indices = np.empty((len(lats), k), dtype=np.int64)
+        distances = np.empty((len(lats), k), dtype=np.float64)
+        for start in range(0, len(lats), chunk_size):
+            chunk = slice(start, start + chunk_size)
+            dlat = self.lat[None, :] - lats[chunk]
+            dlon = self.lon[None, :] - lons[chunk]
+            a = np.sin(dlat / 2) ** 2 + np.cos(lats[chunk]) * np.cos(self.lat)[None, :] * np.sin(dlon / 2) ** 2
+            d = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+            part = np.argpartition(d, k - 1, axis=1)[:, :k] if k < len(self.ids) else \
+                np.broadcast_to(np.arange(k), d.shape).copy()
+            part_d = np.take_along_axis(d, part, axis=1)
+            order = np.argsort(part_d, axis=1)
+            indices[chunk] = np.take_along_axis(part, order, axis=1)
+            distances[chunk] = np.take_along_axis(part_d, order, axis=1)
+        return indices, distances
+
+    def within(self, lat_deg, lon_deg, radius_km):
+        """
+        Returns all stations within `radius_km` of a coordinate.
+
+        :return: A list of tuples (station_id, name, distance_km), nearest first.
+        """
+        if not len(self.ids):
+            return []
+        lat, lon = math.radians(lat_deg), math.radians(lon_deg)
+        candidates = self._candidates(lat_deg, lon_deg, radius_km * _REFINE_MARGIN)
+        distances = haversine_km(lat, lon, self.lat[candidates], self.lon[candidates])
+        refine = candidates[distances <= radius_km * _REFINE_MARGIN]
+        return [s for s in self._refine(lat_deg, lon_deg, refine) if s[2] <= radius_km]
@@ -0,0 +1,255 @@
+"""
+End-to-end ingestion and query benchmark on synthetic DWD archives.
+
+Times every stage separately (download, process, insert, nearest) and writes
+machine-readable JSON. With --compare the results are checked against a
+stored baseline and the exit code is 1 if a metric regressed.
+
+    python -m benchmarks.run --stations 50 --years 10 --output results.json
+    python -m benchmarks.run --compare results.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+from benchmarks.synthetic import LocalArchiveServer, generate_archives, synthetic_stations, write_station_list
+from data_ingestion.database import Database
+from data_ingestion.downloader import Downloader
+from data_ingestion.importer import CsvImporter
+from data_ingestion.processor import DataProcessor, read_station_list
+from backend.analysis import Analysis
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Metrics where larger is better; for all other compared metrics smaller is better
+HIGHER_IS_BETTER = ('rows_per_s', 'mb_per_s', 'queries_per_s')
+COMPARED_METRICS = HIGHER_IS_BETTER + ('p50_ms', 'p99_ms', 'seconds')
+
+
+class _StubLocation:
+    def __init__(self, latitude, longitude):
+        self.latitude = latitude
+        self.longitude = longitude
+
+
+class StubGeocoder:
+    """Offline geocoder resolving every address to a random point in Germany."""
+    def __init__(self, seed=0):
+        self.rng = random.Random(seed)
+
+    def geocode(self, address):
+        return _StubLocation(self.rng.uniform(47.3, 55.0), self.rng.uniform(5.9, 15.0))
+
+
+def cumulative_peak_rss_mb():
+    """
+    Peak resident set size of the whole process so far, or None if unknown.
+    A high-water mark: a stage only raises it if it needs more memory than
+    every stage before it, so it is not the memory use of a single stage.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def summarize(latencies, seconds, rows=None, nbytes=None, items=None):
+    """Builds the metrics dict of one stage from per-item latencies in seconds."""
+    stats = {'seconds': round(seconds, 4)}
+    if items is not None:
+        stats['items'] = items
+    if rows is not None:
+        stats['rows'] = rows
+        stats['rows_per_s'] = round(rows / seconds, 1) if seconds > 0 else None
+    if nbytes is not None:
+        stats['bytes'] = nbytes
+        stats['mb_per_s'] = round(nbytes / 1e6 / seconds, 2) if seconds > 0 else None
+    if latencies:
+        stats['p50_ms'] = round(float(np.percentile(latencies, 50)) * 1000, 3)
+        stats['p99_ms'] = round(float(np.percentile(latencies, 99)) * 1000, 3)
+    stats['cumulative_peak_rss_mb'] = cumulative_peak_rss_mb()
+    return stats
+
+
+def _timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def run_benchmark(stations=20, years=5, missing_rate=0.01, noise_lines=3, queries=1000,
+                  download_workers=4, work_dir=None, seed=0):
+    """
+    Generates synthetic archives and times every ingestion and query stage.
+
+    :return: A dict with 'meta' (parameters and environment) and 'stages' (metrics per stage).
+    """
+    own_dir = work_dir is None
+    work_dir = work_dir or tempfile.mkdtemp(prefix="wetter_bench_")
+    served_dir = os.path.join(work_dir, "served")
+    download_dir = os.path.join(work_dir, "download")
+    extract_dir = os.path.join(work_dir, "unzipped")
+    results = {
+        'meta': {
+            'stations': stations, 'years': years, 'missing_rate': missing_rate, 'noise_lines': noise_lines,
+            'queries': queries, 'download_workers': download_workers, 'seed': seed,
+            'python': platform.python_version(), 'platform': platform.platform(),
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        },
+        'stages': {},
+    }
+    stages = results['stages']
+    try:
+        generate_archives(served_dir, stations, years, missing_rate, noise_lines, seed=seed)
+
+        # Download: against a local HTTP stand-in, so network variance does not enter
+        with LocalArchiveServer(served_dir) as server:
+            downloader = Downloader(server.url, download_dir, session=Downloader.create_session(download_workers))
+            urls = downloader.get_file_urls(r'href="(tageswerte_KL_.*?\.zip)"')
+            latencies = []
+            start = time.perf_counter()
+            for url in urls:
+                _, elapsed = _timed(downloader.download_file, url)
+                latencies.append(elapsed)
+            seconds = time.perf_counter() - start
+        archives = sorted(os.path.join(download_dir, name) for name in os.listdir(download_dir))
+        nbytes = sum(os.path.getsize(path) for path in archives)
+        stages['download'] = summarize(latencies, seconds, nbytes=nbytes, items=len(archives))
+
+        # Process: unzip and parse into CSV
+        processor = DataProcessor(download_dir, extract_dir, 'latin-1', -999, typed=True)
+        latencies, csv_files = [], []
+        start = time.perf_counter()
+        for path in archives:
+            csv_file, elapsed = _timed(processor.process_file, path, 'produkt_', 'STATIONS_ID', ';')
+            latencies.append(elapsed)
+            csv_files.append(csv_file)
+        seconds = time.perf_counter() - start
+        rows = sum(count_csv_rows(path) for path in csv_files)
+        stages['process'] = summarize(latencies, seconds, rows=rows, nbytes=nbytes, items=len(archives))
+
+        # Insert: bulk load the CSV files
+        db = Database(os.path.join(work_dir, "bench.db"), -999, 'latin-1')
+        db.create_connection()
+        db.create_tables(os.path.join(ROOT_DIR, 'Create_table.sql'))
+        latencies, inserted = [], 0
+        csv_bytes = sum(os.path.getsize(path) for path in csv_files)
+        start = time.perf_counter()
+        with db.bulk_load():
+            for path in csv_files:
+                count, elapsed = _timed(db.insert_csv, path, ';')
+                latencies.append(elapsed)
+                inserted += count
+        seconds = time.perf_counter() - start
+        stages['insert'] = summarize(latencies, seconds, rows=inserted, nbytes=csv_bytes, items=len(csv_files))
+
+        # Stations: parse and upsert a station description of DWD size
+        station_file = write_station_list(os.path.join(work_dir, "stations.txt"),
+                                          synthetic_stations(max(stations, 1100), seed))
+        start = time.perf_counter()
+        station_rows = CsvImporter(db).import_stations(read_station_list(station_file), station_file)
+        seconds = time.perf_counter() - start
+        stages['stations'] = summarize([seconds], seconds, rows=station_rows,
+                                       nbytes=os.path.getsize(station_file), items=1)
+
+        # Nearest: station lookups with a stub geocoder
+        analysis = Analysis(db, geolocator=StubGeocoder(seed))
+        analysis.find_nearest_stations("warm up")
+        latencies = []
+        start = time.perf_counter()
+        for i in range(queries):
+            _, elapsed = _timed(analysis.find_nearest_stations, f"Address {i}")
+            latencies.append(elapsed)
+        seconds = time.perf_counter() - start
+        stages['nearest'] = summarize(latencies, seconds, items=queries)
+        stages['nearest']['queries_per_s'] = round(queries / seconds, 1) if seconds > 0 else None
+        db.close_connection()
+    finally:
+        if own_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+
+def count_csv_rows(csv_file):
+    """Number of data rows of a processed CSV file."""
+    if not csv_file:
+        return 0
+    with open(csv_file, 'rb') as f:
+        return max(sum(1 for _ in f) - 1, 0)
+
+
+def compare(results, baseline, threshold=0.2):
+    """
+    Compares results against a baseline.
+
+    :param threshold: Tolerated relative change, e.g. 0.2 for 20%.
+    :return: A list of regression descriptions; empty if nothing regressed.
+    """
+    regressions = []
+    for stage, metrics in results['stages'].items():
+        base = baseline.get('stages', {}).get(stage, {})
+        for metric in COMPARED_METRICS:
+            new, old = metrics.get(metric), base.get(metric)
+            if not new or not old:
+                continue
+            change = (new - old) / old
+            worse = change < -threshold if metric in HIGHER_IS_BETTER else change > threshold
+            if worse:
+                regressions.append(f"{stage}.{metric}: {old} -> {new} ({change:+.1%})")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark ingestion and queries on synthetic DWD archives.")
+    parser.add_argument('--stations', type=int, default=20, help="number of synthetic station archives")
+    parser.add_argument('--years', type=int, default=5, help="years of daily data per station")
+    parser.add_argument('--missing-rate', type=float, default=0.01, help="probability of a -999 value")
+    parser.add_argument('--noise-lines', type=int, default=3, help="free text lines before the header")
+    parser.add_argument('--queries', type=int, default=1000, help="number of nearest-station lookups")
+    parser.add_argument('--download-workers', type=int, default=4, help="size of the HTTP connection pool")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="write the results as JSON to this file instead of stdout")
+    parser.add_argument('--compare', metavar='BASELINE', help="flag regressions against a baseline JSON file")
+    parser.add_argument('--threshold', type=float, default=0.2, help="tolerated relative change for --compare")
+    args = parser.parse_args(argv)
+
+    results = run_benchmark(args.stations, args.years, args.missing_rate, args.noise_lines, args.queries,
+                            args.download_workers, seed=args.seed)
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            return 1
+        print("No regressions against the baseline.", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
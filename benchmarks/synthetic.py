@@ -0,0 +1,192 @@
+"""
+Synthetic DWD data: tageswerte_KL_*.zip archives, station lists and a local
+HTTP stand-in for the DWD open data server.
+"""
+import os
+import random
+import threading
+import zipfile
+from datetime import date, timedelta
+from functools import partial
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+KL_COLUMNS = ['STATIONS_ID', 'MESS_DATUM', 'QN_3', 'FX', 'FM', 'QN_4', 'RSK', 'RSKF', 'SDK',
+              'SHK_TAG', 'NM', 'VPM', 'PM', 'TMK', 'UPM', 'TXK', 'TNK', 'TGK', 'eor']
+
+
+def kl_rows(station_id, start, days, missing_rate=0.0, rng=None):
+    """
+    Returns `days` product lines for a station starting at `start`, formatted
+    like the DWD files (right aligned fields, -999 for missing values).
+    Each measurement is missing with probability `missing_rate`.
+    """
+    rng = rng or random.Random(station_id)
+    lines = []
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        season = 10.0 * -((day.timetuple().tm_yday - 196) / 183.0) ** 2 + 10.0
+        tmk = round(season + rng.gauss(0, 3), 1)
+        values = [rng.uniform(5, 30), rng.uniform(1, 10), 3, max(0.0, rng.gauss(1, 3)), rng.randint(0, 8),
+                  rng.uniform(0, 14), 0, rng.uniform(0, 8), rng.uniform(5, 20), rng.uniform(980, 1040),
+                  tmk, rng.uniform(40, 100), tmk + rng.uniform(2, 8), tmk - rng.uniform(2, 8), tmk - 3]
+        fields = []
+        for value in values:
+            if missing_rate and rng.random() < missing_rate:
+                fields.append("-999")
+            elif isinstance(value, int):
+                fields.append(f"{value:4d}")
+            else:
+                fields.append(f"{value:6.1f}")
+        lines.append(f"{station_id:>11};{day:%Y%m%d};    1;" + ";".join(fields) + ";eor")
+    return lines
+
+
+def write_kl_archive(directory, station_id, start=date(2020, 1, 1), days=10, missing_rate=0.0,
+                     noise_lines=0, name=None, rng=None):
+    """
+    Writes a synthetic tageswerte_KL_*.zip archive with a product file and a
+    metadata file, and returns its path. `noise_lines` lines of free text are
+    put in front of the header, as found in some DWD product files.
+    """
+    end = start + timedelta(days=days - 1)
+    name = name or f"tageswerte_KL_{station_id:05d}_{start:%Y%m%d}_{end:%Y%m%d}_hist.zip"
+    path = os.path.join(directory, name)
+    noise = [f"Hinweis {i}: synthetische Daten fuer Station {station_id}" for i in range(noise_lines)]
+    content = "\n".join(noise + [';'.join(KL_COLUMNS)] + kl_rows(station_id, start, days, missing_rate, rng)) + "\n"
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zipf:
+        zipf.writestr(f"produkt_klima_tag_{start:%Y%m%d}_{end:%Y%m%d}_{station_id:05d}.txt", content)
+        zipf.writestr(f"Metadaten_Geographie_{station_id:05d}.txt", "dummy metadata")
+    return path
+
+
+def synthetic_stations(count, seed=0):
+    """Returns `count` station rows (Station_ID, geoBreite, geoLaenge, Stationsname, Stattionhoehe) within Germany."""
+    rng = random.Random(seed)
+    return [(station_id, round(rng.uniform(47.3, 55.0), 4), round(rng.uniform(5.9, 15.0), 4),
+             f"Station {station_id}", rng.randint(0, 1500)) for station_id in range(1, count + 1)]
+
+
+def write_station_list(path, stations, start=date(1950, 1, 1), end=date(2024, 12, 31)):
+    """
+    Writes station rows as returned by synthetic_stations in the fixed-width,
+    latin-1 encoded layout of the DWD station description.
+    """
+    lines = ["Stations_id von_datum bis_datum Stationshoehe geoBreite geoLaenge Stationsname Bundesland Abgabe",
+             "----------- --------- --------- ------------- --------- --------- "
+             "----------------------------------------- ---------- ------"]
+    for station_id, lat, lon, name, height in stations:
+        lines.append(f"{station_id:05d} {start:%Y%m%d} {end:%Y%m%d} {height:>14} {lat:>11.4f} {lon:>9.4f} "
+                     f"{name:<40} {'Baden-Württemberg':<40} Frei")
+    with open(path, 'w', encoding='latin-1') as f:
+        f.write("\n".join(lines) + "\n")
+    return path
+
+
+def generate_archives(directory, stations=10, years=5, missing_rate=0.01, noise_lines=0,
+                      start=date(2000, 1, 1), seed=0):
+    """
+    Writes one archive per station covering `years` years and an index.html
+    listing them. Returns the archive paths.
+    """
+    os.makedirs(directory, exist_ok=True)
+    days = (date(start.year + years, start.month, start.day) - start).days
+    rng = random.Random(seed)
+    paths = [write_kl_archive(directory, station_id, start, days, missing_rate, noise_lines, rng=rng)
+             for station_id in range(1, stations + 1)]
+    write_index(directory)
+    return paths
+
+
+def write_index(directory):
+    """Writes an index.html listing all zip files of the directory like the DWD server does."""
+    links = [f'<a href="{name}">{name}</a>' for name in sorted(os.listdir(directory)) if name.endswith('.zip')]
+    with open(os.path.join(directory, 'index.html'), 'w') as f:
+        f.write("<html><body>\n" + "\n".join(links) + "\n</body></html>\n")
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    """Static file handler without request logging."""
+    def log_message(self, format, *args):
+        pass
+
+
+class ConditionalHandler(QuietHandler):
+    """
+    Static file handler answering like a CDN: ETag and Last-Modified
+    validators, If-None-Match revalidation and single Range requests with
+    If-Range. Every request is appended to the class attribute `requests`
+    as (path, status). Set `truncate_after` to a byte count to cut off the
+    body of full downloads, like a dropped connection.
+    """
+    requests = []
+    truncate_after = None
+
+    def send_head(self):
+        path = self.translate_path(self.path)
+        if os.path.isdir(path):
+            path = os.path.join(path, 'index.html')
+        if not os.path.isfile(path):
+            self._record(404)
+            self.send_error(404)
+            return None
+        stat = os.stat(path)
+        size = stat.st_size
+        etag = f'"{stat.st_mtime_ns:x}-{size:x}"'
+        if self.headers.get('If-None-Match') == etag:
+            self._record(304)
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return None
+
+        first = 0
+        range_header = self.headers.get('Range')
+        if range_header and self.headers.get('If-Range', etag) == etag:
+            first = int(range_header.split('=')[1].split('-')[0])
+            if first >= size:
+                self._record(416)
+                self.send_response(416)
+                self.send_header('Content-Range', f"bytes */{size}")
+                self.end_headers()
+                return None
+            self._record(206)
+            self.send_response(206)
+            self.send_header('Content-Range', f"bytes {first}-{size - 1}/{size}")
+        else:
+            self._record(200)
+            self.send_response(200)
+        f = open(path, 'rb')
+        f.seek(first)
+        self.send_header('Content-Type', self.guess_type(path))
+        self.send_header('Content-Length', str(size - first))
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', self.date_time_string(stat.st_mtime))
+        self.end_headers()
+        if self.truncate_after is not None and not first:
+            data = f.read(self.truncate_after)
+            f.close()
+            self.wfile.write(data)
+            self.close_connection = True
+            return None
+        return f
+
+    def _record(self, status):
+        # Recorded before the response is sent, so the client never sees a response that is not recorded yet
+        type(self).requests.append((self.path, status))
+
+
+class LocalArchiveServer:
+    """Serves a directory over HTTP on localhost for the duration of a with-block."""
+    def __init__(self, directory, handler=QuietHandler):
+        self.directory = directory
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), partial(handler, directory=directory))
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.server.shutdown()
+        self.server.server_close()
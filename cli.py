@@ -0,0 +1,191 @@
+"""
+Command line interface of the project.
+
+    python cli.py ingest [--force]
+    python cli.py refresh
+    python cli.py stations
+    python cli.py nearest "Berlin, Germany" -k 3
+    python cli.py nearest --lat 52.52 --lon 13.40 --radius 25
+    python cli.py query 433 1048 --start 2020-01-01 --end 2020-12-31 --columns TMK,RSK
+    python cli.py stats 433 --start 2020-01-01 --end 2020-12-31 --columns TMK
+    python cli.py bench --stations 20 --years 5
+
+Lookups are called from shell scripts in tight loops, so this module only
+imports the standard library at startup. Every subcommand imports what it
+needs when it runs: pandas, requests and the pipeline are only loaded by
+ingest and refresh, geopy only when an address has to be geocoded.
+"""
+import argparse
+import csv
+import json
+import logging
+import os
+import sqlite3
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_config(path):
+    """Loads the YAML configuration file."""
+    import yaml
+    with open(path, 'r') as file:
+        return yaml.safe_load(file)
+
+
+def open_database(args, config, read_only=True):
+    """Opens the configured database, or --db. A missing database is an error, it is never created."""
+    from data_ingestion.database import Database
+    db_file = args.db or config['database']['path']
+    if not os.path.isfile(db_file):
+        raise SystemExit(f"Database {db_file} does not exist. Run 'python cli.py ingest' first.")
+    # Without maintained rollups, statistics are computed from the measurements
+    db = Database(db_file, None, None, maintain_rollups=config.get('database', {}).get('maintain_rollups', True))
+    db.create_connection(read_only=read_only)
+    if db.conn is None:
+        raise SystemExit(f"Cannot open database {db.db_file}")
+    return db
+
+
+def split_columns(value):
+    return tuple(col.strip() for col in value.split(',') if col.strip())
+
+
+def cmd_ingest(args, config):
+    from web.app import run_ingestion
+    stats = run_ingestion(config, skip_unchanged=False if args.force else None)
+    print(json.dumps(stats))
+    return 0 if not stats['failures'] else 1
+
+
+def cmd_refresh(args, config):
+    from web.app import run_ingestion
+    stats = run_ingestion(config, skip_unchanged=True, recent=True)
+    print(json.dumps(stats))
+    return 0 if not stats['failures'] else 1
+
+
+def cmd_stations(args, config):
+    from web.app import run_station_refresh
+    count = run_station_refresh(config)
+    print(json.dumps({'stations': count}))
+    return 0 if count else 1
+
+
+def cmd_nearest(args, config):
+    from backend.analysis import Analysis
+    # Geocoded addresses are stored in the database, so later calls skip the geocoder
+    db = open_database(args, config, read_only=args.address is None)
+    try:
+        analysis = Analysis(db)
+        if args.address is not None:
+            coords = analysis.geocode_many([args.address])[args.address]
+            if coords is None:
+                print(f"Could not geocode address '{args.address}'.", file=sys.stderr)
+                return 1
+        elif args.lat is not None and args.lon is not None:
+            coords = (args.lat, args.lon)
+        else:
+            print("Either an address or --lat and --lon are required.", file=sys.stderr)
+            return 2
+        if args.radius is not None:
+            stations = analysis.station_index().within(*coords, args.radius)
+        else:
+            stations = analysis.station_index().nearest(*coords, k=args.k)
+    finally:
+        db.close_connection()
+    for station_id, name, distance in stations:
+        print(f"{station_id}\t{name}\t{distance:.2f}")
+    return 0
+
+
+def cmd_query(args, config):
+    db = open_database(args, config)
+    try:
+        columns = split_columns(args.columns)
+        rows = db.get_measurements(args.stations, args.start, args.end, columns)
+    finally:
+        db.close_connection()
+    writer = csv.writer(sys.stdout, delimiter=args.delimiter, lineterminator='\n')
+    writer.writerow(('Station_ID', 'MESS_DATUM') + columns)
+    writer.writerows(rows)
+    return 0
+
+
+def cmd_stats(args, config):
+    from backend.analysis import Analysis
+    db = open_database(args, config)
+    try:
+        statistics = Analysis(db).get_period_statistics(args.stations, args.start, args.end,
+                                                        split_columns(args.columns))
+    finally:
+        db.close_connection()
+    print(json.dumps(statistics, indent=2))
+    return 0
+
+
+def cmd_bench(args, config):
+    from benchmarks.run import main as run_benchmark
+    return run_benchmark(args.bench_args)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Import and query DWD daily climate data.")
+    parser.add_argument('--config', default='config.yaml', help="path of the configuration file")
+    parser.add_argument('--db', help="database file, overrides database.path of the configuration")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    ingest = subparsers.add_parser('ingest', help="download and import all archives")
+    ingest.add_argument('--force', action='store_true', help="re-import archives listed in the manifest")
+    ingest.set_defaults(func=cmd_ingest)
+
+    refresh = subparsers.add_parser('refresh', help="import the days added since the last run from the recent archives")
+    refresh.set_defaults(func=cmd_refresh)
+
+    stations = subparsers.add_parser('stations', help="import only the station description")
+    stations.set_defaults(func=cmd_stations)
+
+    nearest = subparsers.add_parser('nearest', help="find stations near an address or coordinate")
+    nearest.add_argument('address', nargs='?', help="address to geocode")
+    nearest.add_argument('--lat', type=float, help="latitude in degrees, instead of an address")
+    nearest.add_argument('--lon', type=float, help="longitude in degrees, instead of an address")
+    nearest.add_argument('-k', type=int, default=5, help="number of stations")
+    nearest.add_argument('--radius', type=float, help="return all stations within this many km instead")
+    nearest.set_defaults(func=cmd_nearest)
+
+    for name, func, help_text in (('query', cmd_query, "print daily measurements as CSV"),
+                                  ('stats', cmd_stats, "print period statistics as JSON")):
+        sub = subparsers.add_parser(name, help=help_text)
+        sub.add_argument('stations', type=int, nargs='+', help="station IDs")
+        sub.add_argument('--start', required=True, help="first day, YYYY-MM-DD or YYYYMMDD")
+        sub.add_argument('--end', required=True, help="last day (inclusive)")
+        sub.add_argument('--columns', default='TMK', help="comma separated measurement columns")
+        sub.set_defaults(func=func)
+    subparsers.choices['query'].add_argument('--delimiter', default=',', help="CSV delimiter")
+
+    bench = subparsers.add_parser('bench', help="run the benchmark suite (see benchmarks/run.py)")
+    bench.add_argument('bench_args', nargs=argparse.REMAINDER, help="arguments passed to the benchmark")
+    bench.set_defaults(func=cmd_bench)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    # Lookups with --db work without a configuration file
+    needs_config = args.command in ('ingest', 'refresh', 'stations') or (args.db is None and args.command != 'bench')
+    config = load_config(args.config) if needs_config else {}
+    logging.basicConfig(level=config.get('metrics', {}).get('log_level', 'WARNING'),
+                        format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    try:
+        return args.func(args, config)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+    except sqlite3.Error as e:
+        # e.g. a database created by an older version without the table a command needs
+        print(f"Database error: {e}", file=sys.stderr)
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
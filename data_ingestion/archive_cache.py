@@ -0,0 +1,196 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter
+
+from .metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+
+def _url_hash(url):
+    return hashlib.sha256(url.encode()).hexdigest()[:16]
+
+
+class ArchiveCache:
+    """
+    Persistent cache of downloaded archives and index pages.
+
+    Every cached URL is recorded in an index file (cache_index.json) with
+    its ETag, Last-Modified, size and the SHA-256 of its content, so later
+    runs can ask the server with a conditional GET whether the copy is
+    still current. Archives keep their file name, which the ingestion
+    manifest uses as source, in a subdirectory named after a hash of the
+    URL's directory, so equally named files of different URLs never share a
+    local copy. For an interrupted download the validators of the partial
+    file are recorded as well, so it can be resumed with a Range request.
+
+    Once the cached files exceed `max_bytes`, the least recently used
+    files are deleted. Files handed out by the downloader are pinned until
+    they are released, so an archive waiting to be parsed is never evicted.
+    """
+    INDEX_FILE = 'cache_index.json'
+
+    def __init__(self, cache_dir, max_bytes=None):
+        """
+        :param cache_dir: Directory of the cached files and the index file.
+        :param max_bytes: Size limit of the cached files, None for no limit.
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        # Set by touch: the index has use times that are not written yet
+        self._dirty = False
+        self._pinned = Counter()
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._entries = self._load_index()
+
+    def path(self, url):
+        """
+        Returns the local path of a URL: <cache_dir>/<hash of the URL's directory>/<file name>.
+        Index pages (URLs ending in '/') get a name derived from the URL.
+        """
+        parent, _, file_name = url.rpartition('/')
+        if not file_name:
+            return os.path.join(self.cache_dir, f"index-{_url_hash(url)}.html")
+        return os.path.join(self.cache_dir, _url_hash(parent + '/'), file_name)
+
+    def lookup(self, url):
+        """
+        Returns the entry of a completely cached URL, or None. Entries whose
+        file is missing or has a different size are dropped.
+        """
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is None or entry.get('size') is None:
+                return None
+            path = self.path(url)
+            if not os.path.exists(path) or os.path.getsize(path) != entry['size']:
+                logger.info("Cached copy of %s is missing or incomplete.", url)
+                self._entries[url] = {'partial': entry['partial']} if 'partial' in entry else {}
+                self._save_index()
+                return None
+            return dict(entry)
+
+    def conditional_headers(self, url):
+        """Returns If-None-Match/If-Modified-Since headers for a completely cached URL."""
+        entry = self.lookup(url)
+        headers = {}
+        if entry is not None:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def partial(self, url):
+        """Returns the validator (ETag or Last-Modified) of a partial download of the URL, or None."""
+        with self._lock:
+            return self._entries.get(url, {}).get('partial')
+
+    def store_partial(self, url, validator):
+        """Records the validator of a download in progress, None forgets a partial download."""
+        with self._lock:
+            entry = self._entries.setdefault(url, {})
+            if validator is None:
+                entry.pop('partial', None)
+            else:
+                entry['partial'] = validator
+            self._save_index()
+
+    def store(self, url, size, etag, last_modified, sha256):
+        """Records a completely downloaded URL and evicts old files if the cache is too large."""
+        with self._lock:
+            self._entries[url] = {'size': size, 'etag': etag, 'last_modified': last_modified,
+                                  'sha256': sha256, 'used': time.time()}
+            self._save_index()
+        self.trim()
+
+    def touch(self, url):
+        """Marks a URL as used now. Written to the index by the next release or flush."""
+        with self._lock:
+            if url in self._entries:
+                self._entries[url]['used'] = time.time()
+                self._dirty = True
+
+    def flush(self):
+        """Writes use times recorded by touch to the index, so the next run evicts by them."""
+        with self._lock:
+            if self._dirty:
+                self._save_index()
+
+    def digest(self, path):
+        """Returns the recorded SHA-256 of a cached file, or None."""
+        with self._lock:
+            for url, entry in self._entries.items():
+                if entry.get('sha256') and self.path(url) == path:
+                    return entry['sha256']
+        return None
+
+    def pin(self, path):
+        """Protects a file from eviction until it is released."""
+        with self._lock:
+            self._pinned[path] += 1
+
+    def release(self, path):
+        """Releases a pinned file, which may then be evicted."""
+        with self._lock:
+            self._pinned[path] -= 1
+            if self._pinned[path] <= 0:
+                del self._pinned[path]
+        self.trim()
+        self.flush()
+
+    def size(self):
+        """Returns the total size of the completely cached files."""
+        with self._lock:
+            return sum(entry.get('size') or 0 for entry in self._entries.values())
+
+    def trim(self):
+        """Deletes the least recently used, unpinned files until the cache fits into max_bytes."""
+        if self.max_bytes is None:
+            return
+        with self._lock:
+            evicted = 0
+            total = sum(entry.get('size') or 0 for entry in self._entries.values())
+            by_age = sorted((entry['used'], url) for url, entry in self._entries.items() if entry.get('size'))
+            for _, url in by_age:
+                if total <= self.max_bytes:
+                    break
+                path = self.path(url)
+                if self._pinned.get(path):
+                    continue
+                total -= self._entries[url]['size']
+                del self._entries[url]
+                if os.path.exists(path):
+                    os.remove(path)
+                evicted += 1
+                METRICS.inc("download_cache_evictions_total")
+                logger.debug("Evicted %s from the archive cache.", url)
+            if evicted:
+                self.evictions += evicted
+                self._save_index()
+
+    def _load_index(self):
+        index_path = os.path.join(self.cache_dir, self.INDEX_FILE)
+        if not os.path.exists(index_path):
+            return {}
+        try:
+            with open(index_path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable archive cache index %s: %s", index_path, e)
+            return {}
+
+    def _save_index(self):
+        """Writes the index atomically. Callers hold the lock."""
+        self._dirty = False
+        index_path = os.path.join(self.cache_dir, self.INDEX_FILE)
+        tmp_path = f"{index_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self._entries, f)
+        os.replace(tmp_path, index_path)
@@ -1,26 +1,120 @@
 import sqlite3
 import os
 import csv
+import time
+import logging
+from contextlib import contextmanager
+from datetime import date
+from .metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+# PRAGMAs applied while bulk loading; the previous values are restored afterwards.
+IMPORT_PRAGMAS = {
+    'journal_mode': 'MEMORY',
+    'synchronous': 'OFF',
+    'cache_size': -262144,  # negative values are KiB, i.e. 256 MiB
+    'temp_store': 'MEMORY',
+}
+
+# Natural keys used to detect rows that already exist
+NATURAL_KEYS = {
+    'Station': ('Station_ID',),
+    'Measurement': ('Station_ID', 'MESS_DATUM'),
+}
+
+# append: plain INSERT, rows violating the natural key are skipped and reported
+# ignore: keep the stored row, silently drop the new one
+# replace: delete the stored row and insert the new one
+# upsert: update the stored row in place with the new values
+IMPORT_MODES = ('append', 'ignore', 'replace', 'upsert')
+
+# Measurement columns that can be requested through get_measurements
+MEASUREMENT_COLUMNS = ('QN_3', 'FX', 'FM', 'QN_4', 'RSK', 'RSKF', 'SDK', 'SHK_TAG', 'NM',
+                       'VPM', 'PM', 'TMK', 'UPM', 'TXK', 'TNK', 'TGK')
+
+# Columns delivered as YYYYMMDD by the DWD and stored as ISO 'YYYY-MM-DD'
+DATE_COLUMNS = ('MESS_DATUM', 'von_datum', 'bis_datum')
+
+# Columns of the Station table written by upsert_stations, in the order of the DWD station description
+STATION_COLUMNS = ('Station_ID', 'von_datum', 'bis_datum', 'Stattionhoehe', 'geoBreite', 'geoLaenge',
+                   'Stationsname', 'Bundesland', 'Abgabe')
+
+# Columns aggregated into MonthlyRollup/YearlyRollup as <col>_sum, _count, _min and _max
+ROLLUP_COLUMNS = ('TMK', 'TXK', 'TNK', 'RSK', 'SDK', 'FX')
+ROLLUP_TABLES = {'month': 'MonthlyRollup', 'year': 'YearlyRollup'}
+
+# Quality flag of each measurement column: QN_3 covers the wind columns, QN_4 all others
+QUALITY_FLAGS = {col: 'QN_3' if col in ('FX', 'FM') else 'QN_4'
+                 for col in MEASUREMENT_COLUMNS if col not in ('QN_3', 'QN_4')}
+
+# Periods get_grouped_aggregates can group by; day_of_year ('MM-DD') pools all years
+GROUP_KEYS = {
+    'year': "substr(MESS_DATUM, 1, 4)",
+    'month': "substr(MESS_DATUM, 1, 7)",
+    'day_of_year': "substr(MESS_DATUM, 6, 5)",
+}
+THRESHOLD_OPERATORS = ('<', '<=', '>', '>=')
+
+# SQL expression converting a legacy YYYYMMDD integer column to ISO text
+_ISO_DATE_SQL = ("CASE WHEN typeof({col}) = 'integer' "
+                 "THEN printf('%04d-%02d-%02d', {col} / 10000, {col} / 100 % 100, {col} % 100) "
+                 "ELSE {col} END")
+
+
+def to_iso_date(value):
+    """
+    Normalizes a date given as datetime.date, 'YYYYMMDD' or 'YYYY-MM-DD'
+    (str or int) to the stored ISO form 'YYYY-MM-DD'.
+    """
+    if isinstance(value, date):
+        return value.isoformat()
+    value = str(value).strip()
+    if len(value) == 8 and value.isdigit():
+        return f"{value[:4]}-{value[4:6]}-{value[6:]}"
+    return value
+
 
 class Database:
-    def __init__(self, db_file, na_value, file_encoding):
+    def __init__(self, db_file, na_value, file_encoding, batch_size=50000, import_mode='upsert',
+                 maintain_rollups=True, wal=False):
+        if import_mode not in IMPORT_MODES:
+            raise ValueError(f"Unknown import mode '{import_mode}'. Expected one of {IMPORT_MODES}.")
         self.db_file = db_file
         self.conn = None
         self.na_value = na_value
         self.file_encoding = file_encoding
+        self.batch_size = batch_size
+        self.import_mode = import_mode
+        self.maintain_rollups = maintain_rollups
+        self.wal = wal
+        self._bulk_depth = 0
+        self._import_listeners = []
+        self._station_listeners = []
 
-    def create_connection(self):
+    def create_connection(self, read_only=False):
         """ create a database connection to the SQLite database
             specified by db_file
+
+        :param read_only: Open an existing database read-only. The connection
+                          may be handed between threads, but must only be used
+                          by one thread at a time (see web.service.ReadPool).
         """
         try:
+            if read_only:
+                self.conn = sqlite3.connect(f"file:{os.path.abspath(self.db_file)}?mode=ro", uri=True,
+                                            check_same_thread=False)
+                return
             # create data directory if it doesn't exist
             db_dir = os.path.dirname(self.db_file)
-            if not os.path.exists(db_dir):
+            if db_dir and not os.path.exists(db_dir):
                 os.makedirs(db_dir)
             self.conn = sqlite3.connect(self.db_file)
-        except sqlite3.Error as e:
-            print(e)
+            if self.wal:
+                # Readers keep going while an import writes; the mode is stored in the file
+                self.conn.execute("PRAGMA journal_mode = WAL")
+        except sqlite3.Error:
+            logger.exception("Could not connect to %s", self.db_file)
 
     def close_connection(self):
         """ close the database connection """
@@ -30,19 +124,16 @@ class Database:
     def create_tables(self, sql_file_path):
         """ create tables from a .sql file """
         try:
-            print(f"Attempting to read SQL file from {sql_file_path}...")
             with open(sql_file_path, 'r') as sql_file:
                 sql_script = sql_file.read()
-            print("SQL file read successfully.")
             c = self.conn.cursor()
-            print("Executing SQL script...")
             c.executescript(sql_script)
             self.conn.commit()
-            print("Tables created successfully.")
-        except sqlite3.Error as e:
-            print(f"Database error: {e}")
+            logger.debug("Tables from %s created.", sql_file_path)
+        except sqlite3.Error:
+            logger.exception("Database error while executing %s", sql_file_path)
         except FileNotFoundError:
-            print(f"Error: SQL file not found at {sql_file_path}")
+            logger.error("SQL file not found at %s", sql_file_path)
 
     def get_all_stations(self):
         """Query all rows in the Station table"""
@@ -51,86 +142,727 @@ class Database:
         rows = cur.fetchall()
         return rows
 
-    def insert_csv(self, csv_filepath, delimiter):
+
+    def upsert_stations(self, rows, source='stations'):
+        """
+        Inserts or updates station metadata in a single transaction.
+
+        :param rows: Tuples in the column order of STATION_COLUMNS.
+        :param source: Name of the source used in log messages.
+        :return: The number of written stations.
+        """
+        start = time.perf_counter()
+        key = NATURAL_KEYS['Station']
+        columns = STATION_COLUMNS
+        updates = ', '.join(f"{col} = excluded.{col}" for col in columns if col not in key)
+        sql = (f"INSERT INTO Station ({', '.join(columns)}) VALUES ({', '.join(['?'] * len(columns))}) "
+               f"ON CONFLICT ({', '.join(key)}) DO UPDATE SET {updates}")
+        rows = list(rows)
+        with self.conn:
+            self.conn.executemany(sql, rows)
+        station_ids = {int(row[0]) for row in rows}
+        for callback in list(self._station_listeners):
+            try:
+                callback(station_ids)
+            except Exception:
+                logger.exception("An error occurred in a station listener")
+
+        elapsed = time.perf_counter() - start
+        METRICS.inc("rows_inserted_total", len(rows), table='Station')
+        METRICS.observe("stage_seconds", elapsed, stage="stations")
+        METRICS.event("stations", os.path.basename(str(source)), rows=len(rows), seconds=round(elapsed, 4))
+        logger.info("Upserted %d stations from %s in %.3fs.", len(rows), source, elapsed)
+        return len(rows)
+
+    def get_station_heights(self, station_ids):
+        """Returns a dict mapping station ID to station height in meters (None if unknown)."""
+        station_ids = list(station_ids)
+        cur = self.conn.cursor()
+        cur.execute(
+            f"SELECT Station_ID, Stattionhoehe FROM Station "
+            f"WHERE Station_ID IN ({', '.join(['?'] * len(station_ids))})", station_ids
+        )
+        return dict(cur.fetchall())
+
+    def get_station_period(self, station_id):
+        """
+        Returns the (first_day, last_day) ISO dates of a station: the
+        von_datum/bis_datum of the Station table, widened to the measured
+        days. Both are None if neither is known.
+        """
+        cur = self.conn.cursor()
+        cur.execute(
+            f"SELECT MIN(day), MAX(day) FROM ("
+            f"SELECT {_ISO_DATE_SQL.format(col='von_datum')} AS day FROM Station WHERE Station_ID = ? "
+            f"UNION ALL SELECT {_ISO_DATE_SQL.format(col='bis_datum')} FROM Station WHERE Station_ID = ? "
+            f"UNION ALL SELECT MIN(MESS_DATUM) FROM Measurement WHERE Station_ID = ? "
+            f"UNION ALL SELECT MAX(MESS_DATUM) FROM Measurement WHERE Station_ID = ?)",
+            (station_id,) * 4
+        )
+        return cur.fetchone()
+
+    def get_station_row_count(self, station_id):
+        """Returns the number of Measurement rows of a station."""
+        cur = self.conn.cursor()
+        cur.execute("SELECT COUNT(*) FROM Measurement WHERE Station_ID = ?", (station_id,))
+        return cur.fetchone()[0]
+
+    def add_import_listener(self, callback):
+        """
+        Registers a callback invoked after measurements were committed. It
+        receives a dict mapping each written station ID (int) to the
+        (first_day, last_day) ISO date range written. Used to keep caches
+        and exports derived from Measurement up to date.
+        """
+        self._import_listeners.append(callback)
+
+    def remove_import_listener(self, callback):
+        self._import_listeners.remove(callback)
+
+    def add_station_listener(self, callback):
+        """
+        Registers a callback invoked after station metadata was committed by
+        upsert_stations. It receives the set of written station IDs. Used to
+        rebuild station indexes and drop cached series of moved stations.
+        """
+        self._station_listeners.append(callback)
+
+    def remove_station_listener(self, callback):
+        self._station_listeners.remove(callback)
+
+    def _notify_import(self, touched):
+        touched = {int(station_id): tuple(days) for station_id, days in touched.items()}
+        for callback in list(self._import_listeners):
+            try:
+                callback(touched)
+            except Exception:
+                logger.exception("An error occurred in an import listener")
+
+    def get_stations_version(self):
+        """
+        Returns a cheap fingerprint of the Station table that changes whenever
+        stations are added, removed or moved. Used to invalidate caches built
+        from get_all_stations, also when another process wrote the table.
+        """
+        cur = self.conn.cursor()
+        cur.execute("SELECT COUNT(*), MAX(Station_ID), TOTAL(geoBreite), TOTAL(geoLaenge) FROM Station")
+        return cur.fetchone()
+
+    @contextmanager
+    def bulk_load(self):
+        """
+        Context manager that tunes the connection for large imports.
+
+        Applies IMPORT_PRAGMAS on entry and restores the previous values on
+        exit. Nested calls are no-ops, so a whole import run can be wrapped
+        once while insert_csv(..., bulk=True) stays safe to call inside it.
+        """
+        if self._bulk_depth:
+            self._bulk_depth += 1
+            try:
+                yield
+            finally:
+                self._bulk_depth -= 1
+            return
+
+        # journal_mode cannot be changed inside an open transaction
+        self.conn.commit()
+        pragmas = dict(IMPORT_PRAGMAS)
+        if self.conn.execute("PRAGMA journal_mode").fetchone()[0] == 'wal':
+            # Leaving WAL needs exclusive access and would block the readers
+            del pragmas['journal_mode']
+        previous = {}
+        for name, value in pragmas.items():
+            previous[name] = self.conn.execute(f"PRAGMA {name}").fetchone()[0]
+            self.conn.execute(f"PRAGMA {name} = {value}")
+        self._bulk_depth = 1
+        try:
+            yield
+        finally:
+            self._bulk_depth = 0
+            self.conn.commit()
+            for name, value in previous.items():
+                self.conn.execute(f"PRAGMA {name} = {value}")
+
+    def insert_csv(self, csv_filepath, delimiter, bulk=False):
         """
         Reads data from a given CSV file path and inserts it into the
         'Station' or 'Measurement' table. It determines the target table by
         inspecting the CSV header.
+
+        Rows are written in batches of `batch_size` with executemany inside a
+        single transaction per file. If a batch hits an IntegrityError only
+        that batch is replayed row by row, so the offending rows can be
+        reported and skipped.
+
+        :param csv_filepath: Path of the CSV file to import.
+        :param delimiter: Field delimiter used in the CSV file.
+        :param bulk: Apply the import PRAGMAs (see bulk_load) for this file.
+        :return: The number of inserted rows.
         """
+        if bulk:
+            with self.bulk_load():
+                return self.insert_csv(csv_filepath, delimiter)
+
         try:
             with open(csv_filepath, 'r', encoding=self.file_encoding) as f:
                 reader = csv.reader(f, delimiter=delimiter)
                 header = [h.strip() for h in next(reader)]
+                return self.insert_records(header, reader, csv_filepath)
+
+        except FileNotFoundError:
+            logger.error("%s not found.", csv_filepath)
+        except Exception:
+            logger.exception("An error occurred while processing %s", csv_filepath)
+        METRICS.inc("failures_total", stage="import")
+        return 0
+
+    def insert_records(self, header, rows, source, bulk=False):
+        """
+        Inserts already split rows into the 'Station' or 'Measurement' table,
+        chosen by inspecting the header. This is the shared path behind
+        insert_csv and the streaming import, which feeds rows straight from a
+        zip archive without an intermediate CSV file.
+
+        :param header: Column names as found in the source file.
+        :param rows: Iterable of raw string field lists (e.g. a csv.reader).
+        :param source: Name of the source used in log messages.
+        :param bulk: Apply the import PRAGMAs (see bulk_load) for this call.
+        :return: The number of inserted rows.
+        """
+        if bulk:
+            with self.bulk_load():
+                return self.insert_records(header, rows, source)
 
-            # Determine table based on headers
-            if 'MESS_DATUM' in header and 'STATIONS_ID' in header:
-                table_name = 'Measurement'
-                
-                # Prepare header and SQL for Measurement data
-                # Map STATIONS_ID to Station_ID
-                db_header = [col if col != 'STATIONS_ID' else 'Station_ID' for col in header]
-                
-                # Filter out the 'eor' column if it exists
-                eor_index = -1
-                if 'eor' in db_header:
-                    eor_index = db_header.index('eor')
-                    del db_header[eor_index]
-
-                columns = ', '.join(db_header)
-                placeholders = ', '.join(['?'] * len(db_header))
-                sql = f"INSERT INTO {table_name} ({columns}) VALUES ({placeholders})"
-
-                with open(csv_filepath, 'r', encoding=self.file_encoding) as f:
-                    reader = csv.reader(f, delimiter=delimiter)
-                    next(reader)  # Skip header
-
-                    c = self.conn.cursor()
-                    for row in reader:
-                        if not row: continue # Skip empty rows
-                        
-                        # Remove 'eor' value from row if exists
-                        if eor_index != -1:
-                            del row[eor_index]
-
-                        # Clean row and handle configured na_value values
-                        cleaned_row = []
-                        for field in row:
-                            cleaned_field = field.strip()
-                            if cleaned_field == str(self.na_value) or cleaned_field == '':
-                                cleaned_row.append(None)
-                            else:
-                                cleaned_row.append(cleaned_field)
-                        
-                        try:
-                            c.execute(sql, cleaned_row)
-                        except sqlite3.IntegrityError as e:
-                            print(f"Skipping row due to IntegrityError: {e}")
-                    self.conn.commit()
-                    print(f"Data from {csv_filepath} successfully inserted into {table_name}.")
-
-            elif 'Stationsname' in header:
-                # Existing logic for station files
-                table_name = 'Station'
-                sql = f"INSERT INTO Station ({', '.join(header)}) VALUES ({', '.join(['?'] * len(header))})"
-                with open(csv_filepath, 'r', encoding=self.file_encoding) as f:
-                    reader = csv.reader(f, delimiter=delimiter)
-                    next(reader)  # Skip header
-                    c = self.conn.cursor()
-                    for row in reader:
-                        cleaned_row = [field.strip() for field in row]
-                        for i, field in enumerate(cleaned_row):
-                            if field == '': cleaned_row[i] = None
-                        try:
-                            c.execute(sql, cleaned_row)
-                        except sqlite3.IntegrityError as e:
-                            print(f"Skipping row due to IntegrityError: {e}")
-                    self.conn.commit()
-                    print(f"Data from {csv_filepath} successfully inserted into {table_name}.")
+        # Determine table based on headers
+        if 'MESS_DATUM' in header and 'STATIONS_ID' in header:
+            table_name = 'Measurement'
+
+            # Prepare header and SQL for Measurement data
+            # Map STATIONS_ID to Station_ID
+            db_header = [col if col != 'STATIONS_ID' else 'Station_ID' for col in header]
+
+            # Filter out the 'eor' column if it exists
+            eor_index = -1
+            if 'eor' in db_header:
+                eor_index = db_header.index('eor')
+                del db_header[eor_index]
+            na_tokens = {str(self.na_value), ''}
+
+        elif 'Stationsname' in header:
+            table_name = 'Station'
+            db_header = header
+            eor_index = -1
+            na_tokens = {''}
+        else:
+            logger.error("Cannot determine table for %s. Headers: %s", source, header)
+            METRICS.inc("failures_total", stage="import")
+            return 0
+
+        start = time.perf_counter()
+        date_indices = [i for i, col in enumerate(db_header) if col in DATE_COLUMNS]
+        cleaned = self._clean_rows(rows, eor_index, na_tokens, date_indices)
+        return self._write_rows(table_name, db_header, cleaned, source, start)
+
+    def insert_columns(self, header, columns, source):
+        """
+        Inserts measurements given column-wise, as produced by
+        processor.parse_columns in the parallel pipeline.
+
+        :param header: Column names as found in the source file, without 'eor'.
+        :param columns: One sequence per header column (e.g. NumPy arrays) of
+                        equal length. MESS_DATUM holds YYYYMMDD integers and
+                        missing values are NaN or None.
+        :param source: Name of the source used in log messages.
+        :return: The number of inserted rows.
+        """
+        if 'MESS_DATUM' not in header or 'STATIONS_ID' not in header:
+            logger.error("Cannot determine table for %s. Headers: %s", source, header)
+            METRICS.inc("failures_total", stage="import")
+            return 0
+
+        start = time.perf_counter()
+        db_header = [col if col != 'STATIONS_ID' else 'Station_ID' for col in header]
+        values = []
+        for col, column in zip(db_header, columns):
+            if getattr(column, 'dtype', None) == 'float32':
+                # Round trip through the shortest decimal repr, so 0.1 is stored as 0.1 and not 0.10000000149
+                column = column.astype(str).astype('float64')
+            column = column.tolist() if hasattr(column, 'tolist') else list(column)
+            if col in DATE_COLUMNS:
+                column = [None if day is None else to_iso_date(int(day)) for day in column]
             else:
-                print(f"Error: Cannot determine table for CSV {csv_filepath}. Headers: {header}")
-                return
+                # NaN is the only value not equal to itself
+                column = [None if value is None or value != value else value for value in column]
+            values.append(column)
+        return self._write_rows('Measurement', db_header, zip(*values), source, start)
 
-        except FileNotFoundError:
-            print(f"Error: {csv_filepath} not found.")
-        except Exception as e:
-            print(f"An error occurred while processing {csv_filepath}: {e}")
+    def _write_rows(self, table_name, db_header, cleaned, source, start):
+        """Inserts cleaned rows, keeps rollups and import listeners up to date and records metrics."""
+        sql = self._insert_sql(table_name, db_header)
+        touched = {}
+        if table_name == 'Measurement':
+            cleaned = self._track_ranges(cleaned, db_header.index('Station_ID'),
+                                         db_header.index('MESS_DATUM'), touched)
+        inserted = self.insert_rows(sql, cleaned)
+        if touched:
+            if self.maintain_rollups:
+                self.refresh_rollups(touched)
+            self._notify_import(touched)
+        elapsed = time.perf_counter() - start
+
+        rate = inserted / elapsed if elapsed > 0 else float('inf')
+        METRICS.inc("rows_inserted_total", inserted, table=table_name)
+        METRICS.inc("files_total", stage="import")
+        METRICS.observe("stage_seconds", elapsed, stage="import")
+        METRICS.event("import", os.path.basename(str(source)), table=table_name, rows=inserted,
+                      seconds=round(elapsed, 4), rows_per_s=round(rate))
+        return inserted
+
+    def _insert_sql(self, table_name, db_header):
+        """Builds the INSERT statement for the configured import mode."""
+        columns = ', '.join(db_header)
+        placeholders = ', '.join(['?'] * len(db_header))
+        if self.import_mode == 'ignore':
+            return f"INSERT OR IGNORE INTO {table_name} ({columns}) VALUES ({placeholders})"
+        if self.import_mode == 'replace':
+            return f"INSERT OR REPLACE INTO {table_name} ({columns}) VALUES ({placeholders})"
+        sql = f"INSERT INTO {table_name} ({columns}) VALUES ({placeholders})"
+        if self.import_mode == 'upsert':
+            key = NATURAL_KEYS[table_name]
+            updates = ', '.join(f"{col} = excluded.{col}" for col in db_header if col not in key)
+            action = f"DO UPDATE SET {updates}" if updates else "DO NOTHING"
+            sql += f" ON CONFLICT ({', '.join(key)}) {action}"
+        return sql
+
+    @staticmethod
+    def _clean_rows(reader, eor_index, na_tokens, date_indices=()):
+        """
+        Strips fields, drops the 'eor' column, maps NA tokens to None and
+        converts YYYYMMDD date fields to ISO dates.
+        """
+        for row in reader:
+            if not row:
+                continue  # Skip empty rows
+            if eor_index != -1:
+                del row[eor_index]
+            cleaned = [None if field in na_tokens else field
+                       for field in (value.strip() for value in row)]
+            for i in date_indices:
+                field = cleaned[i]
+                if field is not None and len(field) == 8:
+                    cleaned[i] = f"{field[:4]}-{field[4:6]}-{field[6:]}"
+            yield cleaned
+
+    @staticmethod
+    def _track_ranges(rows, station_index, date_index, touched):
+        """Passes rows through while recording the first and last day per station in `touched`."""
+        for row in rows:
+            station_id, day = row[station_index], row[date_index]
+            known = touched.get(station_id)
+            if day is None:
+                pass
+            elif known is None:
+                touched[station_id] = [day, day]
+            elif day < known[0]:
+                known[0] = day
+            elif day > known[1]:
+                known[1] = day
+            yield row
+
+    def insert_rows(self, sql, rows):
+        """
+        Inserts an iterable of parameter rows with `sql` in batches and
+        commits once at the end.
+
+        :return: The number of rows actually inserted.
+        """
+        c = self.conn.cursor()
+        if not self.conn.in_transaction:
+            c.execute("BEGIN")
+        inserted = 0
+        batch = []
+        try:
+            for row in rows:
+                batch.append(row)
+                if len(batch) >= self.batch_size:
+                    inserted += self._execute_batch(c, sql, batch)
+                    batch = []
+            if batch:
+                inserted += self._execute_batch(c, sql, batch)
+        except Exception:
+            self.conn.rollback()
+            raise
+        with METRICS.timer("commit_seconds"):
+            self.conn.commit()
+        return inserted
+
+    @staticmethod
+    def _execute_batch(cursor, sql, batch):
+        """
+        Runs executemany for one batch inside a savepoint. On IntegrityError
+        the batch is rolled back and replayed row by row, skipping bad rows.
+        """
+        cursor.execute("SAVEPOINT batch")
+        try:
+            cursor.executemany(sql, batch)
+            inserted = len(batch)
+        except sqlite3.IntegrityError:
+            cursor.execute("ROLLBACK TO batch")
+            inserted = 0
+            for row in batch:
+                try:
+                    cursor.execute(sql, row)
+                    inserted += 1
+                except sqlite3.IntegrityError as e:
+                    logger.warning("Skipping row due to IntegrityError: %s", e)
+                    METRICS.inc("rows_skipped_total")
+        cursor.execute("RELEASE batch")
+        return inserted
+
+    def migrate_measurement_layout(self, sql_file_path):
+        """
+        Converts a database created before the clustered Measurement layout:
+        the old table (surrogate m_ID, YYYYMMDD dates) is copied into the
+        WITHOUT ROWID table from `sql_file_path` with ISO dates. Duplicate
+        (Station_ID, MESS_DATUM) rows are dropped, keeping the first one.
+        Station dates are converted in place.
+
+        :return: True if a migration was performed.
+        """
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(Measurement)")]
+        if 'm_ID' not in columns:
+            return False
+
+        logger.info("Migrating Measurement table to the clustered layout...")
+        data_columns = [col for col in columns if col != 'm_ID']
+        select = ', '.join(_ISO_DATE_SQL.format(col=col) if col in DATE_COLUMNS else col
+                           for col in data_columns)
+        self.conn.commit()
+        self.conn.execute("ALTER TABLE Measurement RENAME TO Measurement_legacy")
+        self.create_tables(sql_file_path)
+        c = self.conn.execute(
+            f"INSERT OR IGNORE INTO Measurement ({', '.join(data_columns)}) "
+            f"SELECT {select} FROM Measurement_legacy ORDER BY m_ID"
+        )
+        logger.info("Copied %d measurements.", c.rowcount)
+        for col in ('von_datum', 'bis_datum'):
+            self.conn.execute(f"UPDATE Station SET {col} = {_ISO_DATE_SQL.format(col=col)}")
+        self.conn.execute("DROP TABLE Measurement_legacy")
+        self.conn.commit()
+        return True
+
+    def get_measurements(self, station_ids, start=None, end=None, columns=MEASUREMENT_COLUMNS):
+        """
+        Query measurements of the given stations within a date range.
+
+        Served by a range scan on the clustered (Station_ID, MESS_DATUM) key.
+
+        :param station_ids: A single station ID or an iterable of station IDs.
+        :param start: First day (inclusive) as date, 'YYYYMMDD' or 'YYYY-MM-DD'; None for open.
+        :param end: Last day (inclusive), same formats as start; None for open.
+        :param columns: Measurement columns to return (see MEASUREMENT_COLUMNS).
+        :return: A list of tuples (Station_ID, MESS_DATUM, *columns) ordered by station and date.
+        """
+        if isinstance(station_ids, int):
+            station_ids = [station_ids]
+        station_ids = list(station_ids)
+        unknown = [col for col in columns if col not in MEASUREMENT_COLUMNS]
+        if unknown:
+            raise ValueError(f"Unknown measurement columns: {unknown}")
+        if not station_ids:
+            return []
+
+        sql = (f"SELECT {', '.join(('Station_ID', 'MESS_DATUM') + tuple(columns))} FROM Measurement "
+               f"WHERE Station_ID IN ({', '.join(['?'] * len(station_ids))})")
+        params = station_ids
+        if start is not None:
+            sql += " AND MESS_DATUM >= ?"
+            params.append(to_iso_date(start))
+        if end is not None:
+            sql += " AND MESS_DATUM <= ?"
+            params.append(to_iso_date(end))
+        sql += " ORDER BY Station_ID, MESS_DATUM"
+
+        cur = self.conn.cursor()
+        cur.execute(sql, params)
+        return cur.fetchall()
+
+    def get_manifest(self):
+        """
+        Returns the ingestion manifest as a dict mapping archive name to a
+        (size, content_hash) tuple.
+        """
+        cur = self.conn.execute("SELECT archive_name, size, content_hash FROM IngestionManifest")
+        return {name: (size, content_hash) for name, size, content_hash in cur.fetchall()}
+
+    def record_archive(self, archive_name, size, content_hash, rows):
+        """Records a successfully imported archive in the ingestion manifest."""
+        self.conn.execute(
+            "INSERT INTO IngestionManifest (archive_name, size, content_hash, rows, imported_at) "
+            "VALUES (?, ?, ?, ?, datetime('now')) "
+            "ON CONFLICT (archive_name) DO UPDATE SET size = excluded.size, "
+            "content_hash = excluded.content_hash, rows = excluded.rows, imported_at = excluded.imported_at",
+            (archive_name, size, content_hash, rows)
+        )
+        self.conn.commit()
+
+    def get_station_last_days(self):
+        """
+        Returns a dict mapping station ID to the last imported day (ISO date)
+        from either the historical or the recent archives.
+        """
+        cur = self.conn.execute(
+            "SELECT Station_ID, MAX(COALESCE(historical_end, ''), COALESCE(recent_end, '')) FROM StationIngestState"
+        )
+        return {station_id: last for station_id, last in cur.fetchall() if last}
+
+    def update_station_state(self, touched, kind):
+        """
+        Advances the ingestion state of the touched stations.
+
+        A historical import also forgets recent days it now covers: in the
+        'upsert' and 'replace' import modes they were overwritten with the
+        historical values.
+
+        :param touched: A dict mapping station ID to a (first_day, last_day) pair of ISO dates,
+                        as passed to import listeners.
+        :param kind: 'historical' or 'recent', the archives the days were imported from.
+        """
+        if kind == 'historical':
+            sql = (
+                "INSERT INTO StationIngestState (Station_ID, historical_end, updated_at) "
+                "VALUES (?, ?, datetime('now')) "
+                "ON CONFLICT (Station_ID) DO UPDATE SET "
+                "historical_end = MAX(COALESCE(historical_end, ''), excluded.historical_end), "
+                "recent_end = CASE WHEN recent_end > excluded.historical_end THEN recent_end END, "
+                "updated_at = excluded.updated_at"
+            )
+        elif kind == 'recent':
+            sql = (
+                "INSERT INTO StationIngestState (Station_ID, recent_end, updated_at) "
+                "VALUES (?, ?, datetime('now')) "
+                "ON CONFLICT (Station_ID) DO UPDATE SET "
+                "recent_end = MAX(COALESCE(recent_end, ''), excluded.recent_end), "
+                "updated_at = excluded.updated_at"
+            )
+        else:
+            raise ValueError(f"Unknown archive kind '{kind}'. Expected 'historical' or 'recent'.")
+        self.conn.executemany(sql, [(station_id, last) for station_id, (_, last) in touched.items()])
+        self.conn.commit()
+
+    def ensure_station_state(self):
+        """
+        Builds the ingestion state once for databases that have measurements
+        but no state yet, treating all stored days as historical.
+        """
+        cur = self.conn.cursor()
+        cur.execute("SELECT EXISTS (SELECT 1 FROM Measurement), EXISTS (SELECT 1 FROM StationIngestState)")
+        has_measurements, has_state = cur.fetchone()
+        if has_measurements and not has_state:
+            cur.execute("SELECT Station_ID, MIN(MESS_DATUM), MAX(MESS_DATUM) FROM Measurement GROUP BY Station_ID")
+            touched = {station_id: (first, last) for station_id, first, last in cur.fetchall()}
+            self.update_station_state(touched, 'historical')
+            logger.info("Built the ingestion state of %d stations.", len(touched))
+
+    def get_cached_geocodes(self, address_keys):
+        """
+        Looks up persisted geocoding results.
+
+        :return: A dict mapping address key to (latitude, longitude, cached_at).
+        """
+        address_keys = list(address_keys)
+        result = {}
+        cur = self.conn.cursor()
+        # stay below SQLite's limit of bound parameters
+        for i in range(0, len(address_keys), 500):
+            chunk = address_keys[i:i + 500]
+            cur.execute(
+                f"SELECT address_key, latitude, longitude, cached_at FROM GeocodeCache "
+                f"WHERE address_key IN ({', '.join(['?'] * len(chunk))})", chunk
+            )
+            for key, lat, lon, cached_at in cur.fetchall():
+                result[key] = (lat, lon, cached_at)
+        return result
+
+    def store_geocodes(self, entries):
+        """
+        Persists geocoding results.
+
+        :param entries: Iterable of (address_key, latitude, longitude, cached_at); None coordinates mark a miss.
+        """
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO GeocodeCache (address_key, latitude, longitude, cached_at) VALUES (?, ?, ?, ?)",
+            entries
+        )
+        self.conn.commit()
+
+    def refresh_rollups(self, touched):
+        """
+        Recomputes the monthly and yearly rollups of the given stations, only
+        for the months and years overlapping the given day ranges.
+
+        :param touched: A dict mapping station ID to a (first_day, last_day) pair of ISO dates.
+        """
+        aggregates = ', '.join(f"SUM({col}), COUNT({col}), MIN({col}), MAX({col})" for col in ROLLUP_COLUMNS)
+        combined = ', '.join(f"SUM({col}_sum), SUM({col}_count), MIN({col}_min), MAX({col}_max)"
+                             for col in ROLLUP_COLUMNS)
+        targets = ', '.join(f"{col}_sum, {col}_count, {col}_min, {col}_max" for col in ROLLUP_COLUMNS)
+        monthly_sql = (
+            f"INSERT OR REPLACE INTO MonthlyRollup (Station_ID, period, days, {targets}) "
+            f"SELECT Station_ID, substr(MESS_DATUM, 1, 7), COUNT(*), {aggregates} FROM Measurement "
+            f"WHERE Station_ID = ? AND MESS_DATUM BETWEEN ? AND ? GROUP BY Station_ID, substr(MESS_DATUM, 1, 7)"
+        )
+        yearly_sql = (
+            f"INSERT OR REPLACE INTO YearlyRollup (Station_ID, period, days, {targets}) "
+            f"SELECT Station_ID, substr(period, 1, 4), SUM(days), {combined} FROM MonthlyRollup "
+            f"WHERE Station_ID = ? AND period BETWEEN ? AND ? GROUP BY Station_ID, substr(period, 1, 4)"
+        )
+        c = self.conn.cursor()
+        for station_id, (first, last) in touched.items():
+            # '-31' sorts after every day of the month, '-12' after every month of the year
+            c.execute(monthly_sql, (station_id, first[:7] + '-01', last[:7] + '-31'))
+            c.execute(yearly_sql, (station_id, first[:4] + '-01', last[:4] + '-12'))
+        self.conn.commit()
+
+    def rebuild_rollups(self):
+        """Recomputes all rollups from the Measurement table."""
+        cur = self.conn.cursor()
+        cur.execute("SELECT Station_ID, MIN(MESS_DATUM), MAX(MESS_DATUM) FROM Measurement GROUP BY Station_ID")
+        touched = {station_id: (first, last) for station_id, first, last in cur.fetchall()}
+        self.refresh_rollups(touched)
+        logger.info("Rebuilt rollups for %d stations.", len(touched))
+
+    def ensure_rollups(self):
+        """Builds the rollups once for databases that have measurements but no rollups yet."""
+        cur = self.conn.cursor()
+        cur.execute("SELECT EXISTS (SELECT 1 FROM Measurement), EXISTS (SELECT 1 FROM MonthlyRollup)")
+        has_measurements, has_rollups = cur.fetchone()
+        if has_measurements and not has_rollups:
+            self.rebuild_rollups()
+
+    def get_rollups(self, station_ids, level='month', start=None, end=None, columns=ROLLUP_COLUMNS):
+        """
+        Query the per period rollups of the given stations.
+
+        :param level: 'month' or 'year'.
+        :param start: First period ('YYYY-MM' for months, 'YYYY' for years), None for open.
+        :param end: Last period (inclusive), None for open.
+        :param columns: Rollup columns (see ROLLUP_COLUMNS).
+        :return: A list of tuples (Station_ID, period, days, then sum, count, min, max per column)
+                 ordered by station and period.
+        """
+        table = self._rollup_table(level, columns)
+        station_ids = [station_ids] if isinstance(station_ids, int) else list(station_ids)
+        fields = ', '.join(f"{col}_sum, {col}_count, {col}_min, {col}_max" for col in columns)
+        sql = (f"SELECT Station_ID, period, days, {fields} FROM {table} "
+               f"WHERE Station_ID IN ({', '.join(['?'] * len(station_ids))})")
+        params = station_ids
+        if start is not None:
+            sql += " AND period >= ?"
+            params.append(str(start))
+        if end is not None:
+            sql += " AND period <= ?"
+            params.append(str(end))
+        sql += " ORDER BY Station_ID, period"
+        cur = self.conn.cursor()
+        cur.execute(sql, params)
+        return cur.fetchall()
+
+    def get_rollup_aggregates(self, station_ids, level, periods, columns=ROLLUP_COLUMNS):
+        """
+        Combines the rollups of the given periods per station.
+
+        :param periods: Iterable of periods ('YYYY-MM' or 'YYYY' depending on level).
+        :return: A dict mapping station ID to a tuple (days, then sum, count, min, max per column).
+        """
+        table = self._rollup_table(level, columns)
+        station_ids, periods = list(station_ids), list(periods)
+        if not station_ids or not periods:
+            return {}
+        fields = ', '.join(f"SUM({col}_sum), SUM({col}_count), MIN({col}_min), MAX({col}_max)" for col in columns)
+        cur = self.conn.cursor()
+        cur.execute(
+            f"SELECT Station_ID, SUM(days), {fields} FROM {table} "
+            f"WHERE Station_ID IN ({', '.join(['?'] * len(station_ids))}) "
+            f"AND period IN ({', '.join(['?'] * len(periods))}) GROUP BY Station_ID",
+            station_ids + periods
+        )
+        return {row[0]: row[1:] for row in cur.fetchall()}
+
+    def get_measurement_aggregates(self, station_ids, start, end, columns=ROLLUP_COLUMNS):
+        """
+        Aggregates raw measurements of a date range per station.
+
+        :return: A dict mapping station ID to a tuple (days, then sum, count, min, max per column).
+        """
+        unknown = [col for col in columns if col not in MEASUREMENT_COLUMNS]
+        if unknown:
+            raise ValueError(f"Unknown measurement columns: {unknown}")
+        station_ids = list(station_ids)
+        if not station_ids:
+            return {}
+        fields = ', '.join(f"SUM({col}), COUNT({col}), MIN({col}), MAX({col})" for col in columns)
+        cur = self.conn.cursor()
+        cur.execute(
+            f"SELECT Station_ID, COUNT(*), {fields} FROM Measurement "
+            f"WHERE Station_ID IN ({', '.join(['?'] * len(station_ids))}) "
+            f"AND MESS_DATUM BETWEEN ? AND ? GROUP BY Station_ID",
+            station_ids + [to_iso_date(start), to_iso_date(end)]
+        )
+        return {row[0]: row[1:] for row in cur.fetchall()}
+
+    def get_grouped_aggregates(self, station_ids, start, end, group_by, columns=(), thresholds=(),
+                               quality_levels=None):
+        """
+        Aggregates raw measurements per station and period in one SQL pass.
+
+        :param group_by: 'year', 'month' or 'day_of_year' (see GROUP_KEYS).
+        :param columns: Columns aggregated as sum, count, min and max.
+        :param thresholds: (column, operator, value) tuples, e.g. ('TNK', '<', 0). For each the
+                           number of days meeting the condition is counted.
+        :param quality_levels: If given, only values whose quality flag (see QUALITY_FLAGS) is
+                               one of these levels are used; values without a flag are dropped.
+        :return: A list of tuples (Station_ID, period, then sum, count, min, max per column, then
+                 one count per threshold), ordered by station and period.
+        """
+        if group_by not in GROUP_KEYS:
+            raise ValueError(f"Unknown grouping '{group_by}'. Expected one of {tuple(GROUP_KEYS)}.")
+        unknown = [col for col in list(columns) + [t[0] for t in thresholds] if col not in QUALITY_FLAGS]
+        if unknown:
+            raise ValueError(f"Unknown measurement columns: {unknown}")
+        operators = [t[1] for t in thresholds if t[1] not in THRESHOLD_OPERATORS]
+        if operators:
+            raise ValueError(f"Unknown threshold operators: {operators}. Expected one of {THRESHOLD_OPERATORS}.")
+        station_ids = list(station_ids)
+        if not station_ids:
+            return []
+
+        def value(col):
+            if quality_levels is None:
+                return col
+            levels = ', '.join(str(int(level)) for level in quality_levels)
+            return f"CASE WHEN {QUALITY_FLAGS[col]} IN ({levels}) THEN {col} END"
+
+        fields = [f"SUM({v}), COUNT({v}), MIN({v}), MAX({v})" for v in map(value, columns)]
+        fields += [f"SUM({value(col)} {op} ?)" for col, op, _ in thresholds]
+        if not fields:
+            raise ValueError("At least one column or threshold is required.")
+        key = GROUP_KEYS[group_by]
+        cur = self.conn.cursor()
+        cur.execute(
+            f"SELECT Station_ID, {key} AS period, {', '.join(fields)} FROM Measurement "
+            f"WHERE Station_ID IN ({', '.join(['?'] * len(station_ids))}) "
+            f"AND MESS_DATUM BETWEEN ? AND ? GROUP BY Station_ID, period ORDER BY Station_ID, period",
+            [threshold for _, _, threshold in thresholds] + station_ids + [to_iso_date(start), to_iso_date(end)]
+        )
+        return cur.fetchall()
+
+    @staticmethod
+    def _rollup_table(level, columns):
+        if level not in ROLLUP_TABLES:
+            raise ValueError(f"Unknown rollup level '{level}'. Expected one of {tuple(ROLLUP_TABLES)}.")
+        unknown = [col for col in columns if col not in ROLLUP_COLUMNS]
+        if unknown:
+            raise ValueError(f"Columns without rollups: {unknown}")
+        return ROLLUP_TABLES[level]
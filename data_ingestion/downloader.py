@@ -1,45 +1,221 @@
 import requests
+from requests.adapters import HTTPAdapter
 import re
 import os
+import hashlib
+import time
+import logging
+from .archive_cache import ArchiveCache
+from .metrics import METRICS
+
+logger = logging.getLogger(__name__)
 
 class Downloader:
-    """Handles downloading data files from a given URL."""
-    def __init__(self, url, download_dir):
+    """
+    Handles downloading data files from a given URL.
+
+    Files are written to a temporary '.part' file, checked against the
+    announced length and renamed into place, so an interrupted download
+    never leaves a truncated archive behind. With an ArchiveCache (whose
+    directory should be `download_dir`), files and the index page are
+    revalidated with conditional GETs instead of being downloaded again,
+    and interrupted downloads are resumed with Range requests.
+    """
+    def __init__(self, url, download_dir, session=None, cache: ArchiveCache = None):
         self.url = url
         self.download_dir = download_dir
+        # A shared requests.Session reuses pooled connections across files.
+        # Without one, every request opens a fresh connection.
+        self.http = session if session is not None else requests
+        self.cache = cache
+
+    @staticmethod
+    def create_session(pool_size=10, retries=3):
+        """Creates a requests.Session with a connection pool sized for `pool_size` parallel downloads."""
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retries)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
 
     def get_file_urls(self, pattern):
         """Gets all the file urls from the server that match the pattern."""
-        print(f"Fetching file list from {self.url}...")
-        response = requests.get(self.url)
-        response.raise_for_status()
+        logger.info("Fetching file list from %s", self.url)
+        with METRICS.timer("index_fetch_seconds"):
+            text = self._fetch_index()
 
-        file_names = re.findall(pattern, response.text)
+        file_names = re.findall(pattern, text)
         file_urls = [self.url + file_name for file_name in file_names]
-        print(f"Found {len(file_urls)} files matching the pattern.")
+        logger.info("Found %d files matching the pattern.", len(file_urls))
         return file_urls
 
+    def _fetch_index(self):
+        """Returns the index page, revalidating a cached copy if there is one."""
+        if self.cache is None:
+            response = self.http.get(self.url)
+            response.raise_for_status()
+            return response.text
+
+        cache_path = self.cache.path(self.url)
+        response = self.http.get(self.url, headers=self.cache.conditional_headers(self.url))
+        if response.status_code == 304:
+            logger.info("File list is unchanged since the last run.")
+            METRICS.inc("download_cache_total", result="hit")
+            self.cache.touch(self.url)
+            self.cache.flush()
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                return f.read()
+        response.raise_for_status()
+        METRICS.inc("download_cache_total", result="miss")
+        content = response.content
+        with open(cache_path + '.part', 'wb') as f:
+            f.write(content)
+        os.replace(cache_path + '.part', cache_path)
+        self.cache.store(self.url, len(content), response.headers.get('ETag'),
+                         response.headers.get('Last-Modified'), hashlib.sha256(content).hexdigest())
+        return content.decode('utf-8', errors='replace')
+
     def download_file(self, url):
-        """Downloads a single file from a URL into a specified directory."""
-        if not os.path.exists(self.download_dir):
-            os.makedirs(self.download_dir)
+        """
+        Downloads a single file from a URL into the download directory.
+
+        Without a cache an existing file is kept. With a cache, a cached copy
+        is revalidated and only downloaded again if it changed on the server,
+        and a partial download of the same version is resumed. The returned
+        file is pinned in the cache until ArchiveCache.release is called.
+
+        :return: The local path, or None if the download failed.
+        """
+        # exist_ok: several pipeline workers may get here at the same time
+        os.makedirs(self.download_dir, exist_ok=True)
 
         file_name = url.split('/')[-1]
-        local_path = os.path.join(self.download_dir, file_name)
+        if self.cache is not None:
+            local_path = self.cache.path(url)
+            os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        else:
+            local_path = os.path.join(self.download_dir, file_name)
+        part_path = local_path + '.part'
 
-        if os.path.exists(local_path):
-            print(f"File {file_name} already exists. Skipping.")
+        if self.cache is None and os.path.exists(local_path):
+            logger.info("File %s already exists. Skipping.", file_name)
+            METRICS.inc("files_skipped_total", stage="download")
             return local_path
 
-        print(f"Downloading {url}...")
+        headers = {}
+        offset = 0
+        if self.cache is not None:
+            # Pinned before the request, so the copy is not evicted while it is revalidated
+            self.cache.pin(local_path)
+        keep_pin = False
         try:
-            response = requests.get(url, stream=True)
+            if self.cache is not None:
+                headers.update(self.cache.conditional_headers(url))
+                validator = self.cache.partial(url)
+                if validator and os.path.exists(part_path):
+                    offset = os.path.getsize(part_path)
+                    headers['Range'] = f"bytes={offset}-"
+                    headers['If-Range'] = validator
+
+            logger.debug("Downloading %s", url)
+            start = time.perf_counter()
+            try:
+                result = self._fetch(url, local_path, part_path, headers, offset)
+            except requests.exceptions.RequestException as e:
+                logger.error("Failed to download %s: %s", url, e)
+                result = None
+            if result is None:
+                METRICS.inc("failures_total", stage="download")
+                return None
+            keep_pin = True
+        finally:
+            # Only a returned file stays pinned; any other exit, including errors, releases it
+            if self.cache is not None and not keep_pin:
+                self.cache.release(local_path)
+
+        if result == 'not_modified':
+            logger.info("File %s is unchanged since it was cached.", file_name)
+            METRICS.inc("download_cache_total", result="hit")
+            self.cache.touch(url)
+            return local_path
+
+        size, resumed = result
+        elapsed = time.perf_counter() - start
+        if self.cache is not None:
+            METRICS.inc("download_cache_total", result="resumed" if resumed else "miss")
+        METRICS.inc("bytes_downloaded_total", size)
+        METRICS.inc("files_total", stage="download")
+        METRICS.observe("stage_seconds", elapsed, stage="download")
+        METRICS.event("download", file_name, bytes=size, seconds=round(elapsed, 4))
+        return local_path
+
+    def _fetch(self, url, local_path, part_path, headers, offset):
+        """
+        Runs the GET of download_file.
+
+        :return: 'not_modified' for a 304, None if the file is incomplete, otherwise
+                 a tuple (bytes received, whether a partial download was resumed).
+        """
+        response = self.http.get(url, stream=True, headers=headers)
+        try:
+            if response.status_code == 304 and self.cache is not None:
+                return 'not_modified'
+            if response.status_code == 416 and 'Range' in headers:
+                # The partial file is not a prefix of the current version; start over
+                return self._restart(url, local_path, part_path, headers)
             response.raise_for_status()
-            with open(local_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
+
+            length = response.headers.get('Content-Length')
+            if response.status_code == 206:
+                # Content-Range: bytes <first>-<last>/<total>
+                content_range = response.headers.get('Content-Range', '')
+                match = re.match(r'bytes (\d+)-\d+/(\d+)', content_range)
+                if not match or int(match.group(1)) != offset:
+                    logger.warning("Unexpected Content-Range '%s' for %s.", content_range, url)
+                    return self._restart(url, local_path, part_path, headers)
+                expected = int(match.group(2))
+                mode = 'ab'
+            else:
+                expected = int(length) if length is not None else None
+                offset = 0
+                mode = 'wb'
+
+            etag = response.headers.get('ETag')
+            last_modified = response.headers.get('Last-Modified')
+            if self.cache is not None:
+                # Weak ETags must not be used for range requests
+                strong_etag = etag if etag and not etag.startswith('W/') else None
+                self.cache.store_partial(url, strong_etag or last_modified)
+
+            digest = hashlib.sha256()
+            if mode == 'ab':
+                with open(part_path, 'rb') as f:
+                    for chunk in iter(lambda: f.read(1 << 20), b''):
+                        digest.update(chunk)
+            size = 0
+            with open(part_path, mode) as f:
+                for chunk in response.iter_content(chunk_size=65536):
                     f.write(chunk)
-            print(f"Successfully downloaded {file_name}")
-            return local_path
-        except requests.exceptions.RequestException as e:
-            print(f"Failed to download {url}. Error: {e}")
+                    digest.update(chunk)
+                    size += len(chunk)
+        finally:
+            # hand the connection back to the pool
+            response.close()
+
+        total = os.path.getsize(part_path)
+        if expected is not None and total != expected:
+            logger.error("Download of %s is incomplete: %d of %d bytes.", url, total, expected)
+            if total > expected or self.cache is None:
+                os.remove(part_path)
             return None
+        os.replace(part_path, local_path)
+        if self.cache is not None:
+            self.cache.store(url, total, etag, last_modified, digest.hexdigest())
+        return size, mode == 'ab'
+
+    def _restart(self, url, local_path, part_path, headers):
+        """Drops a partial download that cannot be resumed and downloads the whole file."""
+        os.remove(part_path)
+        self.cache.store_partial(url, None)
+        headers = {name: value for name, value in headers.items() if name not in ('Range', 'If-Range')}
+        return self._fetch(url, local_path, part_path, headers, 0)
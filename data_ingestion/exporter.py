@@ -0,0 +1,125 @@
+import os
+import json
+import shutil
+import logging
+import numpy as np
+from .database import Database, MEASUREMENT_COLUMNS
+from .metrics import METRICS
+
+try:
+    import pyarrow as pa
+except ImportError:  # optional, falls back to .npy files
+    pa = None
+
+logger = logging.getLogger(__name__)
+
+
+class ColumnarExporter:
+    """
+    Exports each station's measurements to a columnar on-disk format for
+    fast analytics (see backend.columnar.ColumnarStore).
+
+    Every column is a dense float32 array indexed by the day offset from the
+    station's first day, with NaN for missing days and values. Stations are
+    written as an uncompressed Arrow IPC file `<station_id>.arrow` when
+    pyarrow is installed, otherwise as a directory `<station_id>/` with one
+    `.npy` file per column and a `meta.json`. Both formats can be memory
+    mapped without decoding.
+    """
+    def __init__(self, db: Database, export_dir, file_format='auto'):
+        """
+        :param file_format: 'arrow', 'npy' or 'auto' (arrow if pyarrow is available).
+        """
+        if file_format == 'auto':
+            file_format = 'arrow' if pa is not None else 'npy'
+        if file_format == 'arrow' and pa is None:
+            raise ValueError("The arrow export format requires pyarrow.")
+        if file_format not in ('arrow', 'npy'):
+            raise ValueError(f"Unknown export format '{file_format}'. Expected 'arrow', 'npy' or 'auto'.")
+        self.db = db
+        self.export_dir = export_dir
+        self.file_format = file_format
+
+    def export_stations(self, station_ids):
+        """Exports the given stations; returns the number of exported stations."""
+        os.makedirs(self.export_dir, exist_ok=True)
+        exported = 0
+        for station_id in sorted(station_ids):
+            if self.export_station(station_id):
+                exported += 1
+        logger.info("Exported %d stations to %s (%s).", exported, self.export_dir, self.file_format)
+        return exported
+
+    def export_all(self):
+        """Exports every station that has measurements."""
+        cur = self.db.conn.cursor()
+        cur.execute("SELECT DISTINCT Station_ID FROM Measurement")
+        return self.export_stations(row[0] for row in cur.fetchall())
+
+    def export_station(self, station_id):
+        """
+        Writes one station. The files are written under a temporary name and
+        moved into place, so readers never see a half written station.
+
+        :return: True if the station had measurements and was exported.
+        """
+        with METRICS.timer("stage_seconds", stage="export"):
+            return self._export_station(station_id)
+
+    def _export_station(self, station_id):
+        rows = self.db.get_measurements(station_id, columns=MEASUREMENT_COLUMNS)
+        if not rows:
+            return False
+        fields = list(zip(*rows))
+        days = np.asarray(fields[1], dtype='datetime64[D]')
+        start = days[0]
+        offsets = (days - start).astype(np.int64)
+        length = int(offsets[-1]) + 1
+
+        columns = {}
+        for i, col in enumerate(MEASUREMENT_COLUMNS):
+            values = np.full(length, np.nan, dtype=np.float32)
+            values[offsets] = np.asarray(fields[2 + i], dtype=np.float64)  # None becomes NaN
+            columns[col] = values
+
+        os.makedirs(self.export_dir, exist_ok=True)
+        arrow_path = os.path.join(self.export_dir, f"{station_id}.arrow")
+        npy_path = os.path.join(self.export_dir, str(station_id))
+        if self.file_format == 'arrow':
+            self._write_arrow(arrow_path, station_id, str(start), columns)
+            if os.path.isdir(npy_path):
+                shutil.rmtree(npy_path)
+        else:
+            self._write_npy(npy_path, station_id, str(start), length, columns)
+            if os.path.exists(arrow_path):
+                os.remove(arrow_path)
+        return True
+
+    @staticmethod
+    def _write_arrow(path, station_id, start, columns):
+        table = pa.table(columns, metadata={'station_id': str(station_id), 'start': start})
+        tmp_path = path + '.tmp'
+        with pa.OSFile(tmp_path, 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                # a single record batch keeps every column contiguous
+                writer.write_table(table, max_chunksize=len(next(iter(columns.values()))))
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _write_npy(path, station_id, start, length, columns):
+        tmp_path = path + '.tmp'
+        if os.path.exists(tmp_path):
+            shutil.rmtree(tmp_path)
+        os.makedirs(tmp_path)
+        for col, values in columns.items():
+            np.save(os.path.join(tmp_path, f"{col}.npy"), values)
+        with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+            json.dump({'station_id': station_id, 'start': start, 'days': length,
+                       'columns': list(columns)}, f)
+
+        old_path = path + '.old'
+        if os.path.exists(path):
+            os.replace(path, old_path)
+        os.replace(tmp_path, path)
+        if os.path.exists(old_path):
+            shutil.rmtree(old_path)
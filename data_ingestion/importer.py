@@ -1,6 +1,9 @@
 import os
+import logging
 from .database import Database
 
+logger = logging.getLogger(__name__)
+
 class CsvImporter:
     def __init__(self, db: Database):
         self.db = db
@@ -9,15 +12,66 @@ class CsvImporter:
         """
         Uses an existing database connection to insert a single CSV file.
         """
-        print("--- Running CSV Importer ---")
         if not self.db.conn:
-            print("Database connection is not available. Aborting import.")
-            return
+            logger.error("Database connection is not available. Aborting import.")
+            return 0
+
+        try:
+            logger.debug("Importing '%s'", os.path.basename(file_path))
+            return self.db.insert_csv(file_path, delimiter)
+
+        except Exception:
+            logger.exception("An unexpected error occurred during CSV import of %s", file_path)
+            return 0
+
+    def import_stream(self, header, rows, source):
+        """
+        Uses an existing database connection to insert rows streamed from an
+        archive (see DataProcessor.stream_file).
+        """
+        if not self.db.conn:
+            logger.error("Database connection is not available. Aborting import.")
+            return 0
+
+        try:
+            logger.debug("Importing '%s'", source)
+            return self.db.insert_records(header, rows, source)
+
+        except Exception:
+            logger.exception("An unexpected error occurred during stream import of %s", source)
+            return 0
+
+    def import_columns(self, header, columns, source):
+        """
+        Uses an existing database connection to insert column arrays parsed
+        in a worker process (see processor.parse_columns).
+        """
+        if not self.db.conn:
+            logger.error("Database connection is not available. Aborting import.")
+            return 0
+
+        try:
+            logger.debug("Importing '%s'", source)
+            return self.db.insert_columns(header, columns, source)
+
+        except Exception:
+            logger.exception("An unexpected error occurred during column import of %s", source)
+            return 0
+
+    def import_stations(self, stations, source):
+        """
+        Uses an existing database connection to upsert station metadata
+        parsed by processor.read_station_list.
+        """
+        if not self.db.conn:
+            logger.error("Database connection is not available. Aborting import.")
+            return 0
 
         try:
-            print(f"Importing '{os.path.basename(file_path)}'...")
-            self.db.insert_csv(file_path, delimiter)
-            print("CSV import process finished.")
+            logger.debug("Importing stations from '%s'", source)
+            rows = stations.astype(object).where(stations.notna(), None)
+            return self.db.upsert_stations(rows.itertuples(index=False, name=None), source)
 
-        except Exception as e:
-            print(f"An unexpected error occurred during CSV import: {e}")
+        except Exception:
+            logger.exception("An unexpected error occurred during station import of %s", source)
+            return 0
@@ -0,0 +1,170 @@
+"""
+Structured metrics for the ingestion and analysis stages.
+
+Components record counters, histograms and per-file events in a process-wide
+registry (METRICS). The registry can be dumped as JSON or in the Prometheus
+text exposition format. Per-file events are also emitted through the
+`wetter.metrics` logger, so they show up in the regular log output.
+"""
+import bisect
+import cProfile
+import io
+import json
+import logging
+import pstats
+import threading
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+
+logger = logging.getLogger('wetter.metrics')
+
+# Upper bounds in seconds of the default histogram buckets
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 60.0)
+
+
+class Histogram:
+    """Cumulative bucket histogram with sum and count, as used by Prometheus."""
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def snapshot(self):
+        cumulative, total = {}, 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            cumulative['+Inf' if bound == float('inf') else repr(bound)] = total
+        return {'buckets': cumulative, 'sum': self.sum, 'count': self.count}
+
+
+class MetricsRegistry:
+    """Thread-safe store of counters, histograms and the most recent per-file events."""
+    def __init__(self, max_events=1000):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._events = deque(maxlen=max_events)
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted((labels or {}).items()))
+
+    def inc(self, name, value=1, **labels):
+        """Adds `value` to a counter."""
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        """Records a value, usually a duration in seconds, in a histogram."""
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Observes the duration of the with-block in the histogram `name`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def event(self, stage, file, **fields):
+        """Records and logs the metrics of one file passing through a stage."""
+        record = {'stage': stage, 'file': file, **fields}
+        with self._lock:
+            self._events.append(record)
+        logger.info(' '.join(f"{key}={value}" for key, value in record.items()), extra={'metrics': record})
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+            self._events.clear()
+
+    def snapshot(self):
+        """Returns counters, histograms and recent events as plain data."""
+        with self._lock:
+            return {
+                'counters': [{'name': name, 'labels': dict(labels), 'value': value}
+                             for (name, labels), value in sorted(self._counters.items())],
+                'histograms': [{'name': name, 'labels': dict(labels), **histogram.snapshot()}
+                               for (name, labels), histogram in sorted(self._histograms.items())],
+                'events': list(self._events),
+            }
+
+    def to_json(self, indent=2):
+        return json.dumps(self.snapshot(), indent=indent, default=str)
+
+    def to_prometheus(self, prefix='wetter_'):
+        """Renders counters and histograms in the Prometheus text exposition format."""
+        snapshot = self.snapshot()
+        lines = []
+        typed = set()
+        for counter in snapshot['counters']:
+            name = prefix + counter['name']
+            if name not in typed:
+                lines.append(f"# TYPE {name} counter")
+                typed.add(name)
+            lines.append(f"{name}{_labels(counter['labels'])} {counter['value']}")
+        for histogram in snapshot['histograms']:
+            name = prefix + histogram['name']
+            if name not in typed:
+                lines.append(f"# TYPE {name} histogram")
+                typed.add(name)
+            for bound, count in histogram['buckets'].items():
+                lines.append(f"{name}_bucket{_labels(dict(histogram['labels'], le=bound))} {count}")
+            lines.append(f"{name}_sum{_labels(histogram['labels'])} {histogram['sum']}")
+            lines.append(f"{name}_count{_labels(histogram['labels'])} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"') for value in labels.values())
+    return '{' + ','.join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + '}'
+
+
+# Process-wide registry used by all components
+METRICS = MetricsRegistry()
+
+
+@contextmanager
+def profile_run(pstats_path=None, memory=True, top=25):
+    """
+    Opt-in profiling of one run: cProfile for CPU hot spots and tracemalloc
+    for allocation hot spots. The top entries are logged when the block
+    ends; the full profile is written to `pstats_path` if given.
+    """
+    profiler = cProfile.Profile()
+    if memory:
+        tracemalloc.start()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        if pstats_path:
+            profiler.dump_stats(pstats_path)
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(top)
+        logger.info("CPU profile:\n%s", out.getvalue())
+        if memory:
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            lines = [str(stat) for stat in snapshot.statistics('lineno')[:top]]
+            logger.info("Peak traced memory %.1f MB, top allocations:\n%s", peak / 1e6, "\n".join(lines))
@@ -0,0 +1,424 @@
+import os
+import hashlib
+import queue
+import threading
+import time
+import types
+import logging
+import multiprocessing
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+from .downloader import Downloader
+from .processor import DataProcessor, parse_columns
+from .importer import CsvImporter
+from .metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+# Marks the end of the work items on a stage queue
+_DONE = object()
+# Returned by a stage for archives that are unchanged since the last import
+_SKIPPED = object()
+
+# A parsed archive travelling from the parse stage to the writer. Streaming
+# jobs carry header and one batch of rows, the last batch of an archive is
+# `final`; process pool jobs carry header and column arrays, otherwise
+# csv_file_path is set.
+ParsedArchive = namedtuple('ParsedArchive', 'source header rows csv_file_path size content_hash columns final',
+                           defaults=(None, True))
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """Returns the SHA-256 hex digest of a file."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class IngestionPipeline:
+    """
+    Runs download, parse and import as three concurrent stages.
+
+    Downloads run in a thread pool over the downloader's shared session,
+    parsing runs in a second worker pool and a single writer (the calling
+    thread, which owns the SQLite connection) imports the results. The
+    stages are connected by bounded queues, so downloads block once
+    `max_pending` archives are waiting to be parsed. This keeps the number
+    of archives on disk bounded.
+
+    With `parse_processes`, archives are parsed in a process pool instead,
+    so parsing is not limited to one core by the GIL. The workers return
+    NumPy column arrays and the writer inserts the archives in groups of
+    about `commit_rows` rows with one commit per group.
+
+    With streaming, the rows of an archive travel to the writer in batches
+    of `stream_batch_rows`, so memory stays bounded by the queue sizes
+    however large an archive is.
+
+    With `skip_unchanged`, archives whose size and content hash match the
+    ingestion manifest are not imported again. The size alone is not
+    conclusive, DWD republishes corrections under the same name. With an
+    archive cache, unchanged archives are not downloaded again either: the
+    cache revalidates them with their ETag/Last-Modified and keeps the
+    content hash recorded at download time.
+
+    Without an archive cache on the downloader, archives are removed once
+    they are parsed (`remove_archives`); with one, they are released to the
+    cache, which keeps them within its size limit.
+
+    Every import advances the per station ingestion state
+    (Database.update_station_state). With `recent`, the URLs are DWD
+    'recent' archives and only the days after each station's last imported
+    day are written, so days of the historical archives are never
+    overwritten by the preliminary recent values.
+    """
+    def __init__(self, downloader: Downloader, processor: DataProcessor, importer: CsvImporter,
+                 source_config, download_workers=4, parse_workers=2, max_pending=8,
+                 remove_archives=True, skip_unchanged=True, parse_processes=0, commit_rows=500000,
+                 recent=False, stream_batch_rows=50000):
+        self.downloader = downloader
+        self.processor = processor
+        self.importer = importer
+        self.source_config = source_config
+        self.download_workers = download_workers
+        self.parse_workers = parse_workers
+        self.max_pending = max_pending
+        self.remove_archives = remove_archives
+        self.skip_unchanged = skip_unchanged
+        self.parse_processes = parse_processes
+        self.commit_rows = commit_rows
+        self.recent = recent
+        self.stream_batch_rows = stream_batch_rows
+        self.streaming = source_config.get('streaming', False)
+        self.manifest = {}
+        # Station ID -> last imported day as YYYYMMDD int, only set for recent archives
+        self.cutoffs = None
+        self.failures = 0
+        self.skipped = 0
+        self._lock = threading.Lock()
+        self._pool = None
+
+    def run(self, file_urls):
+        """
+        Downloads, parses and imports all given URLs.
+
+        Must be called from the thread that owns the database connection.
+
+        :param file_urls: The archive URLs to ingest.
+        :return: A dict with the number of imported, skipped and failed files, rows and the elapsed time.
+        """
+        start = time.perf_counter()
+        db = self.importer.db
+        # Read once here, the worker threads must not touch the connection
+        self.manifest = db.get_manifest() if self.skip_unchanged else {}
+        if self.recent:
+            self.cutoffs = {station_id: int(last.replace('-', ''))
+                            for station_id, last in db.get_station_last_days().items()}
+        kind = 'recent' if self.recent else 'historical'
+
+        def update_state(touched):
+            db.update_station_state(touched, kind)
+        db.add_import_listener(update_state)
+        self.failures = 0
+        self.skipped = 0
+        url_queue = queue.Queue()
+        archive_queue = queue.Queue(maxsize=self.max_pending)
+        parsed_queue = queue.Queue(maxsize=self.max_pending)
+
+        for url in file_urls:
+            url_queue.put(url)
+        for _ in range(self.download_workers):
+            url_queue.put(_DONE)
+
+        parse_workers = self.parse_workers
+        if self.parse_processes:
+            # One dispatching thread per process keeps every process busy
+            parse_workers = self.parse_processes
+            self._pool = self._create_pool()
+        self._start_stage('download', self.downloader.download_file, url_queue, archive_queue,
+                          self.download_workers, parse_workers)
+        self._start_stage('parse', self._parse, archive_queue, parsed_queue,
+                          parse_workers, 1)
+
+        files = 0
+        rows = 0
+        group = []
+        # Source -> rows written by the earlier batches of a streamed archive
+        streamed = {}
+        try:
+            with db.bulk_load():
+                while True:
+                    job = parsed_queue.get()
+                    if job is not _DONE and job.columns is None:
+                        inserted = self._write(job) if job.rows is None else self._write_batch(job, streamed)
+                        if inserted is None:
+                            # More batches of this archive follow
+                            continue
+                        if inserted:
+                            db.record_archive(job.source, job.size, job.content_hash, inserted)
+                            rows += inserted
+                            files += 1
+                        else:
+                            with self._lock:
+                                self.failures += 1
+                        continue
+
+                    if group and (job is _DONE or job.header != group[0].header
+                                  or sum(len(g.columns[0]) for g in group) >= self.commit_rows):
+                        written, inserted = self._write_group(group)
+                        files += written
+                        rows += inserted
+                        group = []
+                    if job is _DONE:
+                        break
+                    group.append(job)
+        finally:
+            db.remove_import_listener(update_state)
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+
+        stats = {
+            'files': files,
+            'rows': rows,
+            'skipped': self.skipped,
+            'failures': self.failures,
+            'seconds': time.perf_counter() - start,
+        }
+        logger.info("Pipeline finished: %d files, %d rows, %d unchanged, %d failures in %.1fs.",
+                    files, rows, self.skipped, self.failures, stats['seconds'])
+        return stats
+
+    def _create_pool(self):
+        # spawn instead of fork: the pipeline forks from a process running threads
+        return ProcessPoolExecutor(self.parse_processes, mp_context=multiprocessing.get_context('spawn'))
+
+    def _start_stage(self, name, func, inbox, outbox, workers, downstream_workers):
+        """
+        Starts `workers` threads applying `func` to items of `inbox`. Once all
+        of them are finished, one end marker per downstream worker is put
+        into `outbox`.
+        """
+        threads = [
+            threading.Thread(target=self._work, args=(func, inbox, outbox), name=f"{name}-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for thread in threads:
+            thread.start()
+
+        def close():
+            for thread in threads:
+                thread.join()
+            for _ in range(downstream_workers):
+                outbox.put(_DONE)
+
+        threading.Thread(target=close, name=f"{name}-closer", daemon=True).start()
+
+    def _work(self, func, inbox, outbox):
+        while True:
+            item = inbox.get()
+            if item is _DONE:
+                return
+            try:
+                result = func(item)
+                # A generator hands out its results one at a time, e.g. the batches of a streamed archive
+                for result in (result if isinstance(result, types.GeneratorType) else [result]):
+                    self._put(result, outbox)
+            except Exception:
+                logger.exception("Pipeline error while handling %s", item)
+                self._put(None, outbox)
+
+    def _put(self, result, outbox):
+        if result is None or result is _SKIPPED:
+            with self._lock:
+                if result is None:
+                    self.failures += 1
+                else:
+                    self.skipped += 1
+        else:
+            outbox.put(result)
+
+    def _parse(self, zip_file_path):
+        """
+        Parses one archive into a ParsedArchive, or _SKIPPED if its content is
+        already imported. Streamed archives are returned as a generator of
+        ParsedArchive batches, which releases the archive once exhausted.
+        """
+        source = os.path.basename(zip_file_path)
+        release = True
+        try:
+            size = os.path.getsize(zip_file_path)
+            cache = self.downloader.cache
+            content_hash = (cache.digest(zip_file_path) if cache is not None else None) or file_digest(zip_file_path)
+            if self.manifest.get(source) == (size, content_hash):
+                logger.info("%s has the same content as the last import. Skipping.", source)
+                METRICS.inc("files_skipped_total", stage="parse")
+                return _SKIPPED
+
+            if self._pool is not None:
+                start = time.perf_counter()
+                header, columns = self._parse_in_pool(zip_file_path)
+                if self.cutoffs is not None:
+                    columns = self._new_days_columns(header, columns)
+                    if not len(columns[0]):
+                        return self._no_new_days(source)
+                elapsed = time.perf_counter() - start
+                METRICS.inc("files_total", stage="parse")
+                METRICS.inc("rows_parsed_total", len(columns[0]))
+                METRICS.observe("stage_seconds", elapsed, stage="parse")
+                METRICS.event("parse", source, rows=len(columns[0]), seconds=round(elapsed, 4))
+                return ParsedArchive(source, header, None, None, size, content_hash, columns)
+
+            # Recent archives are always streamed, so the rows can be filtered before the import
+            if self.streaming or self.cutoffs is not None:
+                streamed = self.processor.stream_file(
+                    zip_file_path,
+                    self.source_config['product_pattern_to_extract'],
+                    self.source_config['header_keyword'],
+                    self.source_config['delimiter']
+                )
+                if not streamed:
+                    return None
+                header, rows = streamed
+                release = False
+                return self._stream_batches(zip_file_path, source, size, content_hash, header, rows)
+
+            csv_file_path = self.processor.process_file(
+                zip_file_path,
+                self.source_config['product_pattern_to_extract'],
+                self.source_config['header_keyword'],
+                self.source_config['delimiter']
+            )
+            if not csv_file_path:
+                return None
+            return ParsedArchive(source, None, None, csv_file_path, size, content_hash)
+        finally:
+            if release:
+                self._release(zip_file_path)
+
+    def _stream_batches(self, zip_file_path, source, size, content_hash, header, rows):
+        """
+        Yields the streamed rows of an archive as ParsedArchive batches of
+        `stream_batch_rows` rows. The last batch is marked final and may be
+        empty. An archive without rows yields None (a failure), or _SKIPPED
+        for a recent archive without new days.
+        """
+        try:
+            if self.cutoffs is not None:
+                rows = self._new_days_rows(header, rows)
+            total = 0
+            batch = []
+            for row in rows:
+                batch.append(row)
+                if len(batch) >= self.stream_batch_rows:
+                    total += len(batch)
+                    yield ParsedArchive(source, header, batch, None, size, content_hash, final=False)
+                    batch = []
+            total += len(batch)
+            if not total:
+                yield self._no_new_days(source) if self.cutoffs is not None else None
+                return
+            yield ParsedArchive(source, header, batch, None, size, content_hash)
+        finally:
+            # closes the archive if the rows were not read to the end
+            rows.close()
+            self._release(zip_file_path)
+
+    def _release(self, zip_file_path):
+        if self.downloader.cache is not None:
+            # The cache keeps the archive for the next run and evicts it once it is over its size limit
+            self.downloader.cache.release(zip_file_path)
+        elif self.remove_archives and os.path.exists(zip_file_path):
+            os.remove(zip_file_path)
+
+    def _new_days_rows(self, header, rows):
+        """Yields the raw rows dated after the last imported day of their station."""
+        station_index, date_index = header.index('STATIONS_ID'), header.index('MESS_DATUM')
+        return (row for row in rows
+                if row and int(row[date_index]) > self.cutoffs.get(int(row[station_index]), 0))
+
+    def _new_days_columns(self, header, columns):
+        """Keeps the column entries dated after the last imported day of their station."""
+        station_ids, days = columns[header.index('STATIONS_ID')], columns[header.index('MESS_DATUM')]
+        keep = np.ones(len(days), dtype=bool)
+        for station_id in np.unique(station_ids):
+            cutoff = self.cutoffs.get(int(station_id))
+            if cutoff is not None:
+                keep &= (station_ids != station_id) | (days > cutoff)
+        return [column[keep] for column in columns]
+
+    def _no_new_days(self, source):
+        logger.info("%s has no days after the last import. Skipping.", source)
+        METRICS.inc("files_skipped_total", stage="parse")
+        return _SKIPPED
+
+    def _parse_in_pool(self, zip_file_path):
+        """
+        Parses an archive in the process pool. If a worker process dies the
+        pool is replaced, so the remaining archives are still parsed.
+        """
+        pool = self._pool
+        try:
+            return pool.submit(
+                parse_columns,
+                zip_file_path,
+                self.source_config['product_pattern_to_extract'],
+                self.source_config['header_keyword'],
+                self.source_config['delimiter'],
+                self.processor.file_encoding,
+                self.processor.na_value
+            ).result()
+        except BrokenProcessPool:
+            with self._lock:
+                if self._pool is pool:
+                    logger.error("A parse process died while parsing %s. Restarting the process pool.",
+                                 os.path.basename(zip_file_path))
+                    self._pool = self._create_pool()
+                    pool.shutdown(wait=False)
+            raise
+
+    def _write_group(self, group):
+        """
+        Inserts the columns of several archives with a single commit and
+        records them in the manifest.
+
+        :return: A tuple (files, rows) written.
+        """
+        columns = [np.concatenate(parts) for parts in zip(*(job.columns for job in group))]
+        source = f"{len(group)} archives ({group[0].source}, ...)" if len(group) > 1 else group[0].source
+        inserted = self.importer.import_columns(group[0].header, columns, source)
+        if not inserted:
+            with self._lock:
+                self.failures += len(group)
+            return 0, 0
+        for job in group:
+            self.importer.db.record_archive(job.source, job.size, job.content_hash, len(job.columns[0]))
+        return len(group), inserted
+
+    def _write_batch(self, job, streamed):
+        """
+        Inserts one batch of a streamed archive. Once a batch fails, the
+        remaining batches of the archive are dropped.
+
+        :param streamed: Source -> rows written by the earlier batches, None after a failed batch.
+        :return: None while batches of the archive are outstanding, then the rows of the archive, 0 if it failed.
+        """
+        written = streamed.pop(job.source, 0)
+        if written is not None and job.rows:
+            inserted = self._write(job)
+            written = written + inserted if inserted else None
+        if not job.final:
+            streamed[job.source] = written
+            return None
+        return written or 0
+
+    def _write(self, job):
+        if job.csv_file_path:
+            inserted = self.importer.import_file(job.csv_file_path, self.source_config['delimiter'])
+            os.remove(job.csv_file_path)
+            return inserted
+        return self.importer.import_stream(job.header, job.rows, job.source)
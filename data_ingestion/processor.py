@@ -1,76 +1,318 @@
 import os
+import io
+import csv
 import zipfile
 import glob
-import pandas as pd
-from geopy.distance import geodesic
+import time
+import logging
+# numpy and pandas are imported by the parsing functions, so importing this
+# module (e.g. from cli.py) does not pay for them
+from .database import STATION_COLUMNS
+from .metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+# Column types of the DWD kl product used by the typed parse: int32 station IDs,
+# nullable int8 quality flags and precipitation form, float32 measurements.
+# MESS_DATUM is parsed as date, or kept as int32 YYYYMMDD (see read_kl).
+KL_DTYPES = {
+    'STATIONS_ID': 'int32',
+    'QN_3': 'Int8',
+    'QN_4': 'Int8',
+    'RSKF': 'Int8',
+    **{col: 'float32' for col in ('FX', 'FM', 'RSK', 'SDK', 'SHK_TAG', 'NM', 'VPM', 'PM',
+                                  'TMK', 'UPM', 'TXK', 'TNK', 'TGK')},
+}
+
+# Fixed-width layout of the DWD station description (KL_Tageswerte_Beschreibung_Stationen.txt)
+# as (first, end) character offsets of the Station table columns (STATION_COLUMNS). Two header lines
+# (names and dashes) precede the stations.
+STATION_COLSPECS = [(0, 5), (6, 14), (15, 23), (24, 38), (39, 50), (51, 60), (61, 102), (102, 143), (143, None)]
+STATION_DTYPES = {'Station_ID': 'int32', 'von_datum': str, 'bis_datum': str, 'Stattionhoehe': 'float64',
+                  'geoBreite': 'float64', 'geoLaenge': 'float64', 'Stationsname': str, 'Bundesland': str,
+                  'Abgabe': str}
+
+
+def read_kl(source, header, delimiter, na_value, parse_dates=True, chunk_size=None, encoding=None):
+    """
+    Reads kl product lines with the types of KL_DTYPES.
+
+    The NA value is mapped while parsing and the 'eor' column is never
+    materialized, so no pass over the finished frame is needed. Columns
+    missing from KL_DTYPES are inferred by pandas.
+
+    :param source: Path or text stream positioned after the header line.
+    :param header: The stripped column names of the file.
+    :param parse_dates: Parse MESS_DATUM as datetime64, otherwise keep it as int32 YYYYMMDD.
+    :param chunk_size: If set, an iterator over DataFrames of this many rows is returned.
+    :return: A DataFrame, or an iterator of DataFrames if chunk_size is set.
+    """
+    import pandas as pd
+    dtypes = {col: dtype for col, dtype in KL_DTYPES.items() if col in header}
+    if not parse_dates and 'MESS_DATUM' in header:
+        dtypes['MESS_DATUM'] = 'int32'
+    return pd.read_csv(
+        source,
+        sep=delimiter,
+        header=None,
+        names=header,
+        usecols=[col for col in header if col != 'eor'],
+        dtype=dtypes,
+        na_values=[str(na_value)],
+        skipinitialspace=True,
+        parse_dates=['MESS_DATUM'] if parse_dates and 'MESS_DATUM' in header else False,
+        date_format='%Y%m%d',
+        chunksize=chunk_size or None,
+        encoding=encoding
+    )
+
+
+def parse_columns(zip_file_path, file_pattern_to_extract, header_keyword, delimiter, file_encoding, na_value):
+    """
+    Parses the product file of a zip archive into one NumPy array per column.
+
+    Runs in the worker processes of the parallel pipeline, so it is a
+    module-level function and hands back plain arrays, which pickle as raw
+    buffers, instead of DataFrames or temporary files. Errors are raised,
+    the caller decides how to count them.
+
+    :return: A tuple (header, columns) with the column names (without 'eor')
+             and a list of arrays of equal length typed as in KL_DTYPES, with
+             MESS_DATUM as int32 YYYYMMDD. Integer columns containing missing
+             values are returned as float32 with NaN.
+    """
+    with zipfile.ZipFile(zip_file_path, 'r') as zip_ref:
+        product_file = DataProcessor._find_product_member(zip_ref, file_pattern_to_extract)
+        if not product_file:
+            raise ValueError(f"No file matching '{file_pattern_to_extract}' found in {os.path.basename(zip_file_path)}")
+        with io.TextIOWrapper(zip_ref.open(product_file), encoding=file_encoding, newline='') as stream:
+            for line in stream:
+                if header_keyword in line:
+                    header = [h.strip() for h in line.rstrip('\r\n').split(delimiter)]
+                    break
+            else:
+                raise ValueError(f"Could not find header row in {product_file}")
+            df = read_kl(stream, header, delimiter, na_value, parse_dates=False)
+
+    import numpy as np
+    import pandas as pd
+    columns = []
+    for col in df.columns:
+        values = df[col]
+        if isinstance(values.dtype, pd.api.extensions.ExtensionDtype) and values.hasnans:
+            columns.append(values.to_numpy(dtype='float32', na_value=np.nan))
+        elif isinstance(values.dtype, pd.api.extensions.ExtensionDtype):
+            columns.append(values.to_numpy(dtype=values.dtype.numpy_dtype))
+        else:
+            columns.append(values.to_numpy())
+    return list(df.columns), columns
+
+
+def read_station_list(source, encoding='latin-1'):
+    """
+    Reads the DWD station description in one pass with the fixed column
+    offsets of STATION_COLSPECS.
+
+    :param source: Path or text stream of the station description.
+    :return: A DataFrame with the columns of STATION_COLUMNS, von_datum and
+             bis_datum as ISO dates and heights as integers (None if missing).
+    """
+    import pandas as pd
+    df = pd.read_fwf(
+        source,
+        colspecs=STATION_COLSPECS,
+        names=list(STATION_COLUMNS),
+        dtype=STATION_DTYPES,
+        skiprows=2,
+        header=None,
+        encoding=encoding
+    )
+    for col in ('von_datum', 'bis_datum'):
+        days = df[col]
+        df[col] = days.str[:4] + '-' + days.str[4:6] + '-' + days.str[6:8]
+    df['Stattionhoehe'] = df['Stattionhoehe'].round().astype('Int32')
+    return df
+
 
 class DataProcessor:
     """Handles unzipping, filtering, and parsing of data files."""
-    def __init__(self, download_dir, extract_dir, file_encoding, na_value):
+    def __init__(self, download_dir, extract_dir, file_encoding, na_value, typed=False, chunk_size=None):
+        """
+        :param typed: Parse with the kl schema (see read_kl) instead of letting pandas infer the types.
+        :param chunk_size: With typed, convert the file in chunks of this many rows to bound memory.
+        """
         self.download_dir = download_dir
         self.extract_dir = extract_dir
         self.file_encoding = file_encoding
         self.na_value = na_value
+        self.typed = typed
+        self.chunk_size = chunk_size
 
     def process_file(self, zip_file_path, file_pattern_to_extract, header_keyword, delimiter):
         """Processes a single zip file: unzips, parses, and renames to CSV."""
-        if not os.path.exists(self.extract_dir):
-            os.makedirs(self.extract_dir)
+        os.makedirs(self.extract_dir, exist_ok=True)
 
         file_name = os.path.basename(zip_file_path)
-        print(f"Processing {file_name}...")
+        logger.debug("Processing %s", file_name)
+        start = time.perf_counter()
         try:
             with zipfile.ZipFile(zip_file_path, 'r') as zip_ref:
-                product_file = None
-                for file_in_zip in zip_ref.namelist():
-                    if file_pattern_to_extract in file_in_zip:
-                        product_file = file_in_zip
-                        break
-                
+                product_file = self._find_product_member(zip_ref, file_pattern_to_extract)
                 if product_file:
                     extracted_file_path = zip_ref.extract(product_file, self.extract_dir)
-                    print(f"  - Extracted: {product_file}")
                 else:
-                    print(f"  - Warning: No file matching '{file_pattern_to_extract}' found in {file_name}")
+                    logger.warning("No file matching '%s' found in %s", file_pattern_to_extract, file_name)
+                    METRICS.inc("failures_total", stage="parse")
                     return None
 
             header_line_index = self._find_header_line(extracted_file_path, header_keyword)
             if header_line_index is None:
-                print(f"  - Warning: Could not find header row in {os.path.basename(extracted_file_path)}. Skipping.")
+                logger.warning("Could not find header row in %s. Skipping.", os.path.basename(extracted_file_path))
+                METRICS.inc("failures_total", stage="parse")
                 return None
 
-            df = pd.read_csv(
-                extracted_file_path,
-                delimiter=delimiter,
-                encoding=self.file_encoding,
-                skiprows=header_line_index
-            )
-
-            df.columns = df.columns.str.strip()
-            df.replace(self.na_value, pd.NA, inplace=True)
-
-            if extracted_file_path.endswith('.txt'):
-                new_file_path = os.path.splitext(extracted_file_path)[0] + ".csv"
-                # Write the dataframe to a new csv file
-                df.to_csv(new_file_path, index=False, sep=delimiter)
-                print(f"  - Renamed to {os.path.basename(new_file_path)}")
+            if self.typed:
+                # Written next to the source, which is only replaced once the conversion is complete
+                new_file_path = os.path.splitext(extracted_file_path)[0] + ".csv.part"
+                rows = self._convert_typed(extracted_file_path, header_line_index, delimiter, new_file_path)
                 os.remove(extracted_file_path)
-                return new_file_path
+                final_path = os.path.splitext(extracted_file_path)[0] + ".csv"
+                os.replace(new_file_path, final_path)
+                new_file_path = final_path
             else:
-                # if it is already a csv, we just overwrite it with the cleaned data
-                df.to_csv(extracted_file_path, index=False, sep=delimiter)
-                return extracted_file_path
+                import pandas as pd
+                df = pd.read_csv(
+                    extracted_file_path,
+                    delimiter=delimiter,
+                    encoding=self.file_encoding,
+                    skiprows=header_line_index
+                )
+
+                df.columns = df.columns.str.strip()
+                df.replace(self.na_value, pd.NA, inplace=True)
+                rows = len(df)
+
+                if extracted_file_path.endswith('.txt'):
+                    new_file_path = os.path.splitext(extracted_file_path)[0] + ".csv"
+                    # Write the dataframe to a new csv file
+                    df.to_csv(new_file_path, index=False, sep=delimiter)
+                    os.remove(extracted_file_path)
+                else:
+                    # if it is already a csv, we just overwrite it with the cleaned data
+                    new_file_path = extracted_file_path
+                    df.to_csv(new_file_path, index=False, sep=delimiter)
+
+            elapsed = time.perf_counter() - start
+            METRICS.inc("files_total", stage="parse")
+            METRICS.inc("rows_parsed_total", rows)
+            METRICS.observe("stage_seconds", elapsed, stage="parse")
+            METRICS.event("parse", file_name, rows=rows, seconds=round(elapsed, 4))
+            return new_file_path
 
         except zipfile.BadZipFile:
-            print(f"Error: Failed to unzip {file_name}. It might be a corrupted file.")
+            logger.error("Failed to unzip %s. It might be a corrupted file.", file_name)
+        except OSError as e:
+            logger.error("Error processing file %s: %s", file_name, e)
+        except Exception:
+            logger.exception("Error parsing file %s", file_name)
+        METRICS.inc("failures_total", stage="parse")
+        return None
+
+    def _convert_typed(self, file_path, header_line_index, delimiter, target_path):
+        """
+        Converts a product file to a clean CSV using the kl schema, chunk by
+        chunk if chunk_size is set. Dates are written as ISO dates.
+
+        :return: The number of converted rows.
+        """
+        with open(file_path, 'r', encoding=self.file_encoding, newline='') as f:
+            for _ in range(header_line_index):
+                f.readline()
+            header = [h.strip() for h in f.readline().rstrip('\r\n').split(delimiter)]
+            position = f.tell()
+            if not any(line.strip() for line in iter(f.readline, '')):
+                # No data rows: the header-only CSV is written directly instead of handing pandas an empty stream
+                with open(target_path, 'w', encoding='utf-8') as target:
+                    target.write(delimiter.join(col for col in header if col != 'eor') + '\n')
+                return 0
+            f.seek(position)
+            parsed = read_kl(f, header, delimiter, self.na_value, chunk_size=self.chunk_size)
+            chunks = parsed if self.chunk_size else [parsed]
+            rows = 0
+            for i, chunk in enumerate(chunks):
+                chunk.to_csv(target_path, mode='w' if i == 0 else 'a', header=i == 0, index=False,
+                             sep=delimiter, date_format='%Y-%m-%d')
+                rows += len(chunk)
+        return rows
+
+    def stream_file(self, zip_file_path, file_pattern_to_extract, header_keyword, delimiter):
+        """
+        Streams the product file of a zip archive without extracting it.
+
+        The product member is decoded on the fly, lines before the header
+        are skipped and the remaining lines are handed out as split rows, so
+        nothing is written to the extract directory.
+
+        :return: A tuple (header, rows) where rows is a generator of raw field
+                 lists that closes the archive once exhausted, or None if the
+                 archive cannot be read.
+        """
+        file_name = os.path.basename(zip_file_path)
+        logger.debug("Streaming %s", file_name)
+        try:
+            zip_ref = zipfile.ZipFile(zip_file_path, 'r')
+        except zipfile.BadZipFile:
+            logger.error("Failed to unzip %s. It might be a corrupted file.", file_name)
+            METRICS.inc("failures_total", stage="parse")
             return None
         except OSError as e:
-            print(f"Error processing file {file_name}: {e}")
+            logger.error("Error processing file %s: %s", file_name, e)
+            METRICS.inc("failures_total", stage="parse")
+            return None
+
+        try:
+            product_file = self._find_product_member(zip_ref, file_pattern_to_extract)
+            if not product_file:
+                logger.warning("No file matching '%s' found in %s", file_pattern_to_extract, file_name)
+                METRICS.inc("failures_total", stage="parse")
+                zip_ref.close()
+                return None
+
+            stream = io.TextIOWrapper(zip_ref.open(product_file), encoding=self.file_encoding, newline='')
+            for line in stream:
+                if header_keyword in line:
+                    header = [h.strip() for h in line.rstrip('\r\n').split(delimiter)]
+                    METRICS.inc("files_total", stage="parse")
+                    return header, self._iter_rows(zip_ref, stream, delimiter)
+
+            logger.warning("Could not find header row in %s. Skipping.", product_file)
+            METRICS.inc("failures_total", stage="parse")
+            stream.close()
+            zip_ref.close()
             return None
-        except Exception as e:
-            print(f"  - Error parsing file {os.path.basename(zip_file_path)}: {e}")
+        except Exception:
+            logger.exception("Error parsing file %s", file_name)
+            METRICS.inc("failures_total", stage="parse")
+            zip_ref.close()
             return None
 
+    @staticmethod
+    def _iter_rows(zip_ref, stream, delimiter):
+        """Yields split rows from an open product stream and closes the archive afterwards."""
+        try:
+            yield from csv.reader(stream, delimiter=delimiter)
+        finally:
+            stream.close()
+            zip_ref.close()
+
+    @staticmethod
+    def _find_product_member(zip_ref, file_pattern_to_extract):
+        """Returns the name of the first archive member matching the pattern."""
+        for file_in_zip in zip_ref.namelist():
+            if file_pattern_to_extract in file_in_zip:
+                return file_in_zip
+        return None
+
     def _find_header_line(self, file_path, header_keyword):
         """Finds the line number of the header in a data file."""
         with open(file_path, 'r', encoding=self.file_encoding) as f:
@@ -82,4 +324,5 @@ class DataProcessor:
     @staticmethod
     def calculate_distance(coord1, coord2):
         """Calculates the distance between two coordinates in kilometers."""
+        from geopy.distance import geodesic
         return geodesic(coord1, coord2).kilometers
@@ -1,7 +1,9 @@
 import unittest
-from unittest.mock import MagicMock, patch
+from unittest.mock import MagicMock
 import sys
 import os
+import shutil
+from datetime import date
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
@@ -11,15 +13,16 @@ from data_ingestion.database import Database
 class TestAnalysis(unittest.TestCase):
 
     def setUp(self):
-        """Set up a mock database for testing."""
+        """Set up a mock database and an offline geolocator for testing."""
         self.mock_db = MagicMock(spec=Database)
-        self.analysis = Analysis(self.mock_db)
+        self.mock_db.get_cached_geocodes.return_value = {}
+        self.mock_geolocator = MagicMock()
+        self.analysis = Analysis(self.mock_db, geolocator=self.mock_geolocator)
 
-    @patch('geopy.geocoders.Nominatim')
-    def test_find_nearest_stations(self, MockNominatim):
+    def test_find_nearest_stations(self):
         """Test the find_nearest_stations method."""
         # Mock the geolocator
-        mock_geolocator = MockNominatim.return_value
+        mock_geolocator = self.mock_geolocator
         mock_location = MagicMock()
         mock_location.latitude = 52.52
         mock_location.longitude = 13.40
@@ -42,6 +45,61 @@ class TestAnalysis(unittest.TestCase):
         self.assertEqual(nearest_stations[0][0], 1) # Closest is Berlin-Mitte
         self.assertEqual(nearest_stations[1][0], 2) # Second closest is Prenzlauer Berg
 
+    def test_split_period(self):
+        """Test that a date range is split into whole years, whole months and remaining days."""
+        day_ranges, months, years = Analysis._split_period(date(2019, 11, 15), date(2022, 2, 3))
+
+        self.assertEqual(years, ['2020', '2021'])
+        self.assertEqual(months, ['2019-12', '2022-01'])
+        self.assertEqual(day_ranges, [(date(2019, 11, 15), date(2019, 11, 30)), (date(2022, 2, 1), date(2022, 2, 3))])
+
+
+class TestPeriodStatistics(unittest.TestCase):
+
+    def setUp(self):
+        """Set up a database with two years of daily data for one station."""
+        self.test_dir = "test_analysis_dir"
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+        os.makedirs(self.test_dir)
+        self.db = Database(os.path.join(self.test_dir, "test.db"), -999, 'latin-1')
+        self.db.create_connection()
+        self.db.create_tables(os.path.join(os.path.dirname(__file__), '..', 'Create_table.sql'))
+        days = [date.fromordinal(d) for d in range(date(2020, 1, 1).toordinal(), date(2022, 1, 1).toordinal())]
+        rows = [['7', f"{day:%Y%m%d}", f"{day.day}.0", '1.5'] for day in days]
+        self.db.insert_records(['STATIONS_ID', 'MESS_DATUM', 'TMK', 'RSK'], rows, 'synthetic')
+        self.analysis = Analysis(self.db, geolocator=MagicMock())
+
+    def tearDown(self):
+        self.db.close_connection()
+        shutil.rmtree(self.test_dir)
+
+    def test_get_period_statistics_matches_raw_data(self):
+        """Test that statistics combined from rollups equal the ones computed from raw rows."""
+        start, end = date(2020, 2, 10), date(2021, 12, 31)
+        stats = self.analysis.get_period_statistics([7, 8], start, end, columns=('TMK', 'RSK'))
+
+        raw = self.db.get_measurements(7, start, end, columns=('TMK', 'RSK'))
+        self.assertEqual(list(stats), [7])
+        self.assertEqual(stats[7]['days'], len(raw))
+        self.assertAlmostEqual(stats[7]['TMK']['mean'], sum(r[2] for r in raw) / len(raw))
+        self.assertAlmostEqual(stats[7]['RSK']['sum'], 1.5 * len(raw))
+        self.assertEqual((stats[7]['TMK']['min'], stats[7]['TMK']['max']), (1.0, 31.0))
+
+    def test_get_period_statistics_without_rollups(self):
+        """Test that a database without maintained rollups is answered from the raw rows."""
+        self.db.close_connection()
+        self.db = Database(self.db.db_file, -999, 'latin-1', maintain_rollups=False)
+        self.db.create_connection()
+        days = [date.fromordinal(d) for d in range(date(2020, 1, 1).toordinal(), date(2021, 1, 1).toordinal())]
+        self.db.insert_records(['STATIONS_ID', 'MESS_DATUM', 'TMK'],
+                               [['9', f"{day:%Y%m%d}", '2.0'] for day in days], 'synthetic')
+
+        stats = Analysis(self.db, geolocator=MagicMock()).get_period_statistics([9], '2020-01-01', '2020-12-31')
+
+        self.assertEqual(stats[9]['days'], 366)
+        self.assertEqual(stats[9]['TMK']['mean'], 2.0)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,61 @@
+import unittest
+import os
+import shutil
+import sys
+import zipfile
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.run import compare, run_benchmark
+from benchmarks.synthetic import generate_archives
+
+
+class TestBenchmarks(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = "test_benchmarks_dir"
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+        os.makedirs(self.test_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_generate_archives(self):
+        """Test that generated archives have the requested size, noise lines and index."""
+        paths = generate_archives(self.test_dir, stations=2, years=1, missing_rate=0.5, noise_lines=2)
+
+        self.assertEqual(len(paths), 2)
+        with zipfile.ZipFile(paths[0]) as zipf:
+            product = [name for name in zipf.namelist() if name.startswith('produkt_')][0]
+            lines = zipf.read(product).decode('latin-1').splitlines()
+        self.assertTrue(lines[2].startswith('STATIONS_ID'))
+        self.assertEqual(len(lines), 2 + 1 + 366)  # 2000 is a leap year
+        self.assertIn('-999', lines[3] + lines[4])
+        self.assertTrue(os.path.exists(os.path.join(self.test_dir, 'index.html')))
+
+    def test_run_benchmark_reports_all_stages(self):
+        """Test a tiny end-to-end run."""
+        results = run_benchmark(stations=2, years=1, queries=20, work_dir=self.test_dir)
+
+        self.assertEqual(set(results['stages']), {'download', 'process', 'insert', 'stations', 'nearest'})
+        self.assertEqual(results['stages']['insert']['rows'], 2 * 366)
+        self.assertEqual(results['stages']['stations']['rows'], 1100)
+        self.assertIn('p99_ms', results['stages']['nearest'])
+
+    def test_compare_flags_regressions(self):
+        """Test that throughput drops and latency increases beyond the threshold are flagged."""
+        baseline = {'stages': {'insert': {'rows_per_s': 1000.0, 'p99_ms': 10.0},
+                               'nearest': {'p50_ms': 1.0}}}
+        results = {'stages': {'insert': {'rows_per_s': 700.0, 'p99_ms': 11.0},
+                              'nearest': {'p50_ms': 0.5}}}
+
+        regressions = compare(results, baseline, threshold=0.2)
+
+        self.assertEqual(len(regressions), 1)
+        self.assertTrue(regressions[0].startswith('insert.rows_per_s'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+import unittest
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+from contextlib import redirect_stdout
+from datetime import date, timedelta
+from unittest.mock import MagicMock, patch
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import cli
+from data_ingestion.database import Database
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+class TestCli(unittest.TestCase):
+
+    def setUp(self):
+        """Set up a database with two stations and ten days of data each."""
+        self.test_dir = os.path.abspath("test_cli_dir")
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+        self.db_file = os.path.join(self.test_dir, "test.db")
+        db = Database(self.db_file, -999, 'latin-1')
+        db.create_connection()
+        db.create_tables(os.path.join(ROOT_DIR, 'Create_table.sql'))
+        db.conn.executemany(
+            "INSERT INTO Station (Station_ID, geoBreite, geoLaenge, Stationsname) VALUES (?, ?, ?, ?)",
+            [(1, 52.52, 13.40, 'Berlin'), (2, 48.13, 11.57, 'Muenchen')]
+        )
+        db.conn.commit()
+        rows = [[station_id, f"{date(2020, 1, 1) + timedelta(days=i):%Y%m%d}", str(float(i)), '0.5']
+                for station_id in ('1', '2') for i in range(10)]
+        db.insert_records(['STATIONS_ID', 'MESS_DATUM', 'TMK', 'RSK'], rows, 'test')
+        db.close_connection()
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def _main(self, *argv):
+        out = io.StringIO()
+        with redirect_stdout(out):
+            code = cli.main(['--db', self.db_file] + list(argv))
+        return code, out.getvalue()
+
+    def test_nearest_by_coordinates(self):
+        code, out = self._main('nearest', '--lat', '52.5', '--lon', '13.4', '-k', '2')
+        self.assertEqual(code, 0)
+        self.assertEqual([line.split('\t')[1] for line in out.splitlines()], ['Berlin', 'Muenchen'])
+
+    def test_nearest_by_address_caches_the_geocode(self):
+        location = MagicMock(latitude=48.1, longitude=11.6)
+        with patch('backend.analysis._LazyNominatim.geocode', return_value=location) as geocode:
+            self._main('nearest', 'Marienplatz, Muenchen', '-k', '1')
+            code, out = self._main('nearest', 'Marienplatz, Muenchen', '-k', '1')
+        self.assertEqual(code, 0)
+        self.assertTrue(out.startswith('2\tMuenchen\t'))
+        self.assertEqual(geocode.call_count, 1)
+
+    def test_query_and_stats(self):
+        code, out = self._main('query', '1', '--start', '2020-01-02', '--end', '20200103', '--columns', 'TMK,RSK')
+        self.assertEqual(code, 0)
+        self.assertEqual(out.splitlines(), ['Station_ID,MESS_DATUM,TMK,RSK',
+                                            '1,2020-01-02,1.0,0.5', '1,2020-01-03,2.0,0.5'])
+
+        code, out = self._main('stats', '1', '2', '--start', '2020-01-01', '--end', '2020-01-10')
+        self.assertEqual(json.loads(out)['2']['TMK']['mean'], 4.5)
+
+        self.assertEqual(self._main('stats', '1', '--start', '2020-01-01', '--end', '2020-01-10',
+                                    '--columns', 'QN_3')[0], 2)
+
+    def test_missing_database_is_not_created(self):
+        missing = os.path.join(self.test_dir, "missing.db")
+        for argv in (['nearest', 'Berlin'], ['query', '1', '--start', '2020-01-01', '--end', '2020-01-02']):
+            with self.assertRaises(SystemExit) as raised:
+                cli.main(['--db', missing] + argv)
+            self.assertIn("does not exist", str(raised.exception.code))
+        self.assertFalse(os.path.exists(missing))
+
+    def test_database_errors_are_reported_cleanly(self):
+        """Test that a database without the GeocodeCache table gives an error message instead of a traceback."""
+        db = Database(self.db_file, -999, 'latin-1')
+        db.create_connection()
+        db.conn.execute("DROP TABLE GeocodeCache")
+        db.close_connection()
+        with patch('backend.analysis._LazyNominatim.geocode') as geocode, patch('sys.stderr', new=io.StringIO()) as err:
+            code, _ = self._main('nearest', 'Marienplatz, Muenchen')
+        self.assertEqual(code, 1)
+        self.assertIn("GeocodeCache", err.getvalue())
+        geocode.assert_not_called()
+
+    def test_lookup_does_not_import_heavy_modules(self):
+        code = ("import sys, cli; cli.main(['--db', sys.argv[1], 'nearest', '--lat', '52', '--lon', '13']);"
+                "print(sorted(m for m in ('pandas', 'geopy', 'requests', 'yaml') if m in sys.modules))")
+        result = subprocess.run([sys.executable, '-c', code, self.db_file], cwd=ROOT_DIR,
+                                capture_output=True, text=True, check=True)
+        self.assertEqual(result.stdout.splitlines()[-1], '[]')
+
+    def test_processor_imports_pandas_lazily(self):
+        code = "import sys, data_ingestion.processor; print(sorted(m for m in ('numpy', 'pandas') if m in sys.modules))"
+        result = subprocess.run([sys.executable, '-c', code], cwd=ROOT_DIR, capture_output=True, text=True, check=True)
+        self.assertEqual(result.stdout.strip(), '[]')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import unittest
+import os
+import shutil
+import sys
+from datetime import date, timedelta
+
+import numpy as np
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from data_ingestion.database import Database
+from backend.climatology import Climatology
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+class TestClimatology(unittest.TestCase):
+
+    def setUp(self):
+        """Set up two stations with daily data for 2000 and 2001."""
+        self.test_dir = "test_climatology_dir"
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+        self.db = Database(os.path.join(self.test_dir, "test.db"), -999, 'latin-1')
+        self.db.create_connection()
+        self.db.create_tables(os.path.join(ROOT_DIR, 'Create_table.sql'))
+        self.db.conn.executemany(
+            "INSERT INTO Station (Station_ID, geoBreite, geoLaenge, Stationsname) VALUES (?, ?, ?, ?)",
+            [(1, 52.52, 13.40, 'Berlin'), (2, 48.13, 11.57, 'Muenchen')]
+        )
+        self.db.conn.commit()
+        rows = []
+        day = date(2000, 1, 1)
+        while day <= date(2001, 12, 31):
+            # Station 1: 2000 at 0 °C with frost every January day, 2001 at 2 °C; 5 mm rain every day
+            tmk = 0.0 if day.year == 2000 else 2.0
+            tnk = -1.0 if day.month == 1 else 1.0
+            # The only January value of 2001 that is formally checked (QN 1) is excluded by the default quality filter
+            qn = 1 if day == date(2001, 1, 1) else 10
+            rows.append(['1', f"{day:%Y%m%d}", str(tmk), str(tnk), '26.0', '5.0', str(qn)])
+            # Station 2 only has the first half of every month
+            if day.day <= 15:
+                rows.append(['2', f"{day:%Y%m%d}", '10.0', '5.0', '20.0', '0.0', '10'])
+            day += timedelta(days=1)
+        self.db.insert_records(['STATIONS_ID', 'MESS_DATUM', 'TMK', 'TNK', 'TXK', 'RSK', 'QN_4'], rows, 'test')
+        self.climatology = Climatology(self.db)
+
+    def tearDown(self):
+        self.db.close_connection()
+        shutil.rmtree(self.test_dir)
+
+    def test_period_values_respect_coverage(self):
+        values = self.climatology.period_values(None, 2000, 2001, columns=('TMK', 'RSK'), freq='month')
+        self.assertEqual(values.loc[(1, '2000-02'), 'RSK'], 29 * 5.0)
+        self.assertEqual(values.loc[(1, '2001-03'), 'TMK'], 2.0)
+        self.assertTrue(values.loc[2, 'TMK'].isna().all())
+
+        lenient = Climatology(self.db, min_coverage=0.4).period_values([2], 2000, 2000, freq='year')
+        self.assertEqual(lenient.loc[(2, '2000'), 'TMK'], 10.0)
+
+    def test_climatology_and_anomalies(self):
+        normals = self.climatology.climatology([1, 2], 2000, 2001, freq='month')
+        self.assertEqual(normals.loc[(1, 7), 'TMK'], 1.0)
+        self.assertTrue(np.isnan(normals.loc[(2, 7), 'TMK']))
+
+        daily = self.climatology.climatology([1], 2000, 2001, freq='day')
+        self.assertEqual(daily.loc[(1, '03-01'), 'TMK'], 1.0)
+        self.assertEqual(daily.loc[(1, '02-29'), 'TMK'], 0.0)
+
+        anomalies = self.climatology.anomalies([1], 2001, 2001, reference=(2000, 2000), freq='month')
+        self.assertEqual(len(anomalies), 12)
+        self.assertTrue((anomalies['TMK'] == 2.0).all())
+        yearly = self.climatology.anomalies([1], 2000, 2001, reference=(2000, 2001), freq='year')
+        self.assertEqual(list(yearly['TMK']), [-1.0, 1.0])
+
+    def test_threshold_days_with_quality_filter(self):
+        counts = self.climatology.threshold_days([1, 2], 2000, 2001)
+        self.assertEqual(counts.loc[(1, '2000'), 'frost_days'], 31)
+        self.assertEqual(counts.loc[(1, '2000'), 'summer_days'], 366)
+        self.assertEqual(counts.loc[(1, '2000'), 'tropical_nights'], 0)
+        self.assertTrue(counts.loc[2].isna().all().all())
+
+        indices = {'frost_days': ('TNK', '<', 0)}
+        monthly = self.climatology.threshold_days([1], 2001, 2001, indices=indices, freq='month')
+        self.assertEqual(monthly.loc[(1, '2001-01'), 'frost_days'], 30)
+        unchecked = Climatology(self.db, quality_levels=None)
+        monthly = unchecked.threshold_days([1], 2001, 2001, indices=indices, freq='month')
+        self.assertEqual(monthly.loc[(1, '2001-01'), 'frost_days'], 31)
+
+        with self.assertRaises(ValueError):
+            self.climatology.threshold_days([1], 2000, 2000, indices={'bad': ('TNK', '!=', 0)})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import unittest
+import os
+import shutil
+import sys
+from datetime import date
+
+import numpy as np
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from backend.columnar import ColumnarStore
+from data_ingestion.database import Database
+from data_ingestion import exporter
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+class TestColumnarExport(unittest.TestCase):
+
+    def setUp(self):
+        """Set up a database with a gap in the series of one station."""
+        self.test_dir = "test_columnar_dir"
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+        os.makedirs(self.test_dir)
+        self.db = Database(os.path.join(self.test_dir, "test.db"), -999, 'latin-1')
+        self.db.create_connection()
+        self.db.create_tables(os.path.join(ROOT_DIR, 'Create_table.sql'))
+        rows = [['5', '20230101', '1.0', '0.5'], ['5', '20230102', '-999', '0.0'], ['5', '20230105', '5.0', '2.5']]
+        self.db.insert_records(['STATIONS_ID', 'MESS_DATUM', 'TMK', 'RSK'], rows, 'synthetic')
+        self.export_dir = os.path.join(self.test_dir, "columnar")
+        self.store = ColumnarStore(self.export_dir)
+
+    def tearDown(self):
+        self.db.close_connection()
+        shutil.rmtree(self.test_dir)
+
+    def _check_round_trip(self, file_format):
+        exporter.ColumnarExporter(self.db, self.export_dir, file_format).export_stations([5])
+
+        dates, values = self.store.load(5, columns=('TMK', 'RSK'))
+        self.assertEqual(str(dates[0]), '2023-01-01')
+        self.assertEqual(len(dates), 5)
+        np.testing.assert_array_equal(values['TMK'], [1.0, np.nan, np.nan, np.nan, 5.0])
+        self.assertEqual(values['RSK'].dtype, np.float32)
+
+        frame = self.store.load_frame(5, columns=('RSK',), start=date(2023, 1, 4), end='20230110')
+        self.assertEqual(len(frame), 2)
+        self.assertEqual(frame['RSK'].iloc[1], 2.5)
+        self.assertEqual(self.store.stations(), [5])
+        self.assertIsNone(self.store.load(6))
+
+    def test_npy_round_trip(self):
+        """Test that .npy exports are memory mapped and sliced by date."""
+        self._check_round_trip('npy')
+        _, values = self.store.load(5, columns=('TMK',))
+        self.assertIsInstance(values['TMK'].base, np.memmap)
+
+    @unittest.skipIf(exporter.pa is None, "pyarrow is not installed")
+    def test_arrow_round_trip(self):
+        """Test that Arrow exports are read back without copying."""
+        self._check_round_trip('arrow')
+        self.assertFalse(os.path.exists(os.path.join(self.export_dir, '5')))
+
+    def test_listener_reports_written_stations(self):
+        """Test that import listeners receive the stations and day ranges written."""
+        written = []
+        self.db.add_import_listener(written.append)
+        self.db.insert_records(['STATIONS_ID', 'MESS_DATUM', 'TMK'], [['7', '20230103', '1.0']], 'synthetic')
+        self.assertEqual(written, [{7: ('2023-01-03', '2023-01-03')}])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,156 @@
+import unittest
+import os
+import shutil
+import sys
+from datetime import date
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from data_ingestion.database import Database
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+MEASUREMENT_HEADER = "STATIONS_ID;MESS_DATUM;QN_3;FX;FM;QN_4;RSK;RSKF;SDK;SHK_TAG;NM;VPM;PM;TMK;UPM;TXK;TNK;TGK;eor\n"
+
+
+class TestDatabase(unittest.TestCase):
+
+    def setUp(self):
+        """Set up a fresh database for each test."""
+        self.test_dir = "test_db_dir"
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+        os.makedirs(self.test_dir)
+        self.db = Database(os.path.join(self.test_dir, "test.db"), -999, 'latin-1', batch_size=2)
+        self.db.create_connection()
+        self.db.create_tables(os.path.join(ROOT_DIR, 'Create_table.sql'))
+
+    def tearDown(self):
+        """Clean up the test environment after each test."""
+        self.db.close_connection()
+        shutil.rmtree(self.test_dir)
+
+    def _write(self, name, content):
+        path = os.path.join(self.test_dir, name)
+        with open(path, 'w', encoding='latin-1') as f:
+            f.write(content)
+        return path
+
+    def test_insert_csv_measurements_in_batches(self):
+        """Test that measurement rows are inserted across several batches with NA handling."""
+        rows = "".join(
+            f"1;2023010{day};1;10.0;5.0;3;0.5;1;8.0;0;7.0;10.0;1010.0;{day}.0;70.0;8.0;-999;1.0;eor\n"
+            for day in range(1, 6)
+        )
+        path = self._write("produkt.csv", MEASUREMENT_HEADER + rows)
+
+        inserted = self.db.insert_csv(path, ';', bulk=True)
+
+        self.assertEqual(inserted, 5)
+        result = self.db.conn.execute("SELECT COUNT(*), SUM(TMK), COUNT(TNK) FROM Measurement").fetchone()
+        self.assertEqual(result, (5, 15.0, 0))
+
+    def test_insert_csv_skips_only_bad_rows(self):
+        """Test that an IntegrityError in one batch only drops the offending row."""
+        self.db.import_mode = 'append'
+        path = self._write("stations.csv",
+                           "Station_ID;Stationsname\n1;A\n2;B\n2;Duplicate\n3;C\n4;D\n")
+
+        inserted = self.db.insert_csv(path, ';')
+
+        self.assertEqual(inserted, 4)
+        names = [row[0] for row in self.db.conn.execute("SELECT Stationsname FROM Station ORDER BY Station_ID")]
+        self.assertEqual(names, ['A', 'B', 'C', 'D'])
+
+    def test_insert_csv_upsert_is_idempotent(self):
+        """Test that importing the same measurements twice updates instead of duplicating."""
+        path = self._write("produkt.csv", MEASUREMENT_HEADER +
+                           "1;20230101;1;10.0;5.0;3;0.5;1;8.0;0;7.0;10.0;1010.0;1.0;70.0;8.0;1.0;1.0;eor\n")
+        self.db.insert_csv(path, ';')
+        path = self._write("produkt.csv", MEASUREMENT_HEADER +
+                           "1;20230101;1;10.0;5.0;3;0.5;1;8.0;0;7.0;10.0;1010.0;2.0;70.0;8.0;1.0;1.0;eor\n"
+                           "1;20230102;1;10.0;5.0;3;0.5;1;8.0;0;7.0;10.0;1010.0;3.0;70.0;8.0;1.0;1.0;eor\n")
+        self.db.insert_csv(path, ';')
+
+        rows = self.db.conn.execute("SELECT MESS_DATUM, TMK FROM Measurement ORDER BY MESS_DATUM").fetchall()
+        self.assertEqual(rows, [('2023-01-01', 2.0), ('2023-01-02', 3.0)])
+
+    def test_get_measurements(self):
+        """Test station and date range filtering and column selection."""
+        rows = "".join(
+            f"{station};2023010{day};1;10.0;5.0;3;0.{day};1;8.0;0;7.0;10.0;1010.0;{day}.0;70.0;8.0;1.0;1.0;eor\n"
+            for station in (1, 2, 3) for day in range(1, 6)
+        )
+        self.db.insert_csv(self._write("produkt.csv", MEASUREMENT_HEADER + rows), ';')
+
+        result = self.db.get_measurements([3, 1], '20230102', date(2023, 1, 3), columns=('TMK', 'RSK'))
+
+        self.assertEqual(result, [
+            (1, '2023-01-02', 2.0, 0.2), (1, '2023-01-03', 3.0, 0.3),
+            (3, '2023-01-02', 2.0, 0.2), (3, '2023-01-03', 3.0, 0.3),
+        ])
+        with self.assertRaises(ValueError):
+            self.db.get_measurements(1, columns=('TMK; DROP TABLE Station',))
+
+    def test_migrate_measurement_layout(self):
+        """Test that a legacy Measurement table is converted to the clustered layout."""
+        self.db.conn.executescript("""
+            DROP TABLE Measurement;
+            CREATE TABLE Measurement (m_ID INTEGER PRIMARY KEY, Station_ID INTEGER, MESS_DATUM DATE, TMK REAL);
+            INSERT INTO Measurement (Station_ID, MESS_DATUM, TMK) VALUES (1, 20230101, 1.0), (1, 20230101, 9.0), (1, 20230102, 2.0);
+        """)
+
+        self.assertTrue(self.db.migrate_measurement_layout(os.path.join(ROOT_DIR, 'Create_table.sql')))
+
+        rows = self.db.get_measurements(1, columns=('TMK',))
+        self.assertEqual(rows, [(1, '2023-01-01', 1.0), (1, '2023-01-02', 2.0)])
+        self.assertFalse(self.db.migrate_measurement_layout(os.path.join(ROOT_DIR, 'Create_table.sql')))
+
+    def test_rollups_follow_imports(self):
+        """Test that monthly and yearly rollups are maintained for the imported periods."""
+        rows = "".join(
+            f"1;{day};1;10.0;5.0;3;{rsk};1;8.0;0;7.0;10.0;1010.0;{tmk};70.0;8.0;1.0;1.0;eor\n"
+            for day, rsk, tmk in [('20230130', 1.0, 2.0), ('20230131', 2.0, 4.0), ('20230201', 4.0, -999)]
+        )
+        self.db.insert_csv(self._write("produkt.csv", MEASUREMENT_HEADER + rows), ';')
+
+        monthly = self.db.get_rollups(1, 'month', columns=('TMK', 'RSK'))
+        self.assertEqual(monthly, [(1, '2023-01', 2, 6.0, 2, 2.0, 4.0, 3.0, 2, 1.0, 2.0),
+                                   (1, '2023-02', 1, None, 0, None, None, 4.0, 1, 4.0, 4.0)])
+
+        # Re-importing a changed day only updates the affected rollups
+        update = "1;20230201;1;10.0;5.0;3;6.0;1;8.0;0;7.0;10.0;1010.0;9.0;70.0;8.0;1.0;1.0;eor\n"
+        self.db.insert_csv(self._write("produkt.csv", MEASUREMENT_HEADER + update), ';')
+
+        yearly = self.db.get_rollups(1, 'year', columns=('TMK', 'RSK'))
+        self.assertEqual(yearly, [(1, '2023', 3, 15.0, 3, 2.0, 9.0, 9.0, 3, 1.0, 6.0)])
+
+    def test_manifest_round_trip(self):
+        """Test that recorded archives are returned by get_manifest."""
+        self.db.record_archive('a.zip', 10, 'abc', 5)
+        self.db.record_archive('a.zip', 12, 'def', 6)
+        self.assertEqual(self.db.get_manifest(), {'a.zip': (12, 'def')})
+
+    def test_upsert_stations_notifies_listeners(self):
+        """Test that station metadata is upserted and station listeners see the written IDs."""
+        notified = []
+        self.db.add_station_listener(notified.append)
+        row = (1, '1937-01-01', '1986-06-30', 478, 47.8413, 8.8493, 'Aach', 'Baden-Württemberg', 'Frei')
+        self.assertEqual(self.db.upsert_stations([row, (2,) + row[1:6] + ('Aalen', None, 'Frei')]), 2)
+        self.assertEqual(self.db.upsert_stations([row[:6] + ('Aach (Hegau)',) + row[7:]]), 1)
+
+        self.assertEqual(notified, [{1, 2}, {1}])
+        self.assertEqual(self.db.get_all_stations()[0], (1, 47.8413, 8.8493, 'Aach (Hegau)'))
+        self.assertEqual(self.db.get_station_period(1), ('1937-01-01', '1986-06-30'))
+
+    def test_bulk_load_restores_pragmas(self):
+        """Test that bulk_load restores the previous PRAGMA values."""
+        before = self.db.conn.execute("PRAGMA synchronous").fetchone()[0]
+        with self.db.bulk_load():
+            self.assertEqual(self.db.conn.execute("PRAGMA synchronous").fetchone()[0], 0)
+        self.assertEqual(self.db.conn.execute("PRAGMA synchronous").fetchone()[0], before)
+
+
+if __name__ == '__main__':
+    unittest.main()
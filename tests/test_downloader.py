@@ -7,7 +7,9 @@ import sys
 # Add the project root to the Python path to allow importing 'wetter'
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+from data_ingestion.archive_cache import ArchiveCache
 from data_ingestion.downloader import Downloader
+from benchmarks.synthetic import ConditionalHandler, LocalArchiveServer, write_index, write_kl_archive
 
 class TestDownloader(unittest.TestCase):
 
@@ -53,6 +55,7 @@ class TestDownloader(unittest.TestCase):
         mock_file_content = b'dummy zip content'
         mock_response = MagicMock()
         mock_response.status_code = 200
+        mock_response.headers = {'Content-Length': str(len(mock_file_content))}
         mock_response.iter_content.return_value = [mock_file_content]
         mock_get.return_value = mock_response
 
@@ -67,5 +70,130 @@ class TestDownloader(unittest.TestCase):
             content = f.read()
         self.assertEqual(content, mock_file_content)
 
+
+class TestArchiveCache(unittest.TestCase):
+
+    def setUp(self):
+        """Serve two archives with ETag and Range support."""
+        self.test_dir = "test_archive_cache_dir"
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+        self.served_dir = os.path.join(self.test_dir, "served")
+        self.cache_dir = os.path.join(self.test_dir, "cache")
+        os.makedirs(self.served_dir)
+        self.archives = [write_kl_archive(self.served_dir, station_id, days=400) for station_id in (1, 2)]
+        # The downloader cannot tell, but this one is large enough to be cut off mid-download
+        self.large = os.path.join(self.served_dir, "tageswerte_KL_00003_20200101_20201231_hist.zip")
+        with open(self.large, 'wb') as f:
+            f.write(os.urandom(300000))
+        write_index(self.served_dir)
+        ConditionalHandler.requests = []
+        ConditionalHandler.truncate_after = None
+
+    def tearDown(self):
+        ConditionalHandler.truncate_after = None
+        shutil.rmtree(self.test_dir)
+
+    def _downloader(self, server, max_bytes=None):
+        return Downloader(server.url, self.cache_dir, cache=ArchiveCache(self.cache_dir, max_bytes))
+
+    def test_conditional_requests_and_resume(self):
+        with LocalArchiveServer(self.served_dir, handler=ConditionalHandler) as server:
+            urls = self._downloader(server).get_file_urls(r'href="(tageswerte_KL_.*?\.zip)"')
+            url = urls[0]
+
+            # A dropped connection leaves only a .part file, which the next run resumes
+            ConditionalHandler.truncate_after = 200000
+            large_url = server.url + os.path.basename(self.large)
+            downloader = self._downloader(server)
+            self.assertIsNone(downloader.download_file(large_url))
+            large_path = downloader.cache.path(large_url)
+            self.assertEqual(os.path.dirname(os.path.dirname(large_path)), self.cache_dir)
+            self.assertFalse(os.path.exists(large_path))
+            self.assertTrue(0 < os.path.getsize(large_path + '.part') < 300000)
+
+            ConditionalHandler.truncate_after = None
+            downloader = self._downloader(server)
+            self.assertEqual(downloader.download_file(large_url), large_path)
+            with open(large_path, 'rb') as f, open(self.large, 'rb') as served:
+                self.assertEqual(f.read(), served.read())
+            self.assertEqual(ConditionalHandler.requests[-1][1], 206)
+
+            local_path = downloader.cache.path(url)
+            self.assertEqual(downloader.download_file(url), local_path)
+
+            # A new instance revalidates the index page and the archive instead of downloading them
+            downloader = self._downloader(server)
+            self.assertEqual(downloader.get_file_urls(r'href="(tageswerte_KL_.*?\.zip)"'), urls)
+            self.assertEqual(downloader.download_file(url), local_path)
+            self.assertEqual([status for _, status in ConditionalHandler.requests[-2:]], [304, 304])
+
+            # A changed archive is downloaded again
+            write_kl_archive(self.served_dir, 1, days=500, name=os.path.basename(url))
+            self.assertEqual(downloader.download_file(url), local_path)
+            self.assertEqual(ConditionalHandler.requests[-1][1], 200)
+            self.assertEqual(os.path.getsize(local_path), os.path.getsize(self.archives[0]))
+
+    def test_equally_named_files_of_different_urls(self):
+        """Test that files with the same name in different server directories get separate cache entries."""
+        for sub_dir, days in (("historical", 400), ("recent", 500)):
+            os.makedirs(os.path.join(self.served_dir, sub_dir))
+            write_kl_archive(os.path.join(self.served_dir, sub_dir), 1, days=days, name="tageswerte_KL_00001.zip")
+        with LocalArchiveServer(self.served_dir, handler=ConditionalHandler) as server:
+            downloader = self._downloader(server)
+            historical = downloader.download_file(server.url + "historical/tageswerte_KL_00001.zip")
+            recent = downloader.download_file(server.url + "recent/tageswerte_KL_00001.zip")
+            self.assertNotEqual(historical, recent)
+            self.assertEqual(os.path.basename(historical), "tageswerte_KL_00001.zip")
+            self.assertNotEqual(downloader.cache.digest(historical), downloader.cache.digest(recent))
+
+            # Both copies stay valid, so revalidating either one is answered with a 304
+            self.assertEqual(downloader.download_file(server.url + "historical/tageswerte_KL_00001.zip"), historical)
+            self.assertEqual(downloader.download_file(server.url + "recent/tageswerte_KL_00001.zip"), recent)
+            self.assertEqual([status for _, status in ConditionalHandler.requests[-2:]], [304, 304])
+
+    def test_failed_download_releases_pin(self):
+        """Test that an error other than a RequestException does not leave the file pinned."""
+        downloader = Downloader("http://127.0.0.1:9/", self.cache_dir, cache=ArchiveCache(self.cache_dir))
+        with patch.object(Downloader, '_fetch', side_effect=OSError("disk full")):
+            with self.assertRaises(OSError):
+                downloader.download_file("http://127.0.0.1:9/tageswerte_KL_00001.zip")
+        self.assertFalse(downloader.cache._pinned)
+
+    def test_revalidated_archive_outlives_unused_archive(self):
+        """Test that the use time of a 304 revalidation is persisted and orders the eviction of a later run."""
+        with LocalArchiveServer(self.served_dir, handler=ConditionalHandler) as server:
+            urls = [server.url + os.path.basename(path) for path in self.archives]
+            downloader = self._downloader(server)
+            for url in urls:
+                downloader.cache.release(downloader.download_file(url))
+
+            # A later run only revalidates the first archive, which was downloaded earlier than the second
+            downloader = self._downloader(server)
+            revalidated = downloader.download_file(urls[0])
+            self.assertEqual(ConditionalHandler.requests[-1][1], 304)
+            downloader.cache.release(revalidated)
+
+        cache = ArchiveCache(self.cache_dir, max_bytes=os.path.getsize(self.archives[0]) + 10)
+        cache.trim()
+        self.assertTrue(os.path.exists(revalidated))
+        self.assertFalse(os.path.exists(cache.path(urls[1])))
+
+    def test_lru_eviction_spares_pinned_files(self):
+        with LocalArchiveServer(self.served_dir, handler=ConditionalHandler) as server:
+            downloader = self._downloader(server, max_bytes=os.path.getsize(self.archives[0]) + 10)
+            first = downloader.download_file(server.url + os.path.basename(self.archives[0]))
+            second = downloader.download_file(server.url + os.path.basename(self.archives[1]))
+            # Both are pinned until released, so nothing is evicted yet
+            self.assertTrue(os.path.exists(first) and os.path.exists(second))
+
+            downloader.cache.release(first)
+            self.assertFalse(os.path.exists(first))
+            downloader.cache.release(second)
+            self.assertTrue(os.path.exists(second))
+            self.assertEqual(downloader.cache.evictions, 1)
+            self.assertEqual(downloader.cache.size(), os.path.getsize(second))
+
+
 if __name__ == '__main__':
     unittest.main()
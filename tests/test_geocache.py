@@ -0,0 +1,93 @@
+import unittest
+from unittest.mock import MagicMock
+import os
+import shutil
+import sys
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from backend.geocache import GeocodeCache, normalize_address
+from data_ingestion.database import Database
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+class FakeGeolocator:
+    """Offline stand-in for Nominatim that knows a fixed set of addresses, spelled exactly as given."""
+    def __init__(self, known):
+        self.known = known
+        self.calls = []
+
+    def geocode(self, address):
+        self.calls.append(address)
+        coords = self.known.get(address)
+        if coords is None:
+            return None
+        return MagicMock(latitude=coords[0], longitude=coords[1])
+
+
+class TestGeocodeCache(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = "test_geocache_dir"
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+        os.makedirs(self.test_dir)
+        self.db = Database(os.path.join(self.test_dir, "test.db"), -999, 'latin-1')
+        self.db.create_connection()
+        self.db.create_tables(os.path.join(ROOT_DIR, 'Create_table.sql'))
+        self.geolocator = FakeGeolocator({'Berlin, Germany': (52.52, 13.40), 'Hamburg': (53.55, 9.99),
+                                          'Große Straße 1, Lübeck': (53.87, 10.69)})
+
+    def tearDown(self):
+        self.db.close_connection()
+        shutil.rmtree(self.test_dir)
+
+    def test_normalize_address(self):
+        self.assertEqual(normalize_address('  Berlin ,Germany  '), 'berlin, germany')
+
+    def test_repeated_lookups_hit_the_cache(self):
+        """Test that equivalent addresses reach the geocoder only once."""
+        cache = GeocodeCache(self.geolocator, self.db)
+        self.assertEqual(cache.geocode('Berlin, Germany'), (52.52, 13.40))
+        self.assertEqual(cache.geocode('berlin ,  GERMANY'), (52.52, 13.40))
+        self.assertEqual(self.geolocator.calls, ['Berlin, Germany'])
+
+    def test_geocoder_receives_the_original_address(self):
+        """Test that the geocoder is asked with the caller's spelling, not the casefolded cache key."""
+        cache = GeocodeCache(self.geolocator, self.db)
+        result = cache.geocode_many(['Große Straße 1, Lübeck', 'GROSSE STRASSE 1 , LÜBECK'])
+        self.assertEqual(set(result.values()), {(53.87, 10.69)})
+        self.assertEqual(self.geolocator.calls, ['Große Straße 1, Lübeck'])
+
+    def test_persistent_tier_survives_new_instance(self):
+        """Test that results and misses are served from the database after a restart."""
+        GeocodeCache(self.geolocator, self.db).geocode_many(['Hamburg', 'Atlantis'])
+        self.geolocator.calls.clear()
+
+        result = GeocodeCache(self.geolocator, self.db).geocode_many(['Hamburg', 'Atlantis'])
+
+        self.assertEqual(result, {'Hamburg': (53.55, 9.99), 'Atlantis': None})
+        self.assertEqual(self.geolocator.calls, [])
+
+    def test_expired_entries_are_refreshed(self):
+        """Test that entries older than the TTL are looked up again."""
+        cache = GeocodeCache(self.geolocator, self.db, ttl_seconds=-1)
+        cache.geocode('Hamburg')
+        cache.geocode('Hamburg')
+        self.assertEqual(len(self.geolocator.calls), 2)
+
+    def test_lru_is_bounded(self):
+        """Test that the in-process tier evicts the least recently used address."""
+        cache = GeocodeCache(self.geolocator, None, max_entries=1)
+        cache.geocode_many(['Hamburg', 'Berlin, Germany', 'Hamburg'])
+        self.assertEqual(self.geolocator.calls, ['Hamburg', 'Berlin, Germany'])
+        cache.geocode('Berlin, Germany')
+        self.assertEqual(len(self.geolocator.calls), 2)
+        cache.geocode('Hamburg')
+        self.assertEqual(len(self.geolocator.calls), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import unittest
+from unittest.mock import MagicMock
+import os
+import shutil
+import sys
+
+import numpy as np
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from backend.analysis import Analysis
+from backend.interpolation import Interpolator
+from backend.series import StationSeriesStore
+from data_ingestion.database import Database
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+class TestInterpolator(unittest.TestCase):
+
+    def setUp(self):
+        """Create three stations on a line with a few days of data."""
+        self.test_dir = "test_interpolation_dir"
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+        os.makedirs(self.test_dir)
+        self.db = Database(os.path.join(self.test_dir, "test.db"), -999, 'latin-1')
+        self.db.create_connection()
+        self.db.create_tables(os.path.join(ROOT_DIR, 'Create_table.sql'))
+        self.db.conn.executemany(
+            "INSERT INTO Station (Station_ID, geoBreite, geoLaenge, Stationsname, Stattionhoehe) VALUES (?, ?, ?, ?, ?)",
+            [(1, 50.0, 10.0, 'A', 100), (2, 50.0, 10.2, 'B', 100), (3, 50.0, 12.0, 'Far', 1000)]
+        )
+        self.db.conn.executemany(
+            "INSERT INTO Measurement (Station_ID, MESS_DATUM, TMK, RSK) VALUES (?, ?, ?, ?)",
+            [(1, '2023-01-01', 10.0, 1.0), (1, '2023-01-02', None, 2.0),
+             (2, '2023-01-01', 20.0, 3.0), (2, '2023-01-02', 30.0, 4.0)]
+        )
+        self.db.conn.commit()
+        self.analysis = Analysis(self.db, geolocator=MagicMock())
+
+    def tearDown(self):
+        self.db.close_connection()
+        shutil.rmtree(self.test_dir)
+
+    def test_interpolate_midpoint(self):
+        """Test that a point between two stations gets their mean and gaps reweight to the other station."""
+        result = Interpolator(self.analysis, k=2).interpolate([(50.0, 10.1)], '20230101', '2023-01-03', ('TMK', 'RSK'))
+
+        self.assertEqual(list(result.dates.astype(str)), ['2023-01-01', '2023-01-02', '2023-01-03'])
+        tmk = result.values['TMK'][0]
+        self.assertAlmostEqual(tmk[0], 15.0, places=3)
+        self.assertAlmostEqual(tmk[1], 30.0)  # station 1 is missing this day
+        self.assertTrue(np.isnan(tmk[2]))  # no station has data
+        self.assertAlmostEqual(result.values['RSK'][0][1], 3.0, places=3)
+        self.assertEqual(sorted(result.station_ids[0]), [1, 2])
+
+    def test_interpolate_from_series_store(self):
+        """Test that reading the series from a StationSeriesStore gives the same result."""
+        store = StationSeriesStore(self.db, dtype=np.float64)
+        expected = Interpolator(self.analysis, k=2).interpolate([(50.0, 10.1), (50.0, 11.5)], '20221231', '20230103')
+        for _ in range(2):
+            result = Interpolator(self.analysis, k=2, store=store).interpolate(
+                [(50.0, 10.1), (50.0, 11.5)], '20221231', '20230103')
+            np.testing.assert_array_equal(result.values['TMK'], expected.values['TMK'])
+        # Station 3 has neither measurements nor a period and is not cached
+        self.assertEqual(store.stats()['hits'], 2)
+
+    def test_interpolate_at_station_and_invalid_points(self):
+        """Test that a point on a station returns its value and missing coordinates give NaN."""
+        result = Interpolator(self.analysis, k=3).interpolate([(50.0, 10.0), (np.nan, np.nan)], '20230101', '20230101')
+
+        self.assertEqual(result.values['TMK'][0][0], 10.0)
+        self.assertTrue(np.isnan(result.values['TMK'][1][0]))
+
+    def test_interpolate_only_invalid_points(self):
+        """Test that points or addresses without coordinates give NaN rows and no stations instead of failing."""
+        result = Interpolator(self.analysis, k=2).interpolate([(np.nan, np.nan)], '20230101', '20230102')
+        self.assertTrue(np.isnan(result.values['TMK']).all())
+        self.assertEqual(result.station_ids.tolist(), [[-1, -1]])
+
+        analysis = Analysis(self.db, geolocator=MagicMock(**{'geocode.return_value': None}))
+        result = Interpolator(analysis, k=2).interpolate_addresses(['nowhere'], '20230101', '20230102', ('TMK', 'RSK'))
+        self.assertEqual(result.values['RSK'].shape, (1, 2))
+        self.assertTrue(np.isnan(result.values['RSK']).all())
+        self.assertEqual(result.station_ids.tolist(), [[-1, -1]])
+
+    def test_height_correction(self):
+        """Test that temperatures are moved to the target height with the lapse rate."""
+        result = Interpolator(self.analysis, k=1).interpolate([(50.0, 10.0)], '20230101', '20230101',
+                                                              target_heights=[1100])
+
+        self.assertAlmostEqual(result.values['TMK'][0][0], 10.0 - 6.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import unittest
+import json
+import logging
+import os
+import sys
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from data_ingestion.metrics import MetricsRegistry, profile_run
+
+
+class TestMetricsRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.metrics = MetricsRegistry(max_events=2)
+
+    def test_snapshot_and_json(self):
+        """Test that counters, histograms and events end up in the JSON snapshot."""
+        self.metrics.inc("rows_inserted_total", 10, table="Measurement")
+        self.metrics.inc("rows_inserted_total", 5, table="Measurement")
+        self.metrics.observe("stage_seconds", 0.02, stage="parse")
+        for i in range(3):
+            self.metrics.event("download", f"file{i}.zip", bytes=100)
+
+        snapshot = json.loads(self.metrics.to_json())
+
+        self.assertEqual(snapshot['counters'], [{'name': 'rows_inserted_total', 'labels': {'table': 'Measurement'}, 'value': 15}])
+        histogram = snapshot['histograms'][0]
+        self.assertEqual((histogram['count'], histogram['buckets']['0.01'], histogram['buckets']['0.05']), (1, 0, 1))
+        self.assertEqual([event['file'] for event in snapshot['events']], ['file1.zip', 'file2.zip'])
+
+    def test_prometheus_format(self):
+        """Test the Prometheus text exposition output."""
+        self.metrics.inc("failures_total", stage="download")
+        with self.metrics.timer("commit_seconds"):
+            pass
+
+        text = self.metrics.to_prometheus()
+
+        self.assertIn('# TYPE wetter_failures_total counter\nwetter_failures_total{stage="download"} 1', text)
+        self.assertIn('wetter_commit_seconds_bucket{le="+Inf"} 1', text)
+        self.assertIn('wetter_commit_seconds_count 1', text)
+
+    def test_profile_run_logs_hot_spots(self):
+        with self.assertLogs('wetter.metrics', level=logging.INFO) as logs:
+            with profile_run(top=3):
+                sorted(range(10000), key=lambda x: -x)
+        self.assertTrue(any('CPU profile' in line for line in logs.output))
+        self.assertTrue(any('Peak traced memory' in line for line in logs.output))
+
+
+if __name__ == '__main__':
+    unittest.main()
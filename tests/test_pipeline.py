@@ -0,0 +1,206 @@
+import unittest
+import os
+import shutil
+import sys
+from datetime import date
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from data_ingestion.archive_cache import ArchiveCache
+from data_ingestion.database import Database
+from data_ingestion.downloader import Downloader
+from data_ingestion.importer import CsvImporter
+from data_ingestion.pipeline import IngestionPipeline
+from data_ingestion.processor import DataProcessor
+from benchmarks.synthetic import ConditionalHandler, LocalArchiveServer, write_index, write_kl_archive
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+SOURCE_CONFIG = {
+    'zip_pattern': r'href="(tageswerte_KL_.*?\.zip)"',
+    'product_pattern_to_extract': 'produkt_',
+    'header_keyword': 'STATIONS_ID',
+    'delimiter': ';',
+}
+
+
+class TestIngestionPipeline(unittest.TestCase):
+
+    def setUp(self):
+        """Serve synthetic archives from a local HTTP server."""
+        self.test_dir = "test_pipeline_dir"
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+        self.served_dir = os.path.join(self.test_dir, "served")
+        self.download_dir = os.path.join(self.test_dir, "download")
+        os.makedirs(self.served_dir)
+        for station_id in range(1, 7):
+            write_kl_archive(self.served_dir, station_id, start=date(2020, 1, 1), days=30)
+        write_index(self.served_dir)
+
+        self.db = Database(os.path.join(self.test_dir, "test.db"), -999, 'latin-1', batch_size=7)
+        self.db.create_connection()
+        self.db.create_tables(os.path.join(ROOT_DIR, 'Create_table.sql'))
+
+    def tearDown(self):
+        self.db.close_connection()
+        shutil.rmtree(self.test_dir)
+
+    def _run(self, streaming, **kwargs):
+        with LocalArchiveServer(self.served_dir) as server:
+            downloader = Downloader(server.url, self.download_dir, session=Downloader.create_session(pool_size=3))
+            processor = DataProcessor(self.download_dir, os.path.join(self.test_dir, "unzipped"), 'latin-1', -999)
+            pipeline = IngestionPipeline(downloader, processor, CsvImporter(self.db),
+                                         dict(SOURCE_CONFIG, streaming=streaming),
+                                         download_workers=3, parse_workers=2, max_pending=2, **kwargs)
+            return pipeline.run(downloader.get_file_urls(SOURCE_CONFIG['zip_pattern']))
+
+    def test_run_streaming(self):
+        """Test that all served archives end up in the database and are removed afterwards."""
+        stats = self._run(streaming=True)
+
+        self.assertEqual(stats['files'], 6)
+        self.assertEqual(stats['rows'], 180)
+        self.assertEqual(stats['failures'], 0)
+        count, stations = self.db.conn.execute(
+            "SELECT COUNT(*), COUNT(DISTINCT Station_ID) FROM Measurement").fetchone()
+        self.assertEqual((count, stations), (180, 6))
+        self.assertEqual(os.listdir(self.download_dir), [])
+
+    def test_run_streaming_in_batches(self):
+        """Test that archives streamed in batches smaller than an archive are imported and recorded once each."""
+        stats = self._run(streaming=True, stream_batch_rows=7)
+
+        self.assertEqual((stats['files'], stats['rows'], stats['failures']), (6, 180, 0))
+        self.assertEqual(self.db.conn.execute("SELECT COUNT(*) FROM Measurement").fetchone()[0], 180)
+        self.assertEqual(self.db.conn.execute("SELECT rows FROM IngestionManifest").fetchall(), [(30,)] * 6)
+
+    def test_rerun_skips_unchanged_archives(self):
+        """Test that a second run skips all archives recorded in the manifest."""
+        self._run(streaming=True)
+        stats = self._run(streaming=True)
+
+        self.assertEqual(stats['files'], 0)
+        self.assertEqual(stats['skipped'], 6)
+        self.assertEqual(self.db.conn.execute("SELECT COUNT(*) FROM Measurement").fetchone()[0], 180)
+
+    def test_rerun_imports_same_size_corrections(self):
+        """Test that an archive republished with the same size but new content is imported again."""
+        self._run(streaming=True)
+        corrected = write_kl_archive(self.served_dir, 1, start=date(2020, 1, 1), days=30, missing_rate=0.5)
+        # The manifest size matches the corrected archive, only its content hash differs
+        self.db.conn.execute("UPDATE IngestionManifest SET size = ? WHERE archive_name = ?",
+                             (os.path.getsize(corrected), os.path.basename(corrected)))
+        self.db.conn.commit()
+
+        stats = self._run(streaming=True)
+
+        self.assertEqual((stats['files'], stats['skipped']), (1, 5))
+        self.assertGreater(self.db.conn.execute(
+            "SELECT COUNT(*) FROM Measurement WHERE Station_ID = 1 AND TMK IS NULL").fetchone()[0], 0)
+
+    def test_run_with_extracted_csv(self):
+        """Test the pipeline using the extract-to-CSV parse path."""
+        stats = self._run(streaming=False)
+
+        self.assertEqual(stats['rows'], 180)
+        self.assertEqual(self.db.conn.execute("SELECT COUNT(*) FROM Measurement").fetchone()[0], 180)
+
+    def test_run_process_pool(self):
+        """Test parsing in a process pool with grouped commits; a corrupt archive must not stop the pool."""
+        with open(os.path.join(self.served_dir, "tageswerte_KL_99999_corrupt.zip"), 'wb') as f:
+            f.write(b"not a zip file")
+        write_index(self.served_dir)
+
+        stats = self._run(streaming=True, parse_processes=2, commit_rows=50)
+
+        self.assertEqual(stats['files'], 6)
+        self.assertEqual(stats['rows'], 180)
+        self.assertEqual(stats['failures'], 1)
+        self.assertEqual(len(self.db.get_manifest()), 6)
+        expected = self.db.conn.execute(
+            "SELECT Station_ID, MESS_DATUM, TMK, RSK FROM Measurement ORDER BY Station_ID, MESS_DATUM").fetchall()
+        self.db.conn.execute("DELETE FROM Measurement")
+        self.db.conn.execute("DELETE FROM IngestionManifest")
+        self.db.conn.commit()
+        self._run(streaming=True)
+        self.assertEqual(self.db.conn.execute(
+            "SELECT Station_ID, MESS_DATUM, TMK, RSK FROM Measurement ORDER BY Station_ID, MESS_DATUM").fetchall(),
+            expected)
+
+    def test_run_with_archive_cache(self):
+        """Test that cached archives are kept and revalidated instead of downloaded again."""
+        ConditionalHandler.requests = []
+        with LocalArchiveServer(self.served_dir, handler=ConditionalHandler) as server:
+            for _ in range(2):
+                downloader = Downloader(server.url, self.download_dir, session=Downloader.create_session(),
+                                        cache=ArchiveCache(self.download_dir))
+                pipeline = IngestionPipeline(downloader, DataProcessor(self.download_dir, None, 'latin-1', -999),
+                                             CsvImporter(self.db), dict(SOURCE_CONFIG, streaming=True),
+                                             skip_unchanged=False)
+                stats = pipeline.run(downloader.get_file_urls(SOURCE_CONFIG['zip_pattern']))
+
+        self.assertEqual(stats['rows'], 180)
+        self.assertEqual(len([name for _, _, names in os.walk(self.download_dir)
+                              for name in names if name.endswith('.zip')]), 6)
+        statuses = [status for path, status in ConditionalHandler.requests]
+        self.assertEqual((statuses.count(200), statuses.count(304)), (7, 7))
+
+    def test_recent_refresh_keeps_historical_days(self):
+        """Test that a refresh imports only days after the historical ones and records the state."""
+        self._run(streaming=True)
+        recent_dir = os.path.join(self.test_dir, "recent")
+        os.makedirs(recent_dir)
+        for station_id in (1, 2):
+            write_kl_archive(recent_dir, station_id, start=date(2020, 1, 20), days=41,
+                            name=f"tageswerte_KL_{station_id:05d}_akt.zip")
+        write_index(recent_dir)
+        historical_day = self.db.conn.execute(
+            "SELECT TMK FROM Measurement WHERE Station_ID = 1 AND MESS_DATUM = '2020-01-25'").fetchone()
+
+        def refresh():
+            with LocalArchiveServer(recent_dir) as server:
+                downloader = Downloader(server.url, self.download_dir, session=Downloader.create_session())
+                processor = DataProcessor(self.download_dir, None, 'latin-1', -999)
+                pipeline = IngestionPipeline(downloader, processor, CsvImporter(self.db),
+                                             dict(SOURCE_CONFIG, streaming=False), recent=True)
+                return pipeline.run(downloader.get_file_urls(SOURCE_CONFIG['zip_pattern']))
+
+        stats = refresh()
+        self.assertEqual((stats['files'], stats['rows']), (2, 2 * 30))
+        self.assertEqual(self.db.conn.execute(
+            "SELECT TMK FROM Measurement WHERE Station_ID = 1 AND MESS_DATUM = '2020-01-25'").fetchone(),
+            historical_day)
+        self.assertEqual(self.db.get_station_last_days()[1], '2020-02-29')
+        self.assertEqual(self.db.get_station_last_days()[3], '2020-01-30')
+
+        # Nothing new: the archives are skipped by their content hash
+        self.assertEqual(refresh()['skipped'], 2)
+
+        # A newer archive only adds its new day
+        write_kl_archive(recent_dir, 1, start=date(2020, 1, 21), days=41, name="tageswerte_KL_00001_akt.zip")
+        self.assertEqual(refresh()['rows'], 1)
+
+        # Historical data replaces the recent days it covers
+        self.db.update_station_state({1: ('2020-01-01', '2020-03-31')}, 'historical')
+        self.assertEqual(self.db.conn.execute(
+            "SELECT historical_end, recent_end FROM StationIngestState WHERE Station_ID = 1").fetchone(),
+            ('2020-03-31', None))
+
+    def test_run_counts_failed_downloads(self):
+        """Test that a missing archive is counted as failure without stopping the pipeline."""
+        with LocalArchiveServer(self.served_dir) as server:
+            downloader = Downloader(server.url, self.download_dir, session=Downloader.create_session())
+            processor = DataProcessor(self.download_dir, os.path.join(self.test_dir, "unzipped"), 'latin-1', -999)
+            pipeline = IngestionPipeline(downloader, processor, CsvImporter(self.db),
+                                         dict(SOURCE_CONFIG, streaming=True), download_workers=2, parse_workers=1)
+            urls = downloader.get_file_urls(SOURCE_CONFIG['zip_pattern'])
+            stats = pipeline.run(urls[:2] + [server.url + "tageswerte_KL_missing.zip"])
+
+        self.assertEqual(stats['files'], 2)
+        self.assertEqual(stats['failures'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
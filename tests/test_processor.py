@@ -8,7 +8,7 @@ import sys
 # Add the project root to the Python path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from data_ingestion.processor import DataProcessor
+from data_ingestion.processor import DataProcessor, parse_columns, read_station_list
 
 class TestDataProcessor(unittest.TestCase):
 
@@ -48,6 +48,101 @@ class TestDataProcessor(unittest.TestCase):
         self.assertIn('TMK', df.columns)
         self.assertEqual(df.iloc[0]['TMK'], 5.0)
 
+    def test_process_file_typed_in_chunks(self):
+        """Test the schema-driven parse: NA handled while parsing, eor dropped and ISO dates written."""
+        zip_path = os.path.join(self.download_dir, "test_archive.zip")
+        with zipfile.ZipFile(zip_path, 'w') as zipf:
+            zipf.writestr("produkt_klima_tag_123.txt", "STATIONS_ID;MESS_DATUM; QN_3; TMK;eor\n"
+                                                       "   123;20230101;    1;  0.1;eor\n"
+                                                       "   123;20230102; -999; -999;eor\n"
+                                                       "   123;20230103;    3; -5.7;eor\n")
+        processor = DataProcessor(self.download_dir, self.extract_dir, 'latin-1', -999, typed=True, chunk_size=2)
+
+        csv_file_path = processor.process_file(zip_path, 'produkt_', 'STATIONS_ID', ';')
+
+        with open(csv_file_path) as f:
+            self.assertEqual(f.read().splitlines(), [
+                "STATIONS_ID;MESS_DATUM;QN_3;TMK",
+                "123;2023-01-01;1;0.1",
+                "123;2023-01-02;;",
+                "123;2023-01-03;3;-5.7",
+            ])
+
+    def test_process_file_typed_without_rows(self):
+        """Test that a product file with a header but no data rows gives a header-only CSV."""
+        zip_path = os.path.join(self.download_dir, "test_archive.zip")
+        with zipfile.ZipFile(zip_path, 'w') as zipf:
+            zipf.writestr("produkt_klima_tag_123.txt", "STATIONS_ID;MESS_DATUM; QN_3; TMK;eor\n")
+
+        for chunk_size in (None, 2):
+            processor = DataProcessor(self.download_dir, self.extract_dir, 'latin-1', -999, typed=True,
+                                      chunk_size=chunk_size)
+            csv_file_path = processor.process_file(zip_path, 'produkt_', 'STATIONS_ID', ';')
+
+            self.assertIsNotNone(csv_file_path)
+            df = pd.read_csv(csv_file_path, sep=';')
+            self.assertEqual(list(df.columns), ['STATIONS_ID', 'MESS_DATUM', 'QN_3', 'TMK'])
+            self.assertEqual(len(df), 0)
+
+    def test_parse_columns(self):
+        """Test that the process pool parse returns compact typed arrays."""
+        zip_path = os.path.join(self.download_dir, "test_archive.zip")
+        with zipfile.ZipFile(zip_path, 'w') as zipf:
+            zipf.writestr("produkt_klima_tag_123.txt", "STATIONS_ID;MESS_DATUM; QN_3; QN_4; TMK;eor\n"
+                                                       "   123;20230101;    1;    3;  0.1;eor\n"
+                                                       "   123;20230102;    1; -999; -999;eor\n")
+
+        header, columns = parse_columns(zip_path, 'produkt_', 'STATIONS_ID', ';', 'latin-1', -999)
+
+        self.assertEqual(header, ['STATIONS_ID', 'MESS_DATUM', 'QN_3', 'QN_4', 'TMK'])
+        self.assertEqual([c.dtype.name for c in columns], ['int32', 'int32', 'int8', 'float32', 'float32'])
+        self.assertEqual(columns[1].tolist(), [20230101, 20230102])
+        self.assertTrue(pd.isna(columns[4][1]))
+
+    def test_read_station_list(self):
+        """Test the fixed-width station description, including umlauts and a missing height."""
+        path = os.path.join(self.download_dir, "KL_Tageswerte_Beschreibung_Stationen.txt")
+        with open(path, 'w', encoding='latin-1') as f:
+            f.write(
+                "Stations_id von_datum bis_datum Stationshoehe geoBreite geoLaenge Stationsname Bundesland Abgabe\n"
+                "----------- --------- --------- ------------- --------- --------- "
+                "----------------------------------------- ---------- ------\n"
+                "00001 19370101 19860630            478     47.8413    8.8493 Aach"
+                "                                     Baden-Württemberg                        Frei\n"
+                "00044 19690101 20241231                    52.9336    8.2370 Großenkneten"
+                "                             Niedersachsen                            Frei\n"
+            )
+
+        stations = read_station_list(path)
+
+        self.assertEqual(len(stations), 2)
+        self.assertEqual(list(stations.iloc[0]), [1, '1937-01-01', '1986-06-30', 478, 47.8413, 8.8493,
+                                                  'Aach', 'Baden-Württemberg', 'Frei'])
+        self.assertEqual(stations.loc[1, 'Stationsname'], 'Großenkneten')
+        self.assertTrue(pd.isna(stations.loc[1, 'Stattionhoehe']))
+
+    def test_stream_file(self):
+        """Test that rows are streamed from the archive without extracting anything."""
+        zip_path = os.path.join(self.download_dir, "test_archive.zip")
+        with zipfile.ZipFile(zip_path, 'w') as zipf:
+            zipf.writestr("produkt_klima_tag_123.txt", "header line 1\nSTATIONS_ID;MESS_DATUM; QN_3; TMK;eor\n   123;20230101;    1; 5.0;eor\n   123;20230102;    1;-999;eor\n")
+
+        header, rows = self.processor.stream_file(zip_path, 'produkt_', 'STATIONS_ID', ';')
+        rows = list(rows)
+
+        self.assertEqual(header, ['STATIONS_ID', 'MESS_DATUM', 'QN_3', 'TMK', 'eor'])
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[0][3].strip(), '5.0')
+        self.assertEqual(os.listdir(self.extract_dir), [])
+
+    def test_stream_file_without_product(self):
+        """Test that archives without a product file are skipped."""
+        zip_path = os.path.join(self.download_dir, "test_archive.zip")
+        with zipfile.ZipFile(zip_path, 'w') as zipf:
+            zipf.writestr("Metadaten_klima_123.txt", "dummy metadata")
+
+        self.assertIsNone(self.processor.stream_file(zip_path, 'produkt_', 'STATIONS_ID', ';'))
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
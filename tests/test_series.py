@@ -0,0 +1,88 @@
+import unittest
+import os
+import shutil
+import sys
+
+import numpy as np
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from backend.series import StationSeriesStore
+from data_ingestion.database import Database
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+class TestStationSeriesStore(unittest.TestCase):
+
+    def setUp(self):
+        """Set up two stations, one with a station period wider than its measurements."""
+        self.test_dir = "test_series_dir"
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+        self.db = Database(os.path.join(self.test_dir, "test.db"), -999, 'latin-1')
+        self.db.create_connection()
+        self.db.create_tables(os.path.join(ROOT_DIR, 'Create_table.sql'))
+        self.db.conn.execute("INSERT INTO Station (Station_ID, von_datum, bis_datum) VALUES (5, '2022-12-30', '2023-01-10')")
+        self.db.conn.commit()
+        rows = [['5', '20230101', '1.5', '0.5'], ['5', '20230102', '-999', '0.0'], ['5', '20230105', '5.0', '2.5'],
+                ['7', '20230101', '3.0', '1.0'], ['7', '20230102', '4.0', '1.0']]
+        self.db.insert_records(['STATIONS_ID', 'MESS_DATUM', 'TMK', 'RSK'], rows, 'synthetic')
+        self.store = StationSeriesStore(self.db)
+
+    def tearDown(self):
+        self.store.close()
+        self.db.close_connection()
+        shutil.rmtree(self.test_dir)
+
+    def test_dense_day_index_and_views(self):
+        series = self.store.get(5, ('TMK', 'RSK'))
+
+        self.assertEqual(str(series.first_day), '2022-12-30')
+        self.assertEqual(series.days, 12)
+        np.testing.assert_array_equal(series.values['TMK'][:7], [np.nan, np.nan, 1.5, np.nan, np.nan, np.nan, 5.0])
+        self.assertFalse(series.values['TMK'].flags.writeable)
+
+        dates, values = self.store.load(5, ('TMK',), '2023-01-01', '20230120')
+        self.assertEqual((str(dates[0]), str(dates[-1])), ('2023-01-01', '2023-01-10'))
+        self.assertTrue(np.shares_memory(values['TMK'], series.values['TMK']))
+        self.assertIsNone(self.store.load(99))
+        self.assertEqual(self.store.stats()['hits'], 1)
+
+    def test_lru_eviction_by_bytes(self):
+        self.store.max_bytes = 12 * 4 + 2 * 4  # both stations' TMK, float32
+        self.store.get(5)
+        self.store.get(7)
+        self.store.get(5)
+        self.store.get(7, ('TMK', 'RSK'))
+
+        stats = self.store.stats()
+        self.assertEqual((stats['stations'], stats['evictions'], stats['bytes']), (1, 1, 2 * 2 * 4))
+        self.assertEqual((stats['hits'], stats['misses']), (1, 3))
+
+    def test_import_invalidates_written_stations(self):
+        self.store.get(5)
+        self.store.get(7)
+        self.db.insert_records(['STATIONS_ID', 'MESS_DATUM', 'TMK'], [['7', '20230103', '9.0']], 'update')
+
+        self.assertEqual(self.store.stats()['stations'], 1)
+        dates, values = self.store.load(7)
+        self.assertEqual(values['TMK'].tolist(), [3.0, 4.0, 9.0])
+
+
+    def test_rebuilds_stations_written_by_another_process(self):
+        self.store.get(5)
+        # A second connection stands in for another process, its imports are not announced to the store
+        other = Database(self.db.db_file, -999, 'latin-1')
+        other.create_connection()
+        other.insert_records(['STATIONS_ID', 'MESS_DATUM', 'TMK', 'RSK'], [['5', '20230120', '7.0', '1.0']], 'other')
+        other.close_connection()
+
+        series = self.store.get(5, ('TMK', 'RSK'))
+        self.assertEqual((series.days, series.rows), (22, 4))
+        self.assertEqual((series.values['TMK'][-1], series.values['RSK'][-1]), (7.0, 1.0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+import unittest
+import json
+import os
+import shutil
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+import requests
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from data_ingestion.database import Database
+from web.service import QueryService, ResponseCache
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+class TestQueryService(unittest.TestCase):
+
+    def setUp(self):
+        """Set up a WAL database with two stations and a month of data each."""
+        self.test_dir = "test_service_dir"
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+        self.db = Database(os.path.join(self.test_dir, "test.db"), -999, 'latin-1', wal=True)
+        self.db.create_connection()
+        self.db.create_tables(os.path.join(ROOT_DIR, 'Create_table.sql'))
+        self.db.conn.executemany(
+            "INSERT INTO Station (Station_ID, geoBreite, geoLaenge, Stationsname) VALUES (?, ?, ?, ?)",
+            [(1, 52.52, 13.40, 'Berlin'), (2, 48.13, 11.57, 'Muenchen')]
+        )
+        self.db.conn.commit()
+        rows = [[station_id, f"{date(2020, 1, 1) + timedelta(days=i):%Y%m%d}", str(float(i))]
+                for station_id in ('1', '2') for i in range(31)]
+        self.db.insert_records(['STATIONS_ID', 'MESS_DATUM', 'TMK'], rows, 'test')
+        self.service = QueryService(self.db.db_file, pool_size=4)
+
+    def tearDown(self):
+        self.service.close()
+        self.db.close_connection()
+        shutil.rmtree(self.test_dir)
+
+    def test_statistics_are_cached_until_an_import_commits(self):
+        first = self.service.statistics([2, 1, 1], '2020-01-01', '20200131')
+        self.assertEqual(first[1]['TMK']['mean'], 15.0)
+        self.assertIs(self.service.statistics([1, 2], date(2020, 1, 1), '2020-01-31'), first)
+
+        # Commits of another connection are noticed on the next request
+        self.db.insert_records(['STATIONS_ID', 'MESS_DATUM', 'TMK'], [['1', '20200101', '100.0']], 'update')
+        updated = self.service.statistics([1, 2], '2020-01-01', '2020-01-31')
+        self.assertEqual(updated[1]['TMK']['max'], 100.0)
+
+        # An in-process writer clears the cache right away
+        self.db.add_import_listener(self.service.invalidate)
+        self.db.insert_records(['STATIONS_ID', 'MESS_DATUM', 'TMK'], [['1', '20200101', '5.0']], 'update')
+        self.assertEqual(len(self.service.cache), 0)
+
+    def test_reads_continue_during_an_import(self):
+        """Test that queries are answered while a write transaction is open."""
+        with self.db.bulk_load():
+            self.db.conn.execute("BEGIN")
+            self.db.conn.execute("UPDATE Measurement SET TMK = 0")
+            rows = self.service.measurements([1], '2020-01-02', '2020-01-02')
+            self.db.conn.rollback()
+        self.assertEqual(rows, [(1, '2020-01-02', 1.0)])
+        self.assertEqual(self.db.conn.execute("PRAGMA journal_mode").fetchone()[0], 'wal')
+
+    def test_http_endpoints(self):
+        server = self.service.serve(port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_address[1]}"
+        try:
+            def fetch(i):
+                return requests.get(f"{url}/statistics", params={
+                    'stations': '1,2', 'start': '2020-01-01', 'end': f"2020-01-{1 + i % 31:02d}", 'columns': 'TMK,RSK'})
+
+            with ThreadPoolExecutor(16) as executor:
+                responses = list(executor.map(fetch, range(64)))
+            self.assertTrue(all(response.status_code == 200 for response in responses))
+            self.assertEqual(json.loads(responses[30].text)['1']['days'], 31)
+
+            nearest = requests.get(f"{url}/nearest", params={'lat': 52.5, 'lon': 13.4, 'k': 1}).json()
+            self.assertEqual(nearest[0][:2], [1, 'Berlin'])
+            self.assertEqual(requests.get(f"{url}/statistics", params={'stations': '1'}).status_code, 400)
+            self.assertEqual(requests.get(f"{url}/unknown").status_code, 404)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+class TestResponseCache(unittest.TestCase):
+
+    def test_lru_eviction_and_stale_puts(self):
+        cache = ResponseCache(max_entries=2)
+        cache.put('a', 1, cache.generation)
+        cache.put('b', 2, cache.generation)
+        cache.get('a')
+        cache.put('c', 3, cache.generation)
+        self.assertEqual((cache.get('a'), cache.get('c')), (1, 3))
+        self.assertNotEqual(cache.get('b'), 2)
+
+        generation = cache.generation
+        cache.clear()
+        cache.put('d', 4, generation)
+        self.assertEqual(len(cache), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
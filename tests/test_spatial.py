@@ -0,0 +1,46 @@
+import unittest
+import os
+import random
+import sys
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from geopy.distance import geodesic
+from backend.spatial import StationIndex
+
+
+class TestStationIndex(unittest.TestCase):
+
+    def setUp(self):
+        """Scatter synthetic stations over Germany."""
+        rng = random.Random(42)
+        self.stations = [(i, rng.uniform(47.3, 55.0), rng.uniform(5.9, 15.0), f"Station {i}") for i in range(500)]
+        self.stations.append((999, None, None, 'No coordinates'))
+        self.index = StationIndex(self.stations, cell_size_deg=0.5)
+
+    def _brute_force(self, lat, lon):
+        distances = [(s[0], geodesic((lat, lon), (s[1], s[2])).kilometers) for s in self.stations if s[1] is not None]
+        return sorted(distances, key=lambda x: x[1])
+
+    def test_nearest_matches_brute_force(self):
+        """Test that k-nearest queries return the same stations as a full geodesic scan."""
+        for lat, lon in [(52.52, 13.40), (48.13, 11.57), (54.9, 8.3), (45.0, 3.0)]:
+            expected = [s[0] for s in self._brute_force(lat, lon)[:7]]
+            self.assertEqual([s[0] for s in self.index.nearest(lat, lon, k=7)], expected)
+
+    def test_within_matches_brute_force(self):
+        """Test that radius queries return exactly the stations inside the radius."""
+        expected = [s[0] for s in self._brute_force(50.0, 10.0) if s[1] <= 80]
+        result = self.index.within(50.0, 10.0, 80)
+        self.assertEqual([s[0] for s in result], expected)
+        self.assertTrue(all(s[2] <= 80 for s in result))
+
+    def test_skips_stations_without_coordinates(self):
+        """Test that stations without coordinates are not indexed."""
+        self.assertEqual(len(self.index), 500)
+        self.assertEqual(StationIndex([]).nearest(52.0, 13.0), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
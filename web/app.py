@@ -2,48 +2,160 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+import logging
+from contextlib import nullcontext
 import yaml
 from data_ingestion.downloader import Downloader
-from data_ingestion.processor import DataProcessor
+from data_ingestion.archive_cache import ArchiveCache
+from data_ingestion.processor import DataProcessor, read_station_list
 from data_ingestion.database import Database
 from data_ingestion.importer import CsvImporter
+from data_ingestion.pipeline import IngestionPipeline
+from data_ingestion.exporter import ColumnarExporter
+from data_ingestion.metrics import METRICS, profile_run
+
+logger = logging.getLogger(__name__)
+
+
+def create_archive_cache(source_config):
+    """Returns the ArchiveCache configured by source.archive_cache, or None."""
+    if not source_config.get('archive_cache', False):
+        return None
+    max_mb = source_config.get('archive_cache_max_mb')
+    return ArchiveCache(source_config['download_dir'], max_bytes=max_mb * 1024 * 1024 if max_mb else None)
+
+
+def import_station_list(downloader, importer, source_config):
+    """
+    Downloads the station description (source.station_file) next to the
+    archives and upserts all stations.
+
+    :return: The number of imported stations.
+    """
+    path = downloader.download_file(downloader.url + source_config['station_file'])
+    if path is None:
+        return 0
+    try:
+        stations = read_station_list(path, encoding=source_config.get('file_encoding', 'latin-1'))
+    except (OSError, ValueError):
+        logger.exception("Could not parse the station description %s", path)
+        return 0
+    finally:
+        if downloader.cache is not None:
+            downloader.cache.release(path)
+        elif os.path.exists(path):
+            # Without a cache an existing file would never be downloaded again
+            os.remove(path)
+    return importer.import_stations(stations, source_config['station_file'])
+
+
+def run_station_refresh(config):
+    """
+    Imports only the station description of the configured source.
+
+    :param config: The loaded configuration (see config.yaml).
+    :return: The number of imported stations.
+    """
+    source_config = config['source']
+    db_config = config['database']
+    db = Database(db_config['path'], source_config['na_value'], source_config['file_encoding'],
+                  wal=db_config.get('wal', False))
+    db.create_connection()
+    db.create_tables(db_config['sql_file_path'])
+    downloader = Downloader(url=source_config['url'], download_dir=source_config['download_dir'],
+                            cache=create_archive_cache(source_config))
+    try:
+        return import_station_list(downloader, CsvImporter(db), source_config)
+    finally:
+        db.close_connection()
 
-if __name__ == '__main__':
-    # Load configuration from YAML file
-    with open('config.yaml', 'r') as file:
-        config = yaml.safe_load(file)
 
+def run_ingestion(config, skip_unchanged=None, recent=False):
+    """
+    Downloads, processes and imports all archives of the configured source.
+
+    :param config: The loaded configuration (see config.yaml).
+    :param skip_unchanged: Overrides pipeline.skip_unchanged if not None.
+    :param recent: Import the days added since the last run from the archives at
+                   source.recent_url instead of the historical archives.
+    :return: The statistics of IngestionPipeline.run.
+    """
     source_config = config['source']
     db_config = config['database']
+    pipeline_config = config.get('pipeline', {})
+    export_config = config.get('export', {})
+    metrics_config = config.get('metrics', {})
 
     # 0. Create the database and tables
-    db = Database(db_config['path'], source_config['na_value'], source_config['file_encoding'])
+    db = Database(db_config['path'], source_config['na_value'], source_config['file_encoding'],
+                  batch_size=db_config.get('batch_size', 50000),
+                  import_mode=db_config.get('import_mode', 'upsert'),
+                  maintain_rollups=db_config.get('maintain_rollups', True),
+                  wal=db_config.get('wal', False))
     db.create_connection()
     db.create_tables(db_config['sql_file_path'])
+    db.migrate_measurement_layout(db_config['sql_file_path'])
+    if db.maintain_rollups:
+        db.ensure_rollups()
+    db.ensure_station_state()
 
     # 1. Instantiate the classes
-    downloader = Downloader(url=source_config['url'], download_dir=source_config['download_dir'])
-    processor = DataProcessor(source_config['download_dir'], source_config['extract_dir'], source_config['file_encoding'], source_config['na_value'])
+    download_workers = pipeline_config.get('download_workers', 4)
+    session = Downloader.create_session(pool_size=download_workers)
+    url = source_config['recent_url'] if recent else source_config['url']
+    downloader = Downloader(url=url, download_dir=source_config['download_dir'], session=session,
+                            cache=create_archive_cache(source_config))
+    processor = DataProcessor(source_config['download_dir'], source_config['extract_dir'], source_config['file_encoding'], source_config['na_value'],
+                              typed=source_config.get('typed_parse', True), chunk_size=source_config.get('chunk_size'))
     importer = CsvImporter(db)
 
-    # 2. Get all file URLs
+    # 2. Update the station metadata, so station lookups know every station
+    if source_config.get('station_file'):
+        import_station_list(downloader, importer, source_config)
+
+    # 3. Get all file URLs
     file_urls = downloader.get_file_urls(pattern=source_config['zip_pattern'])
 
-    # 3. Process each file one by one
-    for url in file_urls:
-        zip_file_path = downloader.download_file(url)
-        if zip_file_path:
-            csv_file_path = processor.process_file(
-                zip_file_path,
-                source_config['product_pattern_to_extract'],
-                source_config['header_keyword'],
-                source_config['delimiter']
-            )
-            if csv_file_path:
-                importer.import_file(csv_file_path, source_config['delimiter'])
-                os.remove(csv_file_path)
-            os.remove(zip_file_path)
+    # 4. Download, process and import the files concurrently
+    pipeline = IngestionPipeline(
+        downloader, processor, importer, source_config,
+        download_workers=download_workers,
+        parse_workers=pipeline_config.get('parse_workers', 2),
+        max_pending=pipeline_config.get('max_pending_files', 8),
+        skip_unchanged=pipeline_config.get('skip_unchanged', True) if skip_unchanged is None else skip_unchanged,
+        parse_processes=pipeline_config.get('parse_processes', 0),
+        commit_rows=pipeline_config.get('commit_rows', 500000),
+        stream_batch_rows=pipeline_config.get('stream_batch_rows', 50000),
+        recent=recent
+    )
+    touched_stations = set()
+    db.add_import_listener(touched_stations.update)
+    profiling = profile_run(metrics_config.get('profile_path')) if metrics_config.get('profile') else nullcontext()
+    with profiling:
+        stats = pipeline.run(file_urls)
+
+    # 5. Export the imported stations for columnar analytics
+    if export_config.get('enabled', False):
+        exporter = ColumnarExporter(db, export_config['dir'], export_config.get('format', 'auto'))
+        exporter.export_stations(touched_stations)
+
+    # 6. Dump the metrics of this run
+    if metrics_config.get('json_path'):
+        with open(metrics_config['json_path'], 'w') as f:
+            f.write(METRICS.to_json())
+    if metrics_config.get('prometheus_path'):
+        with open(metrics_config['prometheus_path'], 'w') as f:
+            f.write(METRICS.to_prometheus())
 
     db.close_connection()
+    return stats
+
 
+if __name__ == '__main__':
+    # Load configuration from YAML file
+    with open('config.yaml', 'r') as file:
+        config = yaml.safe_load(file)
 
+    logging.basicConfig(level=config.get('metrics', {}).get('log_level', 'INFO'),
+                        format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    run_ingestion(config)
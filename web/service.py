@@ -0,0 +1,275 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import json
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+import yaml
+from data_ingestion.database import Database, to_iso_date
+from data_ingestion.metrics import METRICS
+from backend.analysis import Analysis
+
+logger = logging.getLogger(__name__)
+
+# Returned by ResponseCache.get for keys that are not cached
+_MISS = object()
+
+
+class ResponseCache:
+    """
+    Thread-safe LRU cache with a time to live for query results.
+
+    Every clear() starts a new generation. A result computed while the
+    cache was cleared is not stored, so a query racing with an import
+    cannot put stale data back into the cache.
+    """
+    def __init__(self, max_entries=1024, ttl_seconds=300):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.generation = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Returns the cached value of key or _MISS."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return _MISS
+            value, stored_at = entry
+            if time.monotonic() - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                return _MISS
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value, generation):
+        """Stores value unless the cache was cleared since `generation` was read."""
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.generation += 1
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class ReadPool:
+    """
+    A fixed pool of read-only connections, each wrapped in its own Database
+    and Analysis. A request checks one out, so every connection is used by
+    a single thread at a time and the station index of each Analysis is
+    reused across requests.
+    """
+    def __init__(self, db_file, size=8, maintain_rollups=True):
+        """
+        :param maintain_rollups: Whether the importer keeps the rollups up to date
+                                 (database.maintain_rollups); otherwise queries do not read them.
+        """
+        self.size = size
+        self._idle = queue.Queue()
+        self._all = []
+        for _ in range(size):
+            db = Database(db_file, None, None, maintain_rollups=maintain_rollups)
+            db.create_connection(read_only=True)
+            if db.conn is None:
+                raise RuntimeError(f"Could not open {db_file} read-only.")
+            analysis = Analysis(db)
+            self._all.append(analysis)
+            self._idle.put(analysis)
+
+    @contextmanager
+    def acquire(self):
+        """Yields an idle Analysis, blocking while all connections are busy."""
+        analysis = self._idle.get()
+        try:
+            yield analysis
+        finally:
+            self._idle.put(analysis)
+
+    def close(self):
+        for analysis in self._all:
+            analysis.db.close_connection()
+
+
+class QueryService:
+    """
+    Serves read-only queries to many concurrent clients.
+
+    Queries run on a ReadPool, so they do not queue behind one connection,
+    and with the database in WAL mode (database.wal) they keep going while
+    an import writes. Results are cached by (query, stations, date range,
+    columns). The cache is cleared whenever an import commits: commits of
+    other connections and processes are detected through PRAGMA
+    data_version, and an in-process writer can also call invalidate
+    directly, e.g. as import listener (Database.add_import_listener).
+    """
+    def __init__(self, db_file, pool_size=8, cache_entries=1024, cache_ttl_seconds=300, maintain_rollups=True):
+        self.pool = ReadPool(db_file, pool_size, maintain_rollups)
+        self.cache = ResponseCache(cache_entries, cache_ttl_seconds)
+        self._monitor = Database(db_file, None, None)
+        self._monitor.create_connection(read_only=True)
+        self._monitor_lock = threading.Lock()
+        self._data_version = self._read_data_version()
+
+    def close(self):
+        self.pool.close()
+        self._monitor.close_connection()
+
+    def invalidate(self, touched=None):
+        """Drops all cached results. Accepts and ignores the import listener argument."""
+        self.cache.clear()
+        METRICS.inc("service_cache_invalidations_total")
+
+    def nearest(self, lat, lon, k=5):
+        """Returns the k nearest stations as a list of (station_id, name, distance_km)."""
+        key = ('nearest', round(lat, 6), round(lon, 6), k)
+        return self._cached(key, lambda analysis: analysis.station_index().nearest(lat, lon, k=k))
+
+    def statistics(self, station_ids, start, end, columns=('TMK',)):
+        """Returns Analysis.get_period_statistics for the stations and date range."""
+        station_ids, start, end, columns = self._normalize(station_ids, start, end, columns)
+        key = ('statistics', station_ids, start, end, columns)
+        return self._cached(key, lambda analysis: analysis.get_period_statistics(station_ids, start, end, columns))
+
+    def measurements(self, station_ids, start, end, columns=('TMK',)):
+        """Returns Database.get_measurements for the stations and date range."""
+        station_ids, start, end, columns = self._normalize(station_ids, start, end, columns)
+        key = ('measurements', station_ids, start, end, columns)
+        return self._cached(key, lambda analysis: analysis.db.get_measurements(station_ids, start, end, columns))
+
+    @staticmethod
+    def _normalize(station_ids, start, end, columns):
+        """Brings the key parts into a canonical form, so equivalent requests share a cache entry."""
+        return (tuple(sorted({int(station_id) for station_id in station_ids})),
+                to_iso_date(start), to_iso_date(end), tuple(columns))
+
+    def _cached(self, key, query):
+        self._check_data_version()
+        result = self.cache.get(key)
+        if result is not _MISS:
+            METRICS.inc("service_cache_total", result="hit")
+            return result
+        METRICS.inc("service_cache_total", result="miss")
+        generation = self.cache.generation
+        with METRICS.timer("service_query_seconds", query=key[0]):
+            with self.pool.acquire() as analysis:
+                result = query(analysis)
+        self.cache.put(key, result, generation)
+        return result
+
+    def _read_data_version(self):
+        return self._monitor.conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def _check_data_version(self):
+        """Clears the cache if another connection committed since the last check."""
+        with self._monitor_lock:
+            version = self._read_data_version()
+            if version == self._data_version:
+                return
+            self._data_version = version
+        self.invalidate()
+
+    def serve(self, host='127.0.0.1', port=8080):
+        """
+        Creates a threaded HTTP server for the service. Call serve_forever()
+        on the result; port 0 picks a free port (see server_address).
+
+        Endpoints, all answering JSON:
+        /nearest?lat=&lon=&k=
+        /statistics?stations=1,2&start=&end=&columns=TMK,RSK
+        /measurements?stations=1,2&start=&end=&columns=TMK,RSK
+        /metrics returns the metrics in the Prometheus text format.
+        """
+        handler = type('BoundQueryHandler', (QueryHandler,), {'service': self})
+        server = ThreadingHTTPServer((host, port), handler)
+        server.daemon_threads = True
+        return server
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    """Maps HTTP GET requests to QueryService calls."""
+    service: QueryService = None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        try:
+            if url.path == '/metrics':
+                self._send(200, METRICS.to_prometheus().encode(), 'text/plain; version=0.0.4')
+                return
+            if url.path == '/nearest':
+                result = self.service.nearest(float(params['lat']), float(params['lon']), int(params.get('k', 5)))
+            elif url.path in ('/statistics', '/measurements'):
+                stations = [int(station_id) for station_id in params['stations'].split(',')]
+                columns = params.get('columns', 'TMK').split(',')
+                if url.path == '/statistics':
+                    result = self.service.statistics(stations, params['start'], params['end'], columns)
+                else:
+                    result = self.service.measurements(stations, params['start'], params['end'], columns)
+            else:
+                self._send_json(404, {'error': f"Unknown path {url.path}"})
+                return
+        except KeyError as e:
+            self._send_json(400, {'error': f"Missing parameter {e}"})
+            return
+        except ValueError as e:
+            self._send_json(400, {'error': str(e)})
+            return
+        except Exception:
+            logger.exception("Error while answering %s", self.path)
+            self._send_json(500, {'error': "Internal error"})
+            return
+        self._send_json(200, result)
+
+    def _send_json(self, status, payload):
+        self._send(status, json.dumps(payload).encode(), 'application/json')
+
+    def _send(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+
+if __name__ == '__main__':
+    with open('config.yaml', 'r') as file:
+        config = yaml.safe_load(file)
+
+    service_config = config.get('service', {})
+    logging.basicConfig(level=config.get('metrics', {}).get('log_level', 'INFO'),
+                        format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    service = QueryService(config['database']['path'],
+                           pool_size=service_config.get('pool_size', 8),
+                           cache_entries=service_config.get('cache_entries', 1024),
+                           cache_ttl_seconds=service_config.get('cache_ttl_seconds', 300),
+                           maintain_rollups=config['database'].get('maintain_rollups', True))
+    server = service.serve(service_config.get('host', '127.0.0.1'), service_config.get('port', 8080))
+    logger.info("Serving queries on http://%s:%d/", *server.server_address)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()